@@ -0,0 +1,150 @@
+import random
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+from typing import Dict, List
+
+from sqlalchemy import insert, text
+
+from models import (
+    db, get_schema, Teacher, Class, ClassTeacher, Student, Criteria, Score, LessonInfo,
+)
+from attendance_rollup import rebuild_rollup
+from attendance_streaks import rebuild_streaks
+from score_storage import copy_rows_to_compact, is_compact
+from school_calendar import invalidate_calendar
+from caching import reference_cache, lesson_sheet_cache
+
+
+# The criteria of migrations/000_initial_schema.sql
+CRITERIA = [
+    (1, "attendance", "الحضور"),
+    (2, "time", "الالتزام بالوقت"),
+    (3, "uniform", "اللباس الموحد"),
+    (4, "participate", "المشاركة"),
+]
+
+# Lessons run from September to June; July and August are the summer break
+LESSON_MONTHS = {9, 10, 11, 12, 1, 2, 3, 4, 5, 6}
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    """
+    The shape of a synthetic school. The same spec and seed always give the same rows.
+    """
+    name: str
+    classes: int
+    students_per_class: int
+    years: int
+    first_school_year: int = 2022
+    seed: int = 1
+
+    def describe(self) -> Dict:
+        return asdict(self)
+
+
+SIZES = {
+    "small": DatasetSpec("small", classes=3, students_per_class=10, years=1),
+    "medium": DatasetSpec("medium", classes=10, students_per_class=20, years=2),
+    "large": DatasetSpec("large", classes=25, students_per_class=30, years=4),
+}
+
+
+def lesson_dates(spec: DatasetSpec) -> List[date]:
+    """
+    Every Friday of the spec's school years, outside the summer break.
+    """
+    day = date(spec.first_school_year, 9, 1)
+    day += timedelta(days=(4 - day.weekday()) % 7)
+    last_day = date(spec.first_school_year + spec.years, 8, 31)
+    dates = []
+    while day <= last_day:
+        if day.month in LESSON_MONTHS:
+            dates.append(day)
+        day += timedelta(days=7)
+    return dates
+
+
+def _insert_chunks(table, rows: List[Dict], chunk_size: int = 20000):
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(insert(table), rows[start:start + chunk_size])
+
+
+def generate_school(spec: DatasetSpec):
+    """
+    Replace the configured schema's tables with a synthetic school: one teacher per class,
+    students with their own attendance habits, a lesson every week and a score for every
+    criterion, plus the rollup and streak tables derived from them. Commits.
+    """
+    rng = random.Random(spec.seed)
+    schema = get_schema()
+    db.session.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+    db.session.execute(text(f'CREATE SCHEMA "{schema}"'))
+    db.session.commit()
+    db.create_all()
+
+    _insert_chunks(Criteria.__table__, [{"id": i, "name": name, "label": label} for i, name, label in CRITERIA])
+    _insert_chunks(Teacher.__table__, [
+        {"id": 1, "name": "Admin", "username": "admin", "password": "YWRtaW4=", "is_admin": True},
+        *[
+            {"id": class_id + 1, "name": f"Teacher {class_id}", "username": f"teacher{class_id}", "password": "cGFzc3dvcmQ=", "is_admin": False}
+            for class_id in range(1, spec.classes + 1)
+        ],
+    ])
+    _insert_chunks(Class.__table__, [{"id": class_id, "name": f"Class {class_id}"} for class_id in range(1, spec.classes + 1)])
+    _insert_chunks(ClassTeacher.__table__, [
+        {"id": class_id, "class_id": class_id, "teacher_id": class_id + 1} for class_id in range(1, spec.classes + 1)
+    ])
+
+    dates = lesson_dates(spec)
+    students, scores, lessons = [], [], []
+    student_id = 0
+    for class_id in range(1, spec.classes + 1):
+        for _ in range(spec.students_per_class):
+            student_id += 1
+            students.append({
+                "id": student_id, "name": f"Student {student_id}", "class_id": class_id,
+                "date_joined": dates[0], "active": True,
+            })
+            # Each student has a steady likelihood per criterion, so reports are not uniform noise
+            rates = [rng.uniform(0.55, 0.98) for _ in CRITERIA]
+            for lesson_date in dates:
+                for (criteria_id, _, _), rate in zip(CRITERIA, rates):
+                    scores.append({
+                        "student_id": student_id, "lesson_date": lesson_date, "criteria_id": criteria_id,
+                        "value": rng.random() < rate, "notes": "late bus" if criteria_id == 1 and rng.random() < 0.02 else None,
+                    })
+        lessons.extend(
+            {"class_id": class_id, "lesson_date": lesson_date, "lesson_subject": f"Lesson {i + 1}", "lesson_activity": ""}
+            for i, lesson_date in enumerate(dates)
+        )
+    _insert_chunks(Student.__table__, students)
+    _insert_chunks(LessonInfo.__table__, lessons)
+    _insert_chunks(Score.__table__, scores)
+
+    for table in ("teachers", "classes", "class_teachers", "students", "criteria", "lesson_info", "scores"):
+        db.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{schema}\".{table}', 'id'), (SELECT MAX(id) FROM \"{schema}\".{table}))"
+        ))
+    if is_compact():
+        copy_rows_to_compact(db.session)
+    rebuild_rollup(db.session)
+    rebuild_streaks(db.session, CRITERIA[0][0])
+    db.session.execute(text(f"COMMENT ON SCHEMA \"{schema}\" IS :spec"), {"spec": repr(spec)})
+    db.session.commit()
+    db.session.execute(text("ANALYZE"))
+    db.session.commit()
+    reference_cache.invalidate()
+    lesson_sheet_cache.invalidate()
+    invalidate_calendar()
+    return {"students": len(students), "lessons": len(lessons), "scores": len(scores)}
+
+
+def current_spec() -> str:
+    """
+    The repr of the spec the schema was last generated from ('' when none).
+    """
+    return db.session.execute(
+        text("SELECT obj_description(oid, 'pg_namespace') FROM pg_namespace WHERE nspname = :schema"),
+        {"schema": get_schema()},
+    ).scalar() or ""
@@ -0,0 +1,344 @@
+"""
+Load test: virtual teachers drive the app through its real routes.
+
+    # seed a synthetic school, start gunicorn with gunicorn.conf.py and ramp up
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/loadtest.py --seed medium --start-server \\
+        --profile lesson_start --concurrency 5,10,20,40 --duration 30
+
+    # against a server that is already running on the same data
+    python benchmarks/loadtest.py --url http://localhost:5000 --size medium --profile month_end
+
+Every virtual teacher logs in as one of the generated teachers (teacher<N>/password) and
+then repeats weighted actions of the chosen profile, with a random think time between them:
+
+  lesson_start  opening the attendance page, stepping between lessons, saving edits
+  month_end     class performance pages, the performance API and monthly reports
+
+Each concurrency step reports throughput, p50/p95/p99 latency and error rate per route.
+The last line estimates the largest tested concurrency whose p95 stays under --slo-ms with
+under 1% errors, i.e. how many teachers one server instance carries.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Callable, Dict, List, Tuple
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.join(BENCHMARKS_DIR, "..")
+
+
+class VirtualTeacher:
+    """
+    A browser session of one teacher: a cookie jar and the class they teach.
+    """
+
+    def __init__(self, base_url: str, class_id: int, school: Dict, recorder, rng: random.Random):
+        self.base_url = base_url
+        # The generator gives teacher<N> class N
+        self.username = f"teacher{class_id}"
+        self.class_id = class_id
+        self.student_ids = school["students_by_class"][class_id]
+        self.lesson_dates = school["lesson_dates"]
+        self.criteria = school["criteria"]
+        self.recorder = recorder
+        self.rng = rng
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect())
+
+    def request(self, route: str, method: str, path: str, data=None, json_body=None):
+        """
+        Send one request, recording its latency and outcome under `route`.
+        """
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers["Content-Type"] = "application/json"
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        request = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                status = response.status
+                # login_required answers a lost session with a redirect; that is a failed request
+                if status in (301, 302) and urllib.parse.urlsplit(response.headers.get("Location", "")).path == "/login":
+                    status = 401
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except (urllib.error.URLError, OSError):
+            status = 0
+        self.recorder.record(f"{method} {route}", time.perf_counter() - started, status)
+        return status
+
+    def lesson_date(self, recent: int = 6) -> str:
+        return self.rng.choice(self.lesson_dates[-recent:]).isoformat()
+
+    # --- actions -------------------------------------------------------------------
+
+    def login(self):
+        self.request("/login", "POST", "/login", data={"username": self.username, "password": "password"})
+
+    def select_class(self):
+        self.request("/select_class", "GET", "/select_class")
+
+    def open_attendance(self):
+        self.request("/attendance/<class_id>", "GET", f"/attendance/{self.class_id}")
+
+    def navigate_lessons(self):
+        # Step through a few neighbouring lessons as the page's previous/next buttons do
+        index = self.rng.randrange(max(1, len(self.lesson_dates) - 6), len(self.lesson_dates))
+        for step in range(self.rng.randint(1, 3)):
+            lesson_date = self.lesson_dates[max(0, index - step)].isoformat()
+            self.request("/attendance_data/<class_id>/<date>", "GET", f"/attendance_data/{self.class_id}/{lesson_date}")
+
+    def list_lessons(self):
+        self.request("/lessons_list/<class_id>", "GET", f"/lessons_list/{self.class_id}")
+
+    def save_changes(self):
+        changes = [
+            {"student_id": student_id, "criterion": self.rng.choice(self.criteria), "value": self.rng.random() < 0.8}
+            for student_id in self.rng.sample(self.student_ids, min(3, len(self.student_ids)))
+        ]
+        self.request("/lessons/<class_id>/<date>/scores", "PATCH", f"/lessons/{self.class_id}/{self.lesson_date(2)}/scores", json_body={"changes": changes})
+
+    def save_sheet(self):
+        form = {"lesson_date": self.lesson_date(2), "notes": "{}", "lesson_subject": "Load test", "lesson_activity": ""}
+        for student_id in self.student_ids:
+            for criterion in self.criteria:
+                if self.rng.random() < 0.8:
+                    form[f"{criterion}_{student_id}"] = "on"
+        self.request("/attendance/<class_id>", "POST", f"/attendance/{self.class_id}", data=form)
+
+    def class_performance_page(self):
+        self.request("/class_performance/<class_id>", "GET", f"/class_performance/{self.class_id}?start={self.lesson_dates[-20].isoformat()}&end={self.lesson_dates[-1].isoformat()}")
+
+    def class_performance_api(self):
+        self.request("/api/performance/class/<class_id>", "GET", f"/api/performance/class/{self.class_id}")
+
+    def class_students_api(self):
+        self.request("/api/performance/class/<class_id>/students", "GET", f"/api/performance/class/{self.class_id}/students")
+
+    def student_api(self):
+        self.request("/api/performance/student", "GET", f"/api/performance/student?student_id={self.rng.choice(self.student_ids)}&class_id={self.class_id}")
+
+    def school_api(self):
+        self.request("/api/performance/school", "GET", "/api/performance/school")
+
+    def alerts_api(self):
+        self.request("/api/performance/alerts", "GET", "/api/performance/alerts")
+
+    def monthly_report(self):
+        month = self.lesson_dates[-1]
+        self.request("/monthly_report/<class_id>/<student_id>", "POST", f"/monthly_report/{self.class_id}/{self.rng.choice(self.student_ids)}", data={"month": month.month, "year": month.year})
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A redirect is the answer we time (e.g. after login); following it would be another request
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+    def http_error_302(self, req, fp, code, msg, headers):
+        return fp
+
+
+PROFILES: Dict[str, List[Tuple[Callable[[VirtualTeacher], None], int]]] = {
+    "lesson_start": [
+        (VirtualTeacher.select_class, 1),
+        (VirtualTeacher.open_attendance, 2),
+        (VirtualTeacher.navigate_lessons, 6),
+        (VirtualTeacher.save_changes, 4),
+        (VirtualTeacher.save_sheet, 1),
+        (VirtualTeacher.list_lessons, 1),
+    ],
+    "month_end": [
+        (VirtualTeacher.class_performance_page, 3),
+        (VirtualTeacher.class_performance_api, 2),
+        (VirtualTeacher.class_students_api, 2),
+        (VirtualTeacher.student_api, 2),
+        (VirtualTeacher.school_api, 1),
+        (VirtualTeacher.alerts_api, 1),
+        (VirtualTeacher.monthly_report, 3),
+        (VirtualTeacher.navigate_lessons, 1),
+    ],
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples: Dict[str, List[Tuple[float, int]]] = {}
+
+    def record(self, route: str, seconds: float, status: int):
+        with self.lock:
+            self.samples.setdefault(route, []).append((seconds, status))
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def summarize(samples: List[Tuple[float, int]], seconds: float) -> Dict:
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, status in samples if status == 0 or status >= 400)
+    return {
+        "requests": len(samples),
+        "rps": round(len(samples) / seconds, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+    }
+
+
+def run_step(base_url: str, profile: str, concurrency: int, duration: float, think_ms: float, school: Dict, seed: int) -> Dict:
+    """
+    Run `concurrency` virtual teachers for `duration` seconds and summarize their requests.
+    """
+    recorder = Recorder()
+    actions, weights = zip(*PROFILES[profile])
+    stop_at = time.monotonic() + duration
+
+    def teacher_loop(number: int):
+        rng = random.Random(seed * 1000 + number)
+        class_id = (number % school["classes"]) + 1
+        teacher = VirtualTeacher(base_url, class_id, school, recorder, rng)
+        teacher.login()
+        while time.monotonic() < stop_at:
+            rng.choices(actions, weights)[0](teacher)
+            if think_ms:
+                time.sleep(rng.uniform(0.5, 1.5) * think_ms / 1000)
+
+    threads = [threading.Thread(target=teacher_loop, args=(number,), daemon=True) for number in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    all_samples = [sample for samples in recorder.samples.values() for sample in samples]
+    return {
+        "profile": profile,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 1),
+        "total": summarize(all_samples, elapsed),
+        "routes": {route: summarize(samples, elapsed) for route, samples in sorted(recorder.samples.items())},
+    }
+
+
+def print_step(step: Dict):
+    print(f"\n== {step['profile']}, {step['concurrency']} teachers, {step['seconds']}s ==")
+    print(f"{'route':58} {'reqs':>6} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+    for route, row in list(step["routes"].items()) + [("TOTAL", step["total"])]:
+        print(f"{route:58} {row['requests']:>6} {row['rps']:>7} {row['p50_ms']:>8} {row['p95_ms']:>8} {row['p99_ms']:>8} {row['error_rate'] * 100:>6.2f}%")
+
+
+def school_layout(size: str) -> Dict:
+    """
+    Classes, students and lesson dates of a generated school, as the generator lays them out.
+    """
+    sys.path[:0] = [os.path.join(ROOT_DIR, "src"), BENCHMARKS_DIR]
+    from generate import CRITERIA, SIZES, lesson_dates
+    spec = SIZES[size]
+    return {
+        "classes": spec.classes,
+        "criteria": [name for _, name, _ in CRITERIA],
+        "students_by_class": {
+            class_id: list(range((class_id - 1) * spec.students_per_class + 1, class_id * spec.students_per_class + 1))
+            for class_id in range(1, spec.classes + 1)
+        },
+        "lesson_dates": lesson_dates(spec),
+    }
+
+
+def bench_environment() -> Dict[str, str]:
+    if "BENCH_DATABASE_URL" not in os.environ:
+        sys.exit("Set BENCH_DATABASE_URL to the PostgreSQL database to load test against.")
+    return {**os.environ, "DATABASE_URL": os.environ["BENCH_DATABASE_URL"], "DB_SCHEMA": os.getenv("BENCH_SCHEMA", "benchmark")}
+
+
+def seed(size: str):
+    # In a child process: the models bind DB_SCHEMA when they are imported
+    code = (
+        "import sys; sys.path[:0] = [sys.argv[1], sys.argv[2]]\n"
+        "from app import app\nfrom generate import SIZES, generate_school\n"
+        "with app.app_context(): print(generate_school(SIZES[sys.argv[3]]))"
+    )
+    subprocess.run([sys.executable, "-c", code, os.path.join(ROOT_DIR, "src"), BENCHMARKS_DIR, size], env=bench_environment(), check=True)
+
+
+def start_server(port: int) -> subprocess.Popen:
+    """
+    gunicorn with the production config (gunicorn.conf.py), on the benchmark schema.
+    """
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT_DIR, "gunicorn.conf.py"), "--bind", f"127.0.0.1:{port}", "app:app"],
+        cwd=os.path.join(ROOT_DIR, "src"), env=bench_environment(),
+    )
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/login", timeout=1).read()
+            return server
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    server.terminate()
+    sys.exit("gunicorn did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="server to test (default: the one started by --start-server)")
+    parser.add_argument("--size", default="medium", help="size of the generated school the server holds")
+    parser.add_argument("--seed", metavar="SIZE", help="generate a school of this size into BENCH_SCHEMA first (implies --size)")
+    parser.add_argument("--start-server", action="store_true", help="run gunicorn -c gunicorn.conf.py on BENCH_DATABASE_URL/BENCH_SCHEMA")
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="lesson_start")
+    parser.add_argument("--concurrency", default="5,10,20", help="comma-separated numbers of concurrent teachers, one step each")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per step")
+    parser.add_argument("--think-ms", type=float, default=500, help="mean pause between a teacher's actions (0 = flat out)")
+    parser.add_argument("--slo-ms", type=float, default=500, help="p95 latency a step must stay under to count as served")
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    if args.seed:
+        args.size = args.seed
+        seed(args.seed)
+    school = school_layout(args.size)
+
+    server = start_server(args.port) if args.start_server else None
+    base_url = (args.url or f"http://127.0.0.1:{args.port}").rstrip("/")
+    steps = []
+    try:
+        for concurrency in [int(value) for value in args.concurrency.split(",") if value.strip()]:
+            step = run_step(base_url, args.profile, concurrency, args.duration, args.think_ms, school, args.random_seed)
+            print_step(step)
+            steps.append(step)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    served = [step["concurrency"] for step in steps if step["total"]["p95_ms"] <= args.slo_ms and step["total"]["error_rate"] < 0.01]
+    print(f"\nLargest tested concurrency with p95 <= {args.slo_ms:g} ms and < 1% errors: {max(served) if served else 'none'} teachers")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump({"size": args.size, "think_ms": args.think_ms, "slo_ms": args.slo_ms, "steps": steps}, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Timing benchmarks of the DataManager and performance_api hot paths on synthetic schools.
+
+    BENCH_DATABASE_URL=postgresql://... python benchmarks/run.py --sizes small,medium
+    python benchmarks/run.py --sizes small --compare benchmarks/results/baseline.json
+
+Each size is generated into BENCH_SCHEMA (default "benchmark"), which is dropped and
+recreated, so never point it at a schema holding real data. Results are written as JSON
+to benchmarks/results/ and, with --compare, checked against an earlier run: a benchmark
+whose median got slower by more than --threshold is reported as a regression and makes the
+run exit with status 1.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS_DIR, "..", "src"))
+
+if "BENCH_DATABASE_URL" not in os.environ:
+    sys.exit("Set BENCH_DATABASE_URL to the PostgreSQL database to benchmark against.")
+# The models bind their schema at import time
+os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+os.environ["DB_SCHEMA"] = os.getenv("BENCH_SCHEMA", "benchmark")
+
+import sqlalchemy  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+
+from app import app, data_manager  # noqa: E402
+from models import db  # noqa: E402
+from caching import lesson_sheet_cache  # noqa: E402
+from query_tracker import track_queries  # noqa: E402
+from score_storage import SCORE_STORAGE  # noqa: E402
+import performance_api  # noqa: E402
+
+from generate import SIZES, current_spec, generate_school, lesson_dates  # noqa: E402
+
+
+# Differences below this many milliseconds are noise, however large the ratio
+NOISE_FLOOR_MS = 1.0
+
+
+def benchmarks_for(spec):
+    """
+    (name, function) pairs to time on a generated school. Read benchmarks use the middle
+    class and the last school year; save_scores rewrites a whole lesson sheet with every
+    value flipped, so each run writes the same number of rows.
+    """
+    dates = lesson_dates(spec)
+    class_id = (spec.classes + 1) // 2
+    student_id = (class_id - 1) * spec.students_per_class + 1
+    lesson_date = dates[-10]
+    year_start = next(d for d in dates if d.year == spec.first_school_year + spec.years - 1 and d.month >= 9)
+    year_end = dates[-1]
+    criteria = [c["name"] for c in data_manager.load_score_labels()]
+    flip = {"value": False}
+
+    def save_scores():
+        flip["value"] = not flip["value"]
+        sheet = {
+            student["id"]: {name: {"value": flip["value"], "notes": None} for name in criteria}
+            for student in data_manager.get_students_by_class(class_id)
+        }
+        data_manager.save_scores(class_id, lesson_date.isoformat(), sheet, "Benchmark", "")
+
+    def get_scores_by_date_cold():
+        lesson_sheet_cache.invalidate()
+        data_manager.get_scores_by_date(lesson_date.isoformat(), class_id, include_adjacent_dates=True)
+
+    return [
+        ("DataManager.get_scores_by_date (cold)", get_scores_by_date_cold),
+        ("DataManager.get_scores_by_date (cached)", lambda: data_manager.get_scores_by_date(lesson_date.isoformat(), class_id, include_adjacent_dates=True)),
+        ("DataManager.save_scores", save_scores),
+        ("DataManager.get_monthly_report", lambda: data_manager.get_monthly_report(student_id, class_id, lesson_date.month, lesson_date.year)),
+        ("DataManager.get_monthly_reports (class)", lambda: data_manager.get_monthly_reports(lesson_date.month, lesson_date.year, class_id=class_id)),
+        ("performance_api.compute_student_performance", lambda: performance_api.compute_student_performance(student_id, class_id, year_start, year_end)),
+        ("performance_api.compute_student_performance (all time)", lambda: performance_api.compute_student_performance(student_id, class_id, None, None)),
+        ("performance_api.compute_class_student_performances", lambda: performance_api.compute_class_student_performances(class_id, year_start, year_end)),
+        ("performance_api.compute_class_student_performances_vectorized", lambda: performance_api.compute_class_student_performances_vectorized(class_id, year_start, year_end)),
+        ("performance_api.compute_class_performance", lambda: performance_api.compute_class_performance(class_id, year_start, year_end)),
+        ("performance_api.compute_school_performance", lambda: performance_api.compute_school_performance(year_start, year_end)),
+        ("performance_api.compute_school_performance (all time)", lambda: performance_api.compute_school_performance(None, None)),
+    ]
+
+
+def time_benchmark(function, repeat: int, warmup: int):
+    for _ in range(warmup):
+        function()
+    timings = []
+    with track_queries() as stats:
+        for _ in range(repeat):
+            # Each run starts from a clean session, as a request would
+            db.session.remove()
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "runs": repeat,
+        "median_ms": round(statistics.median(timings), 3),
+        "min_ms": round(timings[0], 3),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "queries_per_run": round(stats.count / repeat, 2),
+    }
+
+
+def run(sizes, repeat: int, warmup: int, reuse: bool):
+    results = []
+    datasets = {}
+    for size in sizes:
+        spec = SIZES[size]
+        with app.app_context():
+            if reuse and current_spec() == repr(spec):
+                rows = None
+                print(f"[{size}] reusing the generated data", file=sys.stderr)
+            else:
+                started = time.perf_counter()
+                rows = generate_school(spec)
+                print(f"[{size}] generated {rows} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            datasets[size] = {**spec.describe(), "rows": rows}
+        # A request context: the interactive statement timeout and per-request session apply
+        with app.test_request_context():
+            for name, function in benchmarks_for(spec):
+                result = time_benchmark(function, repeat, warmup)
+                results.append({"size": size, "benchmark": name, **result})
+                print(f"[{size}] {name}: median {result['median_ms']} ms, {result['queries_per_run']} queries", file=sys.stderr)
+    return datasets, results
+
+
+def environment():
+    def git(*args):
+        try:
+            return subprocess.check_output(["git", *args], cwd=BENCHMARKS_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    with app.app_context():
+        server_version = db.session.execute(text("SHOW server_version")).scalar()
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": git("rev-parse", "HEAD"),
+        "git_dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "postgresql": server_version,
+        "score_storage": SCORE_STORAGE,
+        "machine": platform.machine(),
+    }
+
+
+def compare(baseline, results, threshold: float):
+    """
+    Regressions and improvements of `results` against a baseline run, by median.
+    """
+    before = {(r["size"], r["benchmark"]): r for r in baseline["results"]}
+    changes = []
+    for result in results:
+        old = before.get((result["size"], result["benchmark"]))
+        if old is None or not old["median_ms"]:
+            continue
+        ratio = result["median_ms"] / old["median_ms"]
+        difference = result["median_ms"] - old["median_ms"]
+        if abs(difference) < NOISE_FLOOR_MS or abs(ratio - 1) <= threshold:
+            continue
+        changes.append({
+            "size": result["size"],
+            "benchmark": result["benchmark"],
+            "baseline_ms": old["median_ms"],
+            "median_ms": result["median_ms"],
+            "ratio": round(ratio, 3),
+            "kind": "regression" if ratio > 1 else "improvement",
+            "queries_before": old.get("queries_per_run"),
+            "queries_after": result["queries_per_run"],
+        })
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="small,medium", help=f"comma-separated, from {', '.join(SIZES)}")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per benchmark")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed runs before timing")
+    parser.add_argument("--reuse", action="store_true", help="keep the generated data when the schema already holds the same size")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="an earlier result file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown of the median counted as a regression")
+    args = parser.parse_args()
+
+    sizes = [size.strip() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in SIZES]
+    if unknown:
+        parser.error(f"unknown sizes: {', '.join(unknown)}")
+
+    env = environment()
+    datasets, results = run(sizes, args.repeat, args.warmup, args.reuse)
+    report = {"environment": env, "datasets": datasets, "results": results}
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        report["compared_to"] = {"file": args.compare, "environment": baseline.get("environment"), "threshold": args.threshold}
+        report["changes"] = compare(baseline, results, args.threshold)
+        for change in report["changes"]:
+            print(f"{change['kind'].upper()}: [{change['size']}] {change['benchmark']}: "
+                  f"{change['baseline_ms']} -> {change['median_ms']} ms (x{change['ratio']})")
+        if any(change["kind"] == "regression" for change in report["changes"]):
+            exit_code = 1
+
+    output = args.output or os.path.join(BENCHMARKS_DIR, "results", env["timestamp"].replace(":", "") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as output_file:
+        json.dump(report, output_file, ensure_ascii=False, indent=2)
+    print(f"results written to {output}")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
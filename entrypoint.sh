@@ -1,4 +1,9 @@
 #!/bin/bash
 
+# Bring the schema up to date first when asked to (see "Database Migrations" in README.md)
+if [ "${MIGRATE_ON_START:-0}" = "1" ]; then
+    flask --app app schema upgrade || exit 1
+fi
+
 # Run the application
 exec "$@"
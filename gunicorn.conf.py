@@ -1,7 +1,25 @@
-workers = 2
-threads = 2
+import os
+
+# The database pool of each worker is sized from the same variables (see src/db_engine.py)
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "2"))
 timeout = 60
 preload_app = True
 worker_class = "sync"
 bind = "0.0.0.0:5000"
 loglevel = "info"
+
+
+# Prometheus samples of all workers are kept in PROMETHEUS_MULTIPROC_DIR (see src/request_metrics.py)
+def on_starting(server):
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for name in os.listdir(metrics_dir):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,27 @@
+import os
+
+# Async serving mode (src/asgi.py): one event loop per worker serves the JSON read endpoints,
+# so a worker handles hundreds of concurrent requests; GUNICORN_THREADS sizes the thread pool
+# that runs the other routes. The async pool is sized by ASYNC_DB_POOL_SIZE/ASYNC_DB_MAX_OVERFLOW.
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = "uvicorn_worker.UvicornWorker"
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+timeout = 60
+preload_app = False  # the async engine must be created inside each worker's event loop
+bind = "0.0.0.0:5000"
+loglevel = "info"
+
+
+# Prometheus samples of all workers are kept in PROMETHEUS_MULTIPROC_DIR (see src/request_metrics.py)
+def on_starting(server):
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for name in os.listdir(metrics_dir):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def child_exit(server, worker):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
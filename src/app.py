@@ -1,11 +1,28 @@
 import base64
+import io
+import json
 import logging
 import os
-import time
+import zipfile
+from datetime import date, datetime, timedelta
 from functools import wraps
-from flask import Flask, request, render_template, redirect, url_for, session, jsonify
+from flask import Flask, request, render_template, redirect, url_for, session, jsonify, send_file, abort
 from data_manager import DataManager
+from caching import reference_cache, lesson_sheet_cache, calendar_cache, archive_cache
+from data_versions import conditional_on_data_version, get_request_class_version
 from performance_api import bp as performance_bp
+from attendance_matrix import bp as analytics_bp
+from attendance_rollup import rollup_cli
+from attendance_streaks import streaks_cli
+from score_storage import scores_cli
+from school_calendar import calendar_cli
+from schema_migrations import schema_cli
+from partitioning import partitions_cli
+from score_archive import archive_cli
+from write_behind import score_queue
+from request_metrics import init_metrics, latency_summary, render_metrics
+from query_tracker import init_query_tracking
+from db_engine import REPORT, engine_options, init_engine, pool_stats, statement_timeout
 from models import db
 
 app = Flask(__name__)
@@ -14,39 +31,53 @@ app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['DB_SCHEMA'] = os.getenv('DB_SCHEMA', 'school_management')  # Default schema
+# Pool sized from the gunicorn threads (or none behind pgbouncer), pre-ping and statement timeouts
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
 
 app.secret_key = 'supersecretkey'
 
 # Initialize the database
 db.init_app(app)
+init_engine(app, db)
 
 data_manager = DataManager(db.session)
 
+
+def flush_queued_scores(batch):
+    # Runs on the write-behind flush thread, which needs its own app context (and session)
+    with app.app_context():
+        data_manager.flush_pending_lessons(batch)
+
+
+# WRITE_BEHIND=memory|disk queues PATCHed score edits and writes them coalesced in the background
+score_queue.init_app(flush_queued_scores)
+
+# Default span of the attendance page's lesson list
+LESSON_LIST_DAYS = 365
+
 # Register API blueprints
 app.register_blueprint(performance_bp, url_prefix='/api/performance')
+app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+
+# Maintenance commands (flask rollup rebuild|verify, flask streaks rebuild, flask scores to-compact|to-rows|verify,
+# flask calendar weekdays|close|reopen|show, flask schema upgrade|status|clone,
+# flask partitions enable|create|detach|status, flask archive move|status|verify)
+app.cli.add_command(rollup_cli)
+app.cli.add_command(streaks_cli)
+app.cli.add_command(scores_cli)
+app.cli.add_command(calendar_cli)
+app.cli.add_command(schema_cli)
+app.cli.add_command(partitions_cli)
+app.cli.add_command(archive_cli)
 
 logging.basicConfig(level=logging.INFO)
-custom_logger = logging.getLogger("custom")
-custom_logger.setLevel(logging.INFO)
 
 logging.getLogger('werkzeug').setLevel(logging.ERROR)
 
-
-@app.before_request
-def start_timer():
-    request.start_time = time.time()
-
-@app.after_request
-def log_request(response):
-    if hasattr(request, 'start_time'):
-        duration = time.time() - request.start_time
-        log_message = (
-            f'{request.remote_addr} - - [{time.strftime("%d/%b/%Y %H:%M:%S")}] '
-            f'"{request.method} {request.path} {request.environ.get("SERVER_PROTOCOL")}" '
-            f'{response.status_code} - {duration:.3f}s'
-        )
-        custom_logger.info(log_message)
-    return response
+# Per-route latency histograms, request/error counters and in-flight gauges, plus the access log
+init_metrics(app)
+# Queries and database time per request, N+1 warnings and EXPLAIN plans of slow statements
+init_query_tracking(app)
 
 def login_required(f):
     @wraps(f)
@@ -116,13 +147,15 @@ def select_class():
 @app.route('/attendance/<int:class_id>', methods=['GET', 'POST'])
 @login_required
 def attendance(class_id):
+    if data_manager.get_class_by_id(class_id) is None:
+        abort(404)
     if request.method == 'POST':
         lesson_date = request.form['lesson_date']
         students = data_manager.get_students_by_class(class_id)
         score_labels = data_manager.load_score_labels()
 
         student_notes = request.form['notes'] # a json string like this: '{"32": {<score_label>: "some notes"} }' where 32 is the student id
-        student_notes = eval(student_notes)
+        student_notes = json.loads(student_notes)
         lesson_subject = request.form['lesson_subject']
         lesson_activity = request.form['lesson_activity']
         students_score_data = dict()
@@ -137,26 +170,63 @@ def attendance(class_id):
             students_score_data[student_id] = new_score
         data_manager.save_scores(class_id, lesson_date, students_score_data, lesson_subject, lesson_activity)
 
-    class_name = data_manager.get_class_by_id(class_id)['name']
-    students = data_manager.get_students_by_class(class_id)
-    scores_labels = data_manager.load_score_labels()
-    return render_template('attendance.html', students=students, class_id=class_id, scores_labels=scores_labels, class_name=class_name, lesson_subject='', lesson_activity='')
+    # Embed today's lesson bundle so the page shows the sheet without further requests
+    today = date.today()
+    bundle = data_manager.get_lesson_bundle(class_id, today.isoformat(), (today - timedelta(days=LESSON_LIST_DAYS)).isoformat(), today.isoformat())
+    return render_template('attendance.html', students=bundle['students'], class_id=class_id, scores_labels=bundle['criteria'], class_name=bundle['class_name'], lesson_subject='', lesson_activity='', bundle=bundle)
+
+# save only the edited cells of a lesson sheet. JSON body:
+# {"changes": [{"student_id": 32, "criterion": "attendance", "value": true, "notes": "..."}], "lesson_subject": "...", "lesson_activity": "..."}
+# returns the number of rows written and the class's new data version
+@app.route('/lessons/<int:class_id>/<date>/scores', methods=['PATCH'])
+@login_required
+def save_score_changes(class_id, date):
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"status": "error", "message": "Expected a JSON object."}), 400
+    result = data_manager.save_score_changes(
+        class_id,
+        date,
+        payload.get('changes', []),
+        payload.get('lesson_subject'),
+        payload.get('lesson_activity')
+    )
+    return jsonify(result), {'error': 400, 'queued': 202}.get(result['status'], 200)
 
 # route for attendance data. accepts a class id and a specific date. GET method. return json data
 @app.route('/attendance_data/<int:class_id>/<date>')
+@conditional_on_data_version
 def attendance_data(class_id, date):
-    result = data_manager.get_scores_by_date(date, class_id, include_adjacent_dates=True)
+    result = data_manager.get_scores_by_date(date, class_id, include_adjacent_dates=True, version=get_request_class_version(db.session, class_id))
     return jsonify(result)
 
+# roster, criteria, lesson list and the selected lesson sheet with its neighbours, in one response.
+# query args: date (default today), start/end of the lesson list (default the last year), lessons=0 to skip the list
+@app.route('/lesson_bundle/<int:class_id>')
+@login_required
+@conditional_on_data_version
+def lesson_bundle(class_id):
+    try:
+        lesson_date = datetime.strptime(request.args.get('date', date.today().isoformat()), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"error": "Invalid date format. Use YYYY-MM-DD."}), 400
+    start = request.args.get('start', (lesson_date - timedelta(days=LESSON_LIST_DAYS)).isoformat())
+    end = request.args.get('end', lesson_date.isoformat())
+    include_lessons = request.args.get('lessons') != '0'
+    return jsonify(data_manager.get_lesson_bundle(class_id, lesson_date.isoformat(), start, end, include_lessons))
+
 @app.route('/class_performance/<int:class_id>')
+@statement_timeout(REPORT)
 @login_required
 def class_performance(class_id):
     """Display comprehensive performance analytics for a class"""
-    from performance_api import compute_class_performance, compute_student_performance
+    from performance_api import compute_class_performance, compute_class_student_performances
     from datetime import date, timedelta
 
     # Get class info
     selected_class = data_manager.get_class_by_id(class_id)
+    if selected_class is None:
+        abort(404)
     students = data_manager.get_students_by_class(class_id)
 
     # Get date range from query params or default to last 30 days
@@ -174,10 +244,11 @@ def class_performance(class_id):
     # Get class-wide performance
     class_perf = compute_class_performance(class_id, start_date, end_date)
 
-    # Get individual student performances
+    # Get individual student performances (one query for the whole class)
+    performances = compute_class_student_performances(class_id, start_date, end_date, [student['id'] for student in students])
     student_performances = []
     for student in students:
-        perf = compute_student_performance(student['id'], class_id, start_date, end_date)
+        perf = performances[student['id']]
         student_performances.append({
             'student': student,
             'attendance_percentage': perf.get('attendance_percentage', 0),
@@ -202,6 +273,7 @@ def class_performance(class_id):
                          total_students=len(students))
 
 @app.route('/monthly_report/<int:class_id>/<int:student_id>', methods=['GET', 'POST'])
+@statement_timeout(REPORT)
 @login_required
 def monthly_report(class_id, student_id):
     if request.method == 'POST':
@@ -209,6 +281,8 @@ def monthly_report(class_id, student_id):
         year = int(request.form['year'])
         student = data_manager.get_student_by_id(student_id)
         class_data = data_manager.get_class_by_id(class_id)
+        if class_data is None:
+            abort(404)
         scores_labels=data_manager.load_score_labels()
         teacher_name = data_manager.get_teacher_name(session['teacher_id'])
 
@@ -228,6 +302,62 @@ def monthly_report(class_id, student_id):
     return render_template('monthly_report_form.html', class_id=class_id, student_id=student_id)
 
 
+def monthly_reports_response(students, class_id, month, year, output_format):
+    """
+    Render the monthly reports of `students` from one batch computation, either as one
+    printable page or as a zip archive with a report page per student.
+    Rendering stays sequential: Jinja holds the GIL, so threads would not speed it up.
+    """
+    scores_by_student = data_manager.get_monthly_reports(month, year, class_id=class_id)
+    scores_labels = data_manager.load_score_labels()
+    teacher_name = data_manager.get_teacher_name(session['teacher_id'])
+    reports = [
+        {
+            'student': student,
+            'class_data': data_manager.get_class_by_id(student['class_id']),
+            'scores': scores_by_student.get(student['id'])
+        }
+        for student in students
+    ]
+
+    if output_format == 'zip':
+        archive_buffer = io.BytesIO()
+        with zipfile.ZipFile(archive_buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for report in reports:
+                page = render_template('report_template.html', **report, scores_labels=scores_labels, month=month, year=year, teacher_name=teacher_name)
+                file_name = f"{report['student']['id']}_{report['student']['name']}.html".replace('/', '-')
+                archive.writestr(file_name, page)
+        archive_buffer.seek(0)
+        return send_file(archive_buffer, mimetype='application/zip', as_attachment=True, download_name=f'monthly_reports_{year}_{month:02d}.zip')
+
+    return render_template('report_batch.html', reports=reports, scores_labels=scores_labels, month=month, year=year, teacher_name=teacher_name, batch=True)
+
+@app.route('/monthly_reports/<int:class_id>', methods=['GET', 'POST'])
+@statement_timeout(REPORT)
+@login_required
+def class_monthly_reports(class_id):
+    if request.method == 'POST':
+        month = int(request.form['month'])
+        year = int(request.form['year'])
+        students = data_manager.get_students_by_class(class_id)
+        return monthly_reports_response(students, class_id, month, year, request.form.get('format', 'html'))
+
+    return render_template('monthly_report_form.html', form_action=url_for('class_monthly_reports', class_id=class_id), batch=True)
+
+@app.route('/monthly_reports', methods=['GET', 'POST'])
+@statement_timeout(REPORT)
+@admin_required
+def school_monthly_reports():
+    if request.method == 'POST':
+        month = int(request.form['month'])
+        year = int(request.form['year'])
+        students = [student for student in data_manager.get_all_students_with_details() if student['active']]
+        students.sort(key=lambda student: (student['class_id'] or 0, student['name']))
+        return monthly_reports_response(students, None, month, year, request.form.get('format', 'html'))
+
+    return render_template('monthly_report_form.html', form_action=url_for('school_monthly_reports'), batch=True)
+
+
 @app.route('/remove_class/<int:teacher_id>/<int:class_id>')
 @admin_required
 def remove_class(teacher_id, class_id):
@@ -344,9 +474,41 @@ def delete_student(student_id, class_id):
 
 # route to show all json data
 @app.route('/internal/data')
+@statement_timeout(REPORT)
 def internal_data():
     return jsonify(data_manager.get_all_data())
 
+# route to check that the in-process caches are being hit
+@app.route('/internal/cache_stats')
+def internal_cache_stats():
+    return jsonify({
+        "reference_data": reference_cache.stats(),
+        "lesson_sheets": lesson_sheet_cache.stats(),
+        "school_calendar": calendar_cache.stats(),
+        "score_archive": archive_cache.stats(),
+    })
+
+# Prometheus metrics of all workers (see PROMETHEUS_MULTIPROC_DIR)
+@app.route('/metrics')
+def metrics():
+    body, content_type = render_metrics()
+    return body, 200, {'Content-Type': content_type}
+
+# estimated p50/p95/p99 per route from the same histograms, slowest first
+@app.route('/internal/latency')
+def internal_latency():
+    return jsonify(latency_summary())
+
+# route to watch this worker's database connection pool
+@app.route('/internal/db_pool')
+def internal_db_pool():
+    return jsonify(pool_stats(db.engine))
+
+# route to watch the write-behind queue of this worker
+@app.route('/internal/write_behind')
+def internal_write_behind():
+    return jsonify(score_queue.stats())
+
 @app.route('/logout')
 def logout():
     session.pop('teacher_id', None)
@@ -384,6 +546,7 @@ def delete_student_permanently(student_id):
 
 @app.route('/lessons_list/<int:class_id>')
 @login_required
+@conditional_on_data_version
 def lessons_list(class_id):
     start = request.args.get('start')
     end = request.args.get('end')
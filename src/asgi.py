@@ -0,0 +1,135 @@
+# Async serving mode: gunicorn -c gunicorn_asgi.conf.py asgi:app
+#
+# The JSON read endpoints (attendance_data, lessons_list and the performance API) are served
+# on the event loop. Their Flask views run unchanged, with the same DataManager and
+# performance_api code, but db.session is bound to an AsyncSession whose database I/O goes
+# through asyncpg, so a request waiting for PostgreSQL does not hold a thread. Every other
+# route is handed to the Flask app in a thread pool.
+import os
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+
+from app import app as flask_app
+from db_engine import (
+    async_database_url, async_engine_options, connection_default_timeout, gunicorn_threads,
+    listen_statement_timeouts, pool_stats,
+)
+from models import db
+
+
+# Endpoints answered on the event loop, and blueprints all of whose endpoints are
+ASYNC_ENDPOINTS = {"attendance_data", "lessons_list"}
+ASYNC_BLUEPRINTS = {"performance_api"}
+
+
+class ReadSession(Session):
+    """
+    The sync facade of the async read sessions; a class of its own so that the statement
+    timeout listener only applies to them.
+    """
+
+
+_engine_options = async_engine_options()
+async_engine = create_async_engine(async_database_url(os.environ["DATABASE_URL"]), **_engine_options)
+async_session = async_sessionmaker(async_engine, sync_session_class=ReadSession, expire_on_commit=False)
+listen_statement_timeouts(ReadSession, connection_default_timeout(_engine_options))
+
+# The rest of the app, run in a thread pool as large as the sync server's thread count,
+# which also sizes the sync engine's pool
+flask_wsgi = WSGIMiddleware(flask_app, workers=gunicorn_threads())
+
+in_flight = 0
+
+
+def match_async_endpoint(request: Request):
+    """
+    (endpoint, view_args) when Flask would route the request to an async-served view,
+    else None.
+    """
+    if request.method != "GET":
+        return None
+    adapter = flask_app.url_map.bind(request.url.hostname or "", url_scheme=request.url.scheme)
+    try:
+        endpoint, view_args = adapter.match(request.url.path, method=request.method)
+    except (HTTPException, RequestRedirect):
+        return None
+    if endpoint in ASYNC_ENDPOINTS or endpoint.split(".", 1)[0] in ASYNC_BLUEPRINTS:
+        return endpoint, view_args
+    return None
+
+
+def dispatch_flask_request(sync_session, request: Request):
+    """
+    Run the Flask request pipeline (hooks, view, session cookie) for `request` with
+    `db.session` bound to `sync_session`. Runs inside AsyncSession.run_sync, so each query
+    suspends this request instead of blocking the event loop.
+    """
+    with flask_app.test_request_context(
+        request.url.path,
+        base_url=f"{request.url.scheme}://{request.url.netloc}",
+        query_string=request.url.query.encode("latin-1"),
+        method=request.method,
+        headers=list(request.headers.items()),
+        environ_base={"REMOTE_ADDR": request.client.host if request.client else None},
+    ):
+        # Flask-SQLAlchemy scopes sessions to the app context pushed above
+        db.session.registry.set(sync_session)
+        try:
+            return flask_app.full_dispatch_request()
+        finally:
+            db.session.registry.clear()
+
+
+async def serve_async(request: Request) -> Response:
+    global in_flight
+    in_flight += 1
+    try:
+        async with async_session() as session:
+            flask_response = await session.run_sync(dispatch_flask_request, request)
+    finally:
+        in_flight -= 1
+    response = Response(flask_response.get_data(), status_code=flask_response.status_code)
+    # Keep Flask's headers as they are, repeated Set-Cookie headers included
+    response.raw_headers = [(key.lower().encode("latin-1"), value.encode("latin-1")) for key, value in flask_response.headers.items()]
+    return response
+
+
+async def dispatch(scope, receive, send):
+    request = Request(scope, receive)
+    if scope["type"] == "http" and match_async_endpoint(request) is not None:
+        response = await serve_async(request)
+        await response(scope, receive, send)
+    else:
+        await flask_wsgi(scope, receive, send)
+
+
+async def internal_async_stats(request: Request) -> Response:
+    return JSONResponse({
+        "in_flight": in_flight,
+        "pool": pool_stats(async_engine),
+        "wsgi_threads": gunicorn_threads(),
+    })
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await async_engine.dispose()
+
+
+app = Starlette(
+    routes=[
+        Route("/internal/async_stats", internal_async_stats),
+        Mount("/", app=dispatch),
+    ],
+    lifespan=lifespan,
+)
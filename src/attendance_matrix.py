@@ -0,0 +1,248 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from flask import Blueprint, request, jsonify
+
+from models import db, Student
+from score_storage import score_rows
+from score_archive import ScoreColumns, archived_scores, split_range
+from data_versions import conditional_on_data_version
+from caching import cached_criteria
+from performance_api import ATTENDANCE_CRITERION_NAME, parse_date
+
+
+bp = Blueprint("attendance_matrix", __name__)
+
+
+@dataclass
+class AttendanceMatrix:
+    """
+    Scores for a date range as dense boolean arrays of shape (students, lesson dates, criteria).
+
+    `recorded` marks the cells that have a score row, `values` the cells whose score is True
+    (a cell with duplicate rows is True if any of them is). A school year for a few hundred
+    students is a few hundred KB of booleans, an eighth of that bit-packed.
+    """
+    student_ids: np.ndarray     # (S,) int
+    class_ids: np.ndarray       # (S,) int, each student's current class
+    lesson_dates: List[date]    # (L,) ascending
+    criteria: List[Dict]        # (C,) {"id", "name", "label"}
+    recorded: np.ndarray        # (S, L, C) bool
+    values: np.ndarray          # (S, L, C) bool
+
+    def criterion_index(self, name: str) -> Optional[int]:
+        return next((i for i, c in enumerate(self.criteria) if c["name"] == name), None)
+
+    def packed_nbytes(self) -> int:
+        return np.packbits(self.recorded).nbytes + np.packbits(self.values).nbytes
+
+    def describe(self) -> Dict:
+        return {
+            "students": len(self.student_ids),
+            "lesson_dates": len(self.lesson_dates),
+            "criteria": len(self.criteria),
+            "nbytes": self.recorded.nbytes + self.values.nbytes,
+            "packed_nbytes": self.packed_nbytes(),
+        }
+
+
+def load_matrix(db_session, start: Optional[date], end: Optional[date], class_id: Optional[int] = None, criteria_names: Optional[List[str]] = None) -> AttendanceMatrix:
+    """
+    Build the matrix for one class (or the whole school) with a single bulk query,
+    optionally restricted to some criteria. Archived school years are read from their files.
+    """
+    criteria = cached_criteria(db_session)
+    if criteria_names is not None:
+        criteria = [c for c in criteria if c["name"] in criteria_names]
+    criteria_ids = [c["id"] for c in criteria] if criteria_names is not None else None
+    archived, live = split_range(db_session, start, end)
+    parts = []
+    if archived:
+        parts.append(archived_scores(db_session, archived, class_id=class_id, criteria_ids=criteria_ids))
+    if live:
+        live_start, live_end = live
+        scores = score_rows()
+        q = (
+            db_session.query(scores.c.student_id, Student.class_id, scores.c.lesson_date, scores.c.criteria_id, scores.c.value)
+            .join(Student, Student.id == scores.c.student_id)
+        )
+        if criteria_ids is not None:
+            q = q.filter(scores.c.criteria_id.in_(criteria_ids))
+        if class_id is not None:
+            q = q.filter(Student.class_id == class_id)
+        if live_start:
+            q = q.filter(scores.c.lesson_date >= live_start)
+        if live_end:
+            q = q.filter(scores.c.lesson_date <= live_end)
+        parts.append(ScoreColumns.from_rows(q.all()))
+    columns = ScoreColumns.concatenate(parts)
+
+    if not len(columns):
+        empty = np.zeros((0, 0, len(criteria)), dtype=bool)
+        return AttendanceMatrix(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), [], criteria, empty, empty.copy())
+
+    student_ids, student_idx = np.unique(columns.student_id, return_inverse=True)
+    day_numbers, date_idx = np.unique(columns.lesson_day, return_inverse=True)
+
+    criteria_position = {c["id"]: i for i, c in enumerate(criteria)}
+    criteria_idx = np.array([criteria_position.get(cid, -1) for cid in columns.criteria_id.tolist()], dtype=np.int64)
+    known = criteria_idx >= 0
+    values_col = columns.value
+
+    shape = (len(student_ids), len(day_numbers), len(criteria))
+    recorded = np.zeros(shape, dtype=bool)
+    values = np.zeros(shape, dtype=bool)
+    recorded[student_idx[known], date_idx[known], criteria_idx[known]] = True
+    present = known & values_col
+    values[student_idx[present], date_idx[present], criteria_idx[present]] = True
+
+    class_ids = np.zeros(len(student_ids), dtype=np.int64)
+    class_ids[student_idx] = columns.class_id
+
+    return AttendanceMatrix(
+        student_ids=student_ids,
+        class_ids=class_ids,
+        lesson_dates=[date.fromordinal(int(d)) for d in day_numbers],
+        criteria=criteria,
+        recorded=recorded,
+        values=values,
+    )
+
+
+def compute_streaks_vectorized(recorded: np.ndarray, present: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Longest and current present streak per row of (S, L) arrays. Unrecorded lessons are
+    skipped, matching performance_api.compute_streaks over each student's own lesson dates.
+    """
+    n_students, n_lessons = recorded.shape
+    if n_students == 0 or n_lessons == 0:
+        zeros = np.zeros(n_students, dtype=np.int64)
+        return zeros, zeros.copy()
+
+    present = present & recorded
+    absent = recorded & ~present
+    # Every absence starts a new run; presents sharing (student, absences so far) form one run
+    run_id = np.cumsum(absent, axis=1)
+    keys = np.arange(n_students)[:, None] * (n_lessons + 1) + run_id
+    run_lengths = np.bincount(keys[present], minlength=n_students * (n_lessons + 1))
+    longest = run_lengths.reshape(n_students, n_lessons + 1).max(axis=1)
+    current = run_lengths[np.arange(n_students) * (n_lessons + 1) + run_id[:, -1]]
+    return longest, current
+
+
+def percentage(part: np.ndarray, whole: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(whole > 0, np.round(part / np.maximum(whole, 1) * 100, 2), 0.0)
+
+
+def student_attendance(matrix: AttendanceMatrix) -> Dict[int, Dict]:
+    """
+    Attended/total/percentage/streaks per student, keyed by student_id.
+    """
+    a = matrix.criterion_index(ATTENDANCE_CRITERION_NAME)
+    if a is None:
+        return {}
+    recorded = matrix.recorded[:, :, a]
+    present = matrix.values[:, :, a] & recorded
+    total = recorded.sum(axis=1)
+    attended = present.sum(axis=1)
+    longest, current = compute_streaks_vectorized(recorded, present)
+    return {
+        int(student_id): {
+            "attended_lessons": int(attended[i]),
+            "total_lessons": int(total[i]),
+            # Python's round() so results match performance_api to the last digit
+            "attendance_percentage": round((int(attended[i]) / int(total[i])) * 100, 2) if total[i] else 0.0,
+            "longest_attendance_streak": int(longest[i]),
+            "current_attendance_streak": int(current[i]),
+        }
+        for i, student_id in enumerate(matrix.student_ids)
+    }
+
+
+def criteria_rates(matrix: AttendanceMatrix, rows: Optional[np.ndarray] = None) -> Dict[str, Dict]:
+    """
+    True/recorded counts and percentage per criterion, optionally for a subset of students.
+    """
+    recorded = matrix.recorded if rows is None else matrix.recorded[rows]
+    values = matrix.values if rows is None else matrix.values[rows]
+    totals = recorded.sum(axis=(0, 1))
+    trues = (values & recorded).sum(axis=(0, 1))
+    pct = percentage(trues, totals)
+    return {
+        c["name"]: {"true_records": int(trues[i]), "total_records": int(totals[i]), "percentage": float(pct[i])}
+        for i, c in enumerate(matrix.criteria)
+    }
+
+
+def criteria_correlations(matrix: AttendanceMatrix, rows: Optional[np.ndarray] = None) -> Dict[str, Dict[str, Optional[float]]]:
+    """
+    Pearson (phi) correlation between every pair of criteria, over the (student, lesson)
+    cells where both criteria were recorded. None when a criterion never varies.
+    """
+    recorded = matrix.recorded if rows is None else matrix.recorded[rows]
+    values = matrix.values if rows is None else matrix.values[rows]
+    n_criteria = len(matrix.criteria)
+    recorded = recorded.reshape(-1, n_criteria)
+    x = (values.reshape(-1, n_criteria) & recorded).astype(np.float64)
+    m = recorded.astype(np.float64)
+
+    # Pairwise sums over jointly recorded cells, all as (C, C) matrix products
+    n = m.T @ m
+    sx = x.T @ m             # sum of x_i where i and j both recorded
+    sxx = (x * x).T @ m
+    sxy = x.T @ x
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sx.T / n
+        var_i = sxx - sx * sx / n
+        corr = cov / np.sqrt(var_i * var_i.T)
+
+    names = [c["name"] for c in matrix.criteria]
+    return {
+        names[i]: {
+            names[j]: (round(float(corr[i, j]), 4) if np.isfinite(corr[i, j]) else None)
+            for j in range(n_criteria)
+        }
+        for i in range(n_criteria)
+    }
+
+
+@bp.route("/class/<int:class_id>", methods=["GET"])
+@conditional_on_data_version
+def class_matrix_analytics(class_id: int):
+    start = parse_date(request.args.get("start_date"))
+    end = parse_date(request.args.get("end_date"))
+    matrix = load_matrix(db.session, start, end, class_id)
+
+    return jsonify({
+        "class_id": class_id,
+        "start_date": start.isoformat() if start else None,
+        "end_date": end.isoformat() if end else None,
+        "matrix": matrix.describe(),
+        "students": [{"student_id": sid, **perf} for sid, perf in student_attendance(matrix).items()],
+        "criteria_rates": criteria_rates(matrix),
+        "criteria_correlations": criteria_correlations(matrix),
+    })
+
+
+@bp.route("/school", methods=["GET"])
+@conditional_on_data_version
+def school_matrix_analytics():
+    start = parse_date(request.args.get("start_date"))
+    end = parse_date(request.args.get("end_date"))
+    matrix = load_matrix(db.session, start, end)
+
+    classes = [
+        {"class_id": int(class_id), "criteria_rates": criteria_rates(matrix, matrix.class_ids == class_id)}
+        for class_id in np.unique(matrix.class_ids)
+    ]
+    return jsonify({
+        "start_date": start.isoformat() if start else None,
+        "end_date": end.isoformat() if end else None,
+        "matrix": matrix.describe(),
+        "criteria_rates": criteria_rates(matrix),
+        "criteria_correlations": criteria_correlations(matrix),
+        "classes": classes,
+    })
@@ -0,0 +1,179 @@
+import sys
+from datetime import date
+from typing import Dict, Iterable, Optional, Tuple
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import case, func, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, AttendanceRollup, Student, get_schema
+from score_storage import score_rows
+from score_archive import archived_through
+from data_versions import bump_all_class_versions
+
+
+RollupKey = Tuple[int, date, int]  # (class_id, lesson_date, criteria_id)
+
+
+def aggregate_scores(db_session, class_ids: Optional[Iterable[int]] = None, lesson_dates: Optional[Iterable[date]] = None) -> Dict[RollupKey, Tuple[int, int]]:
+    """
+    Count present/total scores straight from the scores table, grouped like the rollup.
+    Students are attributed to their current class, the same way the performance queries join them.
+    """
+    scores = score_rows()
+    q = (
+        db_session.query(
+            Student.class_id,
+            scores.c.lesson_date,
+            scores.c.criteria_id,
+            func.count(case((scores.c.value.is_(True), 1))),
+            func.count(),
+        )
+        .join(Student, Student.id == scores.c.student_id)
+    )
+    if class_ids is not None:
+        q = q.filter(Student.class_id.in_(list(class_ids)))
+    if lesson_dates is not None:
+        q = q.filter(scores.c.lesson_date.in_(list(lesson_dates)))
+    rows = q.group_by(Student.class_id, scores.c.lesson_date, scores.c.criteria_id).all()
+    return {(class_id, lesson_date, criteria_id): (present, total) for class_id, lesson_date, criteria_id, present, total in rows}
+
+
+def lock_rollup_keys(db_session, class_ids: Iterable[int], lesson_dates: Iterable[date]):
+    """
+    Take a transaction-level advisory lock per (class, lesson date), in lock id order so two
+    transactions cannot deadlock on them. A second save of the same lesson waits until the
+    first commits, and its aggregate query then sees the first one's scores.
+    """
+    keys = sorted(f"attendance_rollup.{get_schema()}.{class_id}.{lesson_date.isoformat()}" for class_id in class_ids for lesson_date in lesson_dates)
+    db_session.execute(
+        text("SELECT pg_advisory_xact_lock(hashtext(k)) FROM (SELECT k FROM unnest(CAST(:keys AS text[])) AS k ORDER BY hashtext(k)) AS ordered"),
+        {"keys": keys},
+    )
+
+
+def refresh_rollup(db_session, class_ids: Iterable[int], lesson_dates: Iterable[date]):
+    """
+    Recompute the rollup rows of the given classes and lesson dates from the scores table.
+    Runs inside the caller's transaction and does not commit; the cost is bounded by the
+    number of lessons touched, not by the size of the history. Concurrent refreshes of the
+    same lessons are serialized, so the last one to commit counts every committed score.
+    """
+    class_ids = set(class_ids)
+    lesson_dates = set(lesson_dates)
+    if not class_ids or not lesson_dates:
+        return
+
+    # Make pending ORM changes visible to the aggregate query
+    db_session.flush()
+    lock_rollup_keys(db_session, class_ids, lesson_dates)
+    counts = aggregate_scores(db_session, class_ids, lesson_dates)
+
+    if counts:
+        stmt = insert(AttendanceRollup).values([
+            {
+                "class_id": class_id,
+                "lesson_date": lesson_date,
+                "criteria_id": criteria_id,
+                "present_count": present,
+                "total_count": total,
+            }
+            for (class_id, lesson_date, criteria_id), (present, total) in counts.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AttendanceRollup.class_id, AttendanceRollup.lesson_date, AttendanceRollup.criteria_id],
+            set_={"present_count": stmt.excluded.present_count, "total_count": stmt.excluded.total_count},
+        )
+        db_session.execute(stmt)
+
+    # Drop rows whose scores are gone (deleted lesson, student moved to another class, ...)
+    stale = db_session.query(AttendanceRollup).filter(
+        AttendanceRollup.class_id.in_(class_ids),
+        AttendanceRollup.lesson_date.in_(lesson_dates),
+    )
+    if counts:
+        stale = stale.filter(
+            tuple_(AttendanceRollup.class_id, AttendanceRollup.lesson_date, AttendanceRollup.criteria_id).notin_(list(counts))
+        )
+    stale.delete(synchronize_session=False)
+
+
+def get_student_lesson_dates(db_session, student_id: int):
+    """
+    Lesson dates on which a student has scores, i.e. the rollup dates their changes can affect.
+    """
+    scores = score_rows()
+    rows = db_session.query(scores.c.lesson_date).filter(scores.c.student_id == student_id).distinct().all()
+    return [row[0] for row in rows]
+
+
+def rebuild_rollup(db_session):
+    """
+    Replace the whole rollup with fresh aggregates from the scores table. Does not commit.
+    Rows of archived school years are kept: their scores are no longer in the table.
+    """
+    cutoff = archived_through(db_session)
+    stale = db_session.query(AttendanceRollup)
+    if cutoff is not None:
+        stale = stale.filter(AttendanceRollup.lesson_date > cutoff)
+    stale.delete(synchronize_session=False)
+    counts = {key: count for key, count in aggregate_scores(db_session).items() if cutoff is None or key[1] > cutoff}
+    if counts:
+        db_session.execute(insert(AttendanceRollup), [
+            {
+                "class_id": class_id,
+                "lesson_date": lesson_date,
+                "criteria_id": criteria_id,
+                "present_count": present,
+                "total_count": total,
+            }
+            for (class_id, lesson_date, criteria_id), (present, total) in counts.items()
+        ])
+    return len(counts)
+
+
+def find_rollup_drift(db_session):
+    """
+    Compare the rollup with the scores table and return the keys that disagree,
+    as a list of (key, expected (present, total), stored (present, total)).
+    Archived school years are not compared.
+    """
+    cutoff = archived_through(db_session)
+    expected = {key: count for key, count in aggregate_scores(db_session).items() if cutoff is None or key[1] > cutoff}
+    stored_q = db_session.query(AttendanceRollup)
+    if cutoff is not None:
+        stored_q = stored_q.filter(AttendanceRollup.lesson_date > cutoff)
+    stored = {
+        (row.class_id, row.lesson_date, row.criteria_id): (row.present_count, row.total_count)
+        for row in stored_q.all()
+    }
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        if expected.get(key) != stored.get(key):
+            drift.append((key, expected.get(key), stored.get(key)))
+    return drift
+
+
+rollup_cli = AppGroup("rollup", help="Maintain the attendance rollup table.")
+
+
+@rollup_cli.command("rebuild")
+def rebuild_command():
+    """Backfill the rollup from the scores table."""
+    rows = rebuild_rollup(db.session)
+    bump_all_class_versions(db.session)
+    db.session.commit()
+    click.echo(f"Rollup rebuilt: {rows} rows.")
+
+
+@rollup_cli.command("verify")
+def verify_command():
+    """Report rollup rows that disagree with the scores table."""
+    drift = find_rollup_drift(db.session)
+    for (class_id, lesson_date, criteria_id), expected, stored in drift:
+        click.echo(f"class={class_id} date={lesson_date.isoformat()} criteria={criteria_id}: expected={expected} stored={stored}")
+    if drift:
+        click.echo(f"Rollup drift detected in {len(drift)} rows. Run 'flask rollup rebuild' to fix.")
+        sys.exit(1)
+    click.echo("Rollup is in sync with scores.")
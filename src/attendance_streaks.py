@@ -0,0 +1,161 @@
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, StudentStreak, Student, Class
+from score_storage import score_rows
+from score_archive import archived_scores, split_range
+from data_versions import bump_all_class_versions
+
+
+def _advance(streak: StudentStreak, lesson_date: date, present: bool):
+    """
+    Append one lesson to a streak state, in O(1).
+    """
+    if present:
+        streak.current_present_streak = (streak.current_present_streak or 0) + 1
+        streak.current_absence_streak = 0
+        streak.longest_streak = max(streak.longest_streak or 0, streak.current_present_streak)
+    else:
+        streak.current_present_streak = 0
+        streak.current_absence_streak = (streak.current_absence_streak or 0) + 1
+    streak.last_lesson_date = lesson_date
+    streak.last_lesson_present = present
+
+
+def record_attendance(db_session, lesson_date: date, attendance_by_student: Dict[int, bool], attendance_criteria_id: int):
+    """
+    Update the streak state of each student for a newly saved attendance value.
+
+    Saving the next lesson only advances the stored counters. Edits to an older lesson, or a
+    changed value on the latest one, cannot be applied incrementally, so those students are
+    rebuilt from their attendance history. Runs inside the caller's transaction, which keeps
+    the students' streak rows locked, so concurrent saves for a student are applied in turn.
+    """
+    if not attendance_by_student:
+        return
+
+    student_ids = sorted(attendance_by_student)
+    # Create missing rows first, so there is always a row to lock
+    db_session.execute(
+        insert(StudentStreak)
+        .values([{"student_id": student_id, "current_present_streak": 0, "current_absence_streak": 0, "longest_streak": 0} for student_id in student_ids])
+        .on_conflict_do_nothing(index_elements=[StudentStreak.student_id])
+    )
+    # Locked in student order, so two saves cannot deadlock on them
+    streaks = {
+        streak.student_id: streak
+        for streak in db_session.query(StudentStreak)
+        .filter(StudentStreak.student_id.in_(student_ids))
+        .order_by(StudentStreak.student_id)
+        .with_for_update()
+        .populate_existing()
+        .all()
+    }
+
+    to_rebuild = []
+    for student_id in student_ids:
+        present = bool(attendance_by_student[student_id])
+        streak = streaks[student_id]
+        if streak.last_lesson_date is None or lesson_date > streak.last_lesson_date:
+            _advance(streak, lesson_date, present)
+        elif lesson_date == streak.last_lesson_date and present == streak.last_lesson_present:
+            continue
+        else:
+            to_rebuild.append(student_id)
+
+    if to_rebuild:
+        rebuild_streaks(db_session, attendance_criteria_id, to_rebuild)
+
+
+def rebuild_streaks(db_session, attendance_criteria_id: int, student_ids: Optional[Iterable[int]] = None):
+    """
+    Recompute streak state from the attendance history of the given students (all when None),
+    archived school years included. A lesson counts as present if any of its attendance
+    records is True. Does not commit.
+    """
+    db_session.flush()
+
+    scores = score_rows()
+    q = db_session.query(scores.c.student_id, scores.c.lesson_date, scores.c.value).filter(scores.c.criteria_id == attendance_criteria_id)
+    streak_q = db_session.query(StudentStreak)
+    if student_ids is not None:
+        student_ids = list(student_ids)
+        q = q.filter(scores.c.student_id.in_(student_ids))
+        streak_q = streak_q.filter(StudentStreak.student_id.in_(student_ids))
+    archived, live = split_range(db_session, None, None)
+    rows = []
+    if archived:
+        archived_rows = archived_scores(db_session, archived, student_ids=student_ids, criteria_ids=[attendance_criteria_id]).rows()
+        rows = [(student_id, lesson_date, value) for student_id, _, lesson_date, _, value in archived_rows]
+    if live[0]:
+        q = q.filter(scores.c.lesson_date >= live[0])
+    rows += q.order_by(scores.c.student_id, scores.c.lesson_date).all()
+
+    # student_id -> {lesson_date: present}
+    attendance: Dict[int, Dict[date, bool]] = {}
+    for student_id, lesson_date, value in rows:
+        dates = attendance.setdefault(student_id, {})
+        dates[lesson_date] = dates.get(lesson_date, False) or bool(value)
+
+    streaks = {streak.student_id: streak for streak in streak_q.all()}
+    for student_id in set(attendance) | set(streaks):
+        streak = streaks.get(student_id)
+        if streak is None:
+            streak = StudentStreak(student_id=student_id)
+            db_session.add(streak)
+        streak.current_present_streak = 0
+        streak.current_absence_streak = 0
+        streak.longest_streak = 0
+        streak.last_lesson_date = None
+        streak.last_lesson_present = None
+        for lesson_date, present in attendance.get(student_id, {}).items():
+            _advance(streak, lesson_date, present)
+
+    return len(attendance)
+
+
+def get_absence_alerts(db_session, threshold: int):
+    """
+    Students whose current run of consecutive absences is at least `threshold` lessons.
+    """
+    rows = (
+        db_session.query(StudentStreak, Student, Class)
+        .join(Student, Student.id == StudentStreak.student_id)
+        .join(Class, Class.id == Student.class_id)
+        .filter(StudentStreak.current_absence_streak >= threshold, Student.active.is_(True))
+        .order_by(StudentStreak.current_absence_streak.desc(), Student.name.asc())
+        .all()
+    )
+    return [
+        {
+            "student_id": student.id,
+            "student_name": student.name,
+            "class_id": class_.id,
+            "class_name": class_.name,
+            "consecutive_absences": streak.current_absence_streak,
+            "last_lesson_date": streak.last_lesson_date.isoformat() if streak.last_lesson_date else None,
+            "longest_attendance_streak": streak.longest_streak,
+        }
+        for streak, student, class_ in rows
+    ]
+
+
+streaks_cli = AppGroup("streaks", help="Maintain the per-student attendance streak table.")
+
+
+@streaks_cli.command("rebuild")
+def rebuild_command():
+    """Recompute every student's streak state from the scores table."""
+    from performance_api import get_attendance_criteria_id
+
+    attendance_criteria_id = get_attendance_criteria_id()
+    if not attendance_criteria_id:
+        raise click.ClickException("Attendance criterion not found.")
+    students = rebuild_streaks(db.session, attendance_criteria_id)
+    bump_all_class_versions(db.session)
+    db.session.commit()
+    click.echo(f"Streaks rebuilt for {students} students.")
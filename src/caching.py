@@ -0,0 +1,183 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from models import Criteria
+
+
+class LRUCache:
+    """
+    A thread-safe, size-bounded LRU cache with optional per-entry TTL and hit/miss counters.
+
+    Every invalidation bumps `version`. A value loaded while an invalidation happened is
+    returned to its caller but not stored, so a slow load can never put stale data back.
+    Each gunicorn worker has its own copy; the TTL bounds how long another worker's write
+    can stay invisible here.
+    """
+
+    def __init__(self, name, max_entries=1024, ttl=None, sizeof=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sizeof = sizeof  # optional value -> approximate bytes, for memory reporting
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.approx_bytes = 0
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None, is_valid=None):
+        """
+        Return the cached value, or `default` when it is missing, expired or rejected by
+        `is_valid(value)` (e.g. built from an outdated data version).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value, _ = entry
+                if (expires_at is None or expires_at > time.monotonic()) and (is_valid is None or is_valid(value)):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.approx_bytes -= size
+
+    def set(self, key, value, version=None):
+        """
+        Store a value. When `version` is given and the cache was invalidated since it was
+        read, the value is dropped.
+        """
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            expires_at = time.monotonic() + self.ttl if self.ttl else None
+            if key in self._entries:
+                self._remove(key)
+            size = self.sizeof(value) if self.sizeof else 0
+            self._entries[key] = (expires_at, value, size)
+            self.approx_bytes += size
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for `key`, calling `loader()` and caching its result on a miss.
+        A None result (e.g. a missing row) is not cached, so a row created later shows up at once.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        version = self.version
+        value = loader()
+        if value is not None:
+            self.set(key, value, version)
+        return value
+
+    def invalidate(self, key=None):
+        """
+        Drop one key, or every entry when `key` is None.
+        """
+        with self._lock:
+            self.version += 1
+            if key is None:
+                self._entries.clear()
+                self.approx_bytes = 0
+            elif key in self._entries:
+                self._remove(key)
+
+    def invalidate_where(self, predicate):
+        """
+        Drop every entry whose key matches `predicate(key)`.
+        """
+        with self._lock:
+            self.version += 1
+            for key in [key for key in self._entries if predicate(key)]:
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "version": self.version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "approx_bytes": self.approx_bytes if self.sizeof else None,
+            }
+
+
+# Criteria, class names and teacher names: read on every page, written almost never
+reference_cache = LRUCache(
+    "reference_data",
+    max_entries=int(os.getenv("REFERENCE_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("REFERENCE_CACHE_TTL", "300")),
+)
+
+
+def approx_sizeof(value):
+    """
+    Rough deep size in bytes of plain JSON-like data (dicts, lists, strings, numbers).
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approx_sizeof(k) + approx_sizeof(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        size += sum(approx_sizeof(item) for item in value)
+    return size
+
+
+# Assembled lesson sheets (DataManager.get_scores_by_date), validated against the class data version
+lesson_sheet_cache = LRUCache(
+    "lesson_sheets",
+    max_entries=int(os.getenv("LESSON_SHEET_CACHE_MAX_ENTRIES", "256")),
+    sizeof=approx_sizeof,
+)
+
+
+# Expected lesson dates per class and school year (school_calendar); the tables behind it change a few times a year
+calendar_cache = LRUCache(
+    "school_calendar",
+    max_entries=int(os.getenv("CALENDAR_CACHE_MAX_ENTRIES", "512")),
+    ttl=float(os.getenv("CALENDAR_CACHE_TTL", "3600")),
+)
+
+
+# School years loaded from the score archive (score_archive); the files never change once written
+archive_cache = LRUCache(
+    "score_archive",
+    max_entries=int(os.getenv("ARCHIVE_CACHE_MAX_ENTRIES", "4")),
+    sizeof=lambda archived_year: archived_year.nbytes,
+)
+
+
+def cached_criteria(db_session):
+    """
+    All criteria as [{"id", "name", "label"}], served from the reference cache.
+    """
+    def load():
+        return [
+            {
+                "id": criterion.id,
+                "name": criterion.name,
+                "label": criterion.label
+            }
+            for criterion in db_session.query(Criteria).order_by(Criteria.id).all()
+        ]
+
+    return reference_cache.get_or_load(("criteria",), load)
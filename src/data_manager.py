@@ -1,45 +1,63 @@
 import base64
-import calendar
 import json
 from datetime import datetime
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import or_
-from models import Class, Teacher, ClassTeacher, Student, Score, Criteria, LessonInfo
+from sqlalchemy import case, func, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import joinedload
+from models import Class, Teacher, ClassTeacher, Student, LessonInfo, StudentStreak
+from attendance_rollup import refresh_rollup, get_student_lesson_dates
+from attendance_streaks import record_attendance, rebuild_streaks
+from performance_api import ATTENDANCE_CRITERION_NAME
+from caching import reference_cache, lesson_sheet_cache, cached_criteria
+from score_storage import score_rows, load_lesson_scores, write_scores, delete_lesson_scores, delete_student_scores
+from score_archive import archived_scores, archived_lesson_message, is_archived, split_range
+from data_versions import bump_class_versions, get_class_version
+from lesson_calendar import get_adjacent_lesson_dates, get_lessons_in_range
+from school_calendar import count_expected_lessons_by_class, month_bounds
+from write_behind import score_queue, KEEP_NOTES
 
 
 class DataManager:
     def __init__(self, db_session):
         self.db_session = db_session
 
+    def mark_classes_changed(self, class_ids):
+        """
+        Bump the data version of the given classes (inside the current transaction) and drop
+        this process's cached lesson sheets for them. Other workers notice the new version.
+        """
+        bump_class_versions(self.db_session, class_ids)
+        class_ids = set(class_ids)
+        lesson_sheet_cache.invalidate_where(lambda key: key[0] in class_ids)
+
     def load_score_labels(self):
         """
-        Load score labels and metadata from the database.
+        Load score labels and metadata from the database (cached).
         """
-        criteria = self.db_session.query(Criteria).all()
-        return [
-            {
-                "id": criterion.id,
-                "name": criterion.name,
-                "label": criterion.label
-            }
-            for criterion in criteria
-        ]
+        return cached_criteria(self.db_session)
 
     def get_teacher_name(self, teacher_id):
         """
-        Get the teacher's name by their ID from the database.
+        Get the teacher's name by their ID from the database (cached).
         """
-        # Query the database for the teacher's name
-        teacher = self.db_session.query(Teacher).filter(Teacher.id == teacher_id).first()
-        return teacher.name if teacher else None
+        def load():
+            # Query the database for the teacher's name
+            teacher = self.db_session.query(Teacher).filter(Teacher.id == teacher_id).first()
+            return teacher.name if teacher else None
+
+        return reference_cache.get_or_load(("teacher_name", teacher_id), load)
 
     def get_class_by_id(self, class_id):
         """
-        Get class data by class ID from the database.
+        Get class data by class ID from the database (cached).
         """
-        # Query the database for the class
-        class_data = self.db_session.query(Class).filter(Class.id == class_id).first()
-        return {'id': class_data.id, 'name': class_data.name} if class_data else None
+        def load():
+            # Query the database for the class
+            class_data = self.db_session.query(Class).filter(Class.id == class_id).first()
+            return {'id': class_data.id, 'name': class_data.name} if class_data else None
+
+        return reference_cache.get_or_load(("class", class_id), load)
 
     def get_student_by_id(self, student_id):
         """
@@ -82,6 +100,21 @@ class DataManager:
             for student in class_students
         ]
 
+    def get_class_roster_ids(self, class_id):
+        """
+        Ids of the active students of a class, cached while the class's data version is unchanged.
+        """
+        version = get_class_version(self.db_session, class_id)
+        cached = reference_cache.get(("roster", class_id), is_valid=lambda entry: entry[0] == version)
+        if cached is not None:
+            return cached[1]
+
+        roster = frozenset(
+            row[0] for row in self.db_session.query(Student.id).filter(Student.class_id == class_id, Student.active == True).all()
+        )
+        reference_cache.set(("roster", class_id), (version, roster))
+        return roster
+
     def get_classes_by_teacher(self, teacher_id):
         """
         Get classes by teacher ID from the database.
@@ -125,37 +158,48 @@ class DataManager:
             list: A list of dictionaries containing scores grouped by date and criterion.
         """
         try:
-            # Calculate the start and end dates for the given month
-            month_start = datetime(year, month, 1).date()
-            if month == 12:
-                month_end = datetime(year + 1, 1, 1).date()
-            else:
-                month_end = datetime(year, month + 1, 1).date()
-
-            # Query the database for scores in the given range
-            scores_query = (
-                self.db_session.query(Score)
-                .filter(
-                    Score.student_id == student_id,
-                    Score.lesson_date >= month_start,
-                    Score.lesson_date < month_end
+            # Calculate the first and last dates of the given month
+            month_start, month_end = month_bounds(year, month)
+
+            # Months of archived school years are read from the archive files
+            archived, live = split_range(self.db_session, month_start, month_end)
+            scores = []
+            if archived:
+                scores = [
+                    (lesson_date, criteria_id, value)
+                    for _, _, lesson_date, criteria_id, value in archived_scores(self.db_session, archived, student_ids=[student_id]).rows()
+                ]
+            if live:
+                # Query the database for scores in the given range
+                score_table = score_rows()
+                scores_query = (
+                    self.db_session.query(score_table.c.lesson_date, score_table.c.criteria_id, score_table.c.value)
+                    .filter(
+                        score_table.c.student_id == student_id,
+                        score_table.c.lesson_date >= live[0],
+                        score_table.c.lesson_date <= live[1]
+                    )
                 )
-                .join(Criteria)  # Join with the Criteria table to fetch criterion details
-            )
+                scores += scores_query.all()
+            # Criterion details come from the cached criteria instead of a lazy load per score
+            criteria_by_id = {criterion['id']: criterion for criterion in self.load_score_labels()}
 
             # Group scores by lesson_date for structured output
             scores_by_date = {}
-            for score in scores_query.all():
-                lesson_date = score.lesson_date.isoformat()
+            for score_date, criteria_id, value in scores:
+                criterion = criteria_by_id.get(criteria_id)
+                if not criterion:
+                    continue
+                lesson_date = score_date.isoformat()
                 if lesson_date not in scores_by_date:
                     scores_by_date[lesson_date] = {
                         "lesson_date": lesson_date,
                         "scores": []
                     }
                 scores_by_date[lesson_date]["scores"].append({
-                    "criteria_name": score.criteria.name,
-                    "criteria_label": score.criteria.label,
-                    "value": score.value
+                    "criteria_name": criterion['name'],
+                    "criteria_label": criterion['label'],
+                    "value": value
                 })
 
             # Convert grouped scores into a list
@@ -163,7 +207,64 @@ class DataManager:
         except SQLAlchemyError as e:
             return {"status": "error", "message": str(e)}
 
-    def get_scores_by_date(self, lesson_date, class_id, include_adjacent_dates=False):
+    def get_scores_by_date(self, lesson_date, class_id, include_adjacent_dates=False, students=None, version=None):
+        """
+        Get scores for all students in a class on a specific lesson date, served from the
+        lesson sheet cache while the class's data version is unchanged. The returned dict
+        may be shared with other callers and must not be modified.
+        Queued write-behind edits of the lesson are applied on top of the cached sheet.
+        Callers that already hold the class roster or data version can pass them in.
+        See load_scores_by_date for the other arguments and the result.
+        """
+        if version is None:
+            version = get_class_version(self.db_session, class_id)
+        key = (class_id, lesson_date, include_adjacent_dates)
+        cached = lesson_sheet_cache.get(key, is_valid=lambda entry: entry[0] == version)
+        if cached is not None:
+            sheet = cached[1]
+        else:
+            sheet = self.load_scores_by_date(lesson_date, class_id, include_adjacent_dates, students)
+            lesson_sheet_cache.set(key, (version, sheet))
+
+        pending = score_queue.pending_for(class_id, lesson_date)
+        if pending is not None:
+            sheet = self.overlay_pending_scores(sheet, pending, class_id, lesson_date, students)
+        return sheet
+
+    def overlay_pending_scores(self, sheet, pending, class_id, lesson_date, students=None):
+        """
+        A copy of a lesson sheet with the write-behind edits that are not written yet
+        applied, so a teacher sees their own edits right after saving.
+        """
+        criteria_names = {criterion['id']: criterion['name'] for criterion in self.load_score_labels()}
+        scores = {entry["student_id"]: dict(entry, scores=dict(entry["scores"])) for entry in sheet["scores"]}
+        student_names = None
+        for (student_id, criteria_id), (value, notes) in pending.cells.items():
+            if criteria_id not in criteria_names:
+                continue
+            entry = scores.get(student_id)
+            if entry is None:
+                if student_names is None:
+                    student_names = {student['id']: student['name'] for student in (students or self.get_students_by_class(class_id))}
+                entry = scores[student_id] = {
+                    "student_id": student_id,
+                    "student_name": student_names.get(student_id, "Unknown"),
+                    "lesson_date": lesson_date,
+                    "scores": {}
+                }
+            name = criteria_names[criteria_id]
+            if notes is KEEP_NOTES:
+                notes = entry["scores"].get(name, {}).get("notes")
+            entry["scores"][name] = {"value": value, "notes": notes}
+
+        overlaid = dict(sheet, scores=list(scores.values()))
+        if pending.lesson_subject is not None:
+            overlaid["lesson_subject"] = pending.lesson_subject
+        if pending.lesson_activity is not None:
+            overlaid["lesson_activity"] = pending.lesson_activity
+        return overlaid
+
+    def load_scores_by_date(self, lesson_date, class_id, include_adjacent_dates=False, students=None):
         """
         Get scores for all students in a class on a specific lesson date.
         Optionally include scores for adjacent dates.
@@ -172,6 +273,7 @@ class DataManager:
             lesson_date (str): The date of the lesson in 'YYYY-MM-DD' format.
             class_id (int): The ID of the class.
             include_adjacent_dates (bool): Whether to include previous and next lesson dates.
+            students (list, optional): The class's active students, as returned by get_students_by_class.
 
         Returns:
             dict: A dictionary containing scores for all students and optional adjacent dates.
@@ -181,22 +283,26 @@ class DataManager:
             lesson_date_obj = datetime.strptime(lesson_date, '%Y-%m-%d').date()
 
             # Step 1: Fetch all active students in the class using the helper function
-            students = self.get_students_by_class(class_id)
+            if students is None:
+                students = self.get_students_by_class(class_id)
             student_ids = [student['id'] for student in students]
 
             # Step 2: Query all scores for the specified students and date
+            score_table = score_rows()
             scores_query = (
-                self.db_session.query(Score)
+                self.db_session.query(score_table.c.student_id, score_table.c.criteria_id, score_table.c.value, score_table.c.notes)
                 .filter(
-                    Score.student_id.in_(student_ids),
-                    Score.lesson_date == lesson_date_obj
+                    score_table.c.student_id.in_(student_ids),
+                    score_table.c.lesson_date == lesson_date_obj
                 )
-                .join(Criteria)  # Join with Criteria to fetch criterion metadata
             )
+            criteria_names = {criterion['id']: criterion['name'] for criterion in self.load_score_labels()}
 
             # Step 3: Group scores by student and lesson date, and flatten scores structure
             scores_by_student = {}
             for score in scores_query.all():
+                if score.criteria_id not in criteria_names:
+                    continue
                 student_id = score.student_id
                 if student_id not in scores_by_student:
                     scores_by_student[student_id] = {
@@ -210,7 +316,7 @@ class DataManager:
                     }
 
                 # Add each criterion as a separate key in the 'scores' dictionary
-                scores_by_student[student_id]["scores"][score.criteria.name] = {
+                scores_by_student[student_id]["scores"][criteria_names[score.criteria_id]] = {
                     "value": score.value,
                     "notes": score.notes
                 }
@@ -227,25 +333,10 @@ class DataManager:
 
             # Step 4: Include adjacent dates if required
             if include_adjacent_dates:
-                # Query distinct lesson dates for the class
-                all_dates_query = (
-                    self.db_session.query(Score.lesson_date)
-                    .filter(Score.student_id.in_(student_ids))
-                    .distinct()
-                    .order_by(Score.lesson_date)
-                )
-                all_dates = [row.lesson_date for row in all_dates_query.all()]
-                previous_date = next_date = None
-
-                # Locate the current lesson_date in the sorted list
-                if lesson_date_obj not in all_dates:
-                    all_dates.append(lesson_date_obj)
-                    all_dates.sort()
-                lesson_date_index = all_dates.index(lesson_date_obj)
-                if lesson_date_index > 0:
-                    previous_date = all_dates[lesson_date_index - 1].isoformat()
-                if lesson_date_index + 1 < len(all_dates):
-                    next_date = all_dates[lesson_date_index + 1].isoformat()
+                # Neighbouring lessons come from the class's lesson calendar (lesson_info)
+                previous_lesson, next_lesson = get_adjacent_lesson_dates(self.db_session, class_id, lesson_date_obj)
+                previous_date = previous_lesson.isoformat() if previous_lesson else None
+                next_date = next_lesson.isoformat() if next_lesson else None
 
                 return {
                     "scores": scores,
@@ -261,6 +352,47 @@ class DataManager:
         except SQLAlchemyError as e:
             raise ValueError(f"Database error: Unable to fetch scores. {str(e)}")
 
+    def get_lesson_bundle(self, class_id, lesson_date, start_date=None, end_date=None, include_lessons=True):
+        """
+        Everything the attendance page needs for one lesson, built in one session with the
+        roster, criteria and data version looked up once: the class, its active students,
+        the score criteria, the lessons in [start_date, end_date], and the lesson sheet of
+        `lesson_date` together with the sheets of its previous and next lessons, so that
+        stepping to a neighbouring lesson needs no request.
+
+        Args:
+            class_id (int): The ID of the class.
+            lesson_date (str): The selected lesson date in 'YYYY-MM-DD' format.
+            start_date, end_date (str, optional): Range of the lesson list.
+            include_lessons (bool): Whether to include the lesson list.
+
+        Returns:
+            dict: class_id, class_name, version, lesson_date, students, criteria, lessons
+            (or None) and sheets, a dict of lesson sheets by date.
+        """
+        version = get_class_version(self.db_session, class_id)
+        selected_class = self.get_class_by_id(class_id)
+        students = self.get_students_by_class(class_id)
+
+        sheet = self.get_scores_by_date(lesson_date, class_id, True, students, version)
+        sheets = {lesson_date: sheet}
+        for adjacent_date in (sheet["previous_date"], sheet["next_date"]):
+            if adjacent_date:
+                sheets[adjacent_date] = self.get_scores_by_date(adjacent_date, class_id, True, students, version)
+
+        return {
+            "class_id": class_id,
+            "class_name": selected_class["name"] if selected_class else None,
+            "version": version,
+            "lesson_date": lesson_date,
+            "students": students,
+            "criteria": self.load_score_labels(),
+            "lessons": get_lessons_in_range(self.db_session, class_id, start_date, end_date) if include_lessons else None,
+            "lessons_start": start_date,
+            "lessons_end": end_date,
+            "sheets": sheets,
+        }
+
     # a function to delete the whole lesson scores for a specific date and class id
     def delete_lesson(self, lesson_date, class_id):
         """
@@ -269,14 +401,25 @@ class DataManager:
         try:
             # Convert string date to a datetime object
             lesson_date_obj = datetime.strptime(lesson_date, '%Y-%m-%d').date()
+            if is_archived(self.db_session, lesson_date_obj):
+                return {"status": "error", "message": archived_lesson_message(lesson_date_obj)}
+            # queued edits of the lesson must not bring it back
+            score_queue.discard(class_id, lesson_date_obj.isoformat())
 
             # get students for this class
             students = self.get_students_by_class(class_id)
             student_ids = [student['id'] for student in students]
             # Delete all scores for the specified lesson date and class ID
-            self.db_session.query(Score).filter(Score.lesson_date==lesson_date_obj, Score.student_id.in_(student_ids)).delete()
+            delete_lesson_scores(self.db_session, student_ids, lesson_date_obj)
             # Delete lesson info
             self.db_session.query(LessonInfo).filter_by(lesson_date=lesson_date_obj, class_id=class_id).delete()
+            refresh_rollup(self.db_session, [class_id], [lesson_date_obj])
+            # A removed lesson can break or join streaks, so recount them for the class
+            attendance_criteria_id = next(
+                (c['id'] for c in self.load_score_labels() if c['name'] == ATTENDANCE_CRITERION_NAME), None)
+            if attendance_criteria_id and student_ids:
+                rebuild_streaks(self.db_session, attendance_criteria_id, student_ids)
+            self.mark_classes_changed([class_id])
             self.db_session.commit()
             return {"status": "success", "message": "Lesson scores deleted successfully."}
         except SQLAlchemyError as e:
@@ -298,82 +441,267 @@ class DataManager:
         try:
             # Convert string date to a datetime object
             lesson_date_obj = datetime.strptime(lesson_date, '%Y-%m-%d').date()
+            if is_archived(self.db_session, lesson_date_obj):
+                return {"status": "error", "message": archived_lesson_message(lesson_date_obj)}
 
-            criteria_map = {c.name: c.id for c in self.db_session.query(Criteria).all()}
-            existing_scores_query = (
-                self.db_session.query(Score)
-                .filter(Score.student_id.in_(students_score_data.keys()), Score.lesson_date == lesson_date_obj)
-                .all()
-            )
-            existing_scores_map = {
-                (score.student_id, score.criteria_id): score
-                for score in existing_scores_query
-            }
-
-            scores_to_insert = []
-            scores_to_update = []
+            criteria_map = {c['name']: c['id'] for c in self.load_score_labels()}
+            attendance_criteria_id = criteria_map.get(ATTENDANCE_CRITERION_NAME)
 
+            # (student_id, criteria_id) -> (value, notes) for the whole lesson sheet
+            sheet = {}
             for student_id, scores_data in students_score_data.items():
                 for criterion_name, criteria_data in scores_data.items():
                     criteria_id = criteria_map.get(criterion_name)
                     if not criteria_id:
                         continue
-
-                    existing_score = existing_scores_map.get((student_id, criteria_id))
-                    if existing_score:
-                        if (existing_score.value != criteria_data.get(
-                                'value') or existing_score.notes != criteria_data.get('notes')):
-                            existing_score.value = criteria_data.get('value')
-                            existing_score.notes = criteria_data.get('notes')
-                            scores_to_update.append(existing_score)
-                    else:
-                        new_score = Score(
-                            student_id=student_id,
-                            lesson_date=lesson_date_obj,
-                            criteria_id=criteria_id,
-                            value=criteria_data.get('value'),
-                            notes=criteria_data.get('notes') if criteria_data.get('notes') else None
-                        )
-                        scores_to_insert.append(new_score)
+                    sheet[(student_id, criteria_id)] = (criteria_data.get('value'), criteria_data.get('notes'))
 
             # save or update lesson info: subject and activity
-            lesson_info = self.db_session.query(LessonInfo).filter_by(lesson_date=lesson_date_obj, class_id=class_id).first()
-            if lesson_info:
-                lesson_info.lesson_subject = lesson_subject
-                lesson_info.lesson_activity = lesson_activity
-            else:
-                lesson_info = LessonInfo(lesson_date=lesson_date_obj, class_id=class_id, lesson_subject=lesson_subject, lesson_activity=lesson_activity)
-                self.db_session.add(lesson_info)
+            self.upsert_lesson_info(class_id, lesson_date_obj, lesson_subject, lesson_activity)
 
-
-            if scores_to_update:
-                self.db_session.bulk_save_objects(scores_to_update)
-            if scores_to_insert:
-                self.db_session.bulk_save_objects(scores_to_insert)
+            self.write_lesson_scores(class_id, lesson_date_obj, sheet, attendance_criteria_id)
+            self.mark_classes_changed([class_id])
             self.db_session.commit()
             return {"status": "success", "message": "Scores saved successfully."}
         except SQLAlchemyError as e:
             self.db_session.rollback()
             raise ValueError(f"Database error: Unable to save scores. {str(e)}")
 
-    def get_monthly_report(self, student_id, class_id, month, year):
-        scoresData = self.get_scores_by_student_and_month(student_id, month, year)
-        if not scoresData:
-            return None
+    def save_score_changes(self, class_id, lesson_date, changes, lesson_subject=None, lesson_activity=None):
+        """
+        Save only the edited cells of a lesson sheet. Every change is checked against the
+        cached criteria and class roster, and only the changed rows are written, so the cost
+        follows the number of edits rather than the size of the class.
 
-        # for each score type, calculate the total score for the month
-        aggregated_scores = {score_type['name']: 0 for score_type in self.load_score_labels()}
-        for score in scoresData:
-            for criterion in score['scores']:
-                aggregated_scores[criterion['criteria_name']] += 1 if criterion['value'] else 0
+        Args:
+            lesson_date (str): The date of the lesson in 'YYYY-MM-DD' format.
+            class_id (int): The ID of the class.
+            changes (list): Dictionaries with "student_id", "criterion" (criterion name), "value" (boolean)
+                and optionally "notes" (string or null); without "notes" the stored notes are kept.
+            lesson_subject, lesson_activity (str, optional): New subject and activity of the lesson.
 
-        # calculate the total number of lessons in the month
+        Returns:
+            dict: "status", "message", the number of rows "written" and the class's data "version"
+            after the save. The status is "error" when a change is invalid; nothing is saved then.
+            With write-behind enabled the status is "queued" and "queued" counts the accepted
+            changes; they are written by the flush thread.
+        """
+        try:
+            lesson_date_obj = datetime.strptime(lesson_date, '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            return {"status": "error", "message": "Invalid date format. Use YYYY-MM-DD."}
+        if is_archived(self.db_session, lesson_date_obj):
+            return {"status": "error", "message": archived_lesson_message(lesson_date_obj)}
+        criteria_map = {c['name']: c['id'] for c in self.load_score_labels()}
+        sheet = self.parse_score_changes(class_id, changes, criteria_map)
+        if isinstance(sheet, str):
+            return {"status": "error", "message": sheet}
+
+        if score_queue.enabled:
+            # Acknowledge now; the flush thread writes the coalesced edits of the lesson later
+            score_queue.submit(class_id, lesson_date_obj.isoformat(), sheet, lesson_subject, lesson_activity)
+            return {
+                "status": "queued",
+                "message": f"{len(sheet)} scores queued.",
+                "queued": len(sheet),
+                "version": get_class_version(self.db_session, class_id)
+            }
 
-        total_lessons = count_fridays(year, month)
-        return {
-            score_type: round((aggregated_score / total_lessons) * 100, 2)
-            for score_type, aggregated_score in aggregated_scores.items()
+        try:
+            written = self.write_pending_lesson(class_id, lesson_date_obj, sheet, lesson_subject, lesson_activity, criteria_map)
+            version = get_class_version(self.db_session, class_id)
+            self.db_session.commit()
+            return {
+                "status": "success",
+                "message": f"{len(written)} scores saved.",
+                "written": len(written),
+                "version": version
+            }
+        except SQLAlchemyError as e:
+            self.db_session.rollback()
+            raise ValueError(f"Database error: Unable to save scores. {str(e)}")
+
+    def parse_score_changes(self, class_id, changes, criteria_map):
+        """
+        Check the changes of save_score_changes and turn them into a
+        (student_id, criteria_id) -> (value, notes) sheet, with KEEP_NOTES as the notes of
+        changes that leave the stored notes alone. Returns an error message instead when a
+        change is invalid.
+        """
+        if not isinstance(changes, list):
+            return "changes must be a list."
+        roster = self.get_class_roster_ids(class_id)
+        sheet = {}
+        for change in changes:
+            if not isinstance(change, dict):
+                return "Every change must be an object."
+            student_id = change.get('student_id')
+            criteria_id = criteria_map.get(change.get('criterion'))
+            value = change.get('value')
+            notes = change.get('notes', KEEP_NOTES)
+            if student_id not in roster:
+                return f"Student {student_id} is not an active student of class {class_id}."
+            if criteria_id is None:
+                return f"Unknown criterion {change.get('criterion')!r}."
+            if not isinstance(value, bool):
+                return "value must be true or false."
+            if notes is not KEEP_NOTES and notes is not None and (not isinstance(notes, str) or len(notes) > 255):
+                return "notes must be a string of at most 255 characters."
+            sheet[(student_id, criteria_id)] = (value, notes)
+        return sheet
+
+    def write_pending_lesson(self, class_id, lesson_date, sheet, lesson_subject, lesson_activity, criteria_map):
+        """
+        Write the edits of one lesson, resolving KEEP_NOTES to the stored notes, and mark the
+        class changed if anything was written. Returns the written keys. Does not commit.
+        """
+        keep_notes = [key for key, (_, notes) in sheet.items() if notes is KEEP_NOTES]
+        if keep_notes:
+            stored_scores = load_lesson_scores(self.db_session, {student_id for student_id, _ in keep_notes}, lesson_date)
+            sheet = dict(sheet)
+            for key in keep_notes:
+                sheet[key] = (sheet[key][0], stored_scores.get(key, (None, None))[1])
+
+        # a lesson needs its lesson_info row to show up in the lesson calendar
+        self.upsert_lesson_info(class_id, lesson_date, lesson_subject, lesson_activity)
+        written = self.write_lesson_scores(class_id, lesson_date, sheet, criteria_map.get(ATTENDANCE_CRITERION_NAME))
+        if written or lesson_subject is not None or lesson_activity is not None:
+            self.mark_classes_changed([class_id])
+        return written
+
+    def flush_pending_lessons(self, batch):
+        """
+        Write a batch of coalesced write-behind lessons, [((class_id, 'YYYY-MM-DD'), PendingLesson)],
+        in one transaction. Raises ValueError when nothing was written, also when a lesson's
+        school year was archived after its edits were queued.
+        """
+        lesson_dates = [datetime.strptime(lesson_date, '%Y-%m-%d').date() for (_, lesson_date), _ in batch]
+        for lesson_date_obj in lesson_dates:
+            if is_archived(self.db_session, lesson_date_obj):
+                raise ValueError(archived_lesson_message(lesson_date_obj))
+        try:
+            criteria_map = {c['name']: c['id'] for c in self.load_score_labels()}
+            for ((class_id, _), lesson), lesson_date_obj in zip(batch, lesson_dates):
+                self.write_pending_lesson(class_id, lesson_date_obj, lesson.cells, lesson.lesson_subject, lesson.lesson_activity, criteria_map)
+            self.db_session.commit()
+        except SQLAlchemyError as e:
+            self.db_session.rollback()
+            raise ValueError(f"Database error: Unable to write queued scores. {str(e)}")
+
+    def write_lesson_scores(self, class_id, lesson_date, sheet, attendance_criteria_id):
+        """
+        Write (student_id, criteria_id) -> (value, notes) scores of one lesson and keep the
+        rollup and attendance streaks in step with the rows actually written. Does not commit.
+        """
+        # Only new or changed scores are written and reported back
+        written = write_scores(self.db_session, lesson_date, sheet)
+        if written:
+            refresh_rollup(self.db_session, [class_id], [lesson_date])
+        attendance_changes = {
+            student_id: sheet[(student_id, criteria_id)][0]
+            for student_id, criteria_id in written
+            if criteria_id == attendance_criteria_id
         }
+        if attendance_changes:
+            record_attendance(self.db_session, lesson_date, attendance_changes, attendance_criteria_id)
+        return written
+
+    def upsert_lesson_info(self, class_id, lesson_date, lesson_subject=None, lesson_activity=None):
+        """
+        Insert or update the subject and activity of a lesson with one statement. None keeps
+        the stored value (empty for a new lesson). Does not commit.
+        """
+        stmt = insert(LessonInfo).values(
+            class_id=class_id,
+            lesson_date=lesson_date,
+            lesson_subject=lesson_subject or '',
+            lesson_activity=lesson_activity or ''
+        )
+        updates = {}
+        if lesson_subject is not None:
+            updates["lesson_subject"] = stmt.excluded.lesson_subject
+        if lesson_activity is not None:
+            updates["lesson_activity"] = stmt.excluded.lesson_activity
+        if updates:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[LessonInfo.class_id, LessonInfo.lesson_date],
+                set_=updates,
+                where=or_(*[getattr(LessonInfo, column).is_distinct_from(value) for column, value in updates.items()])
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[LessonInfo.class_id, LessonInfo.lesson_date])
+        self.db_session.execute(stmt)
+
+    def get_monthly_report(self, student_id, class_id, month, year):
+        return self.get_monthly_reports(month, year, student_ids=[student_id]).get(student_id)
+
+    def get_monthly_reports(self, month, year, class_id=None, student_ids=None):
+        """
+        Monthly report percentages for many students, computed with one grouped query
+        instead of one get_monthly_report call per student.
+
+        Args:
+            month (int): The month of the report.
+            year (int): The year of the report.
+            class_id (int, optional): Only students currently in this class.
+            student_ids (list, optional): Only these students.
+
+        Returns:
+            dict: student_id -> {criterion name: percentage of the month's lessons}.
+            Students without scores in the month are left out.
+        """
+        try:
+            # Months of archived school years are read from the archive files
+            archived, live = split_range(self.db_session, *month_bounds(year, month))
+            rows = []
+            if archived:
+                archived_counts = {}
+                for student_id, student_class_id, _, criteria_id, value in archived_scores(self.db_session, archived, student_ids=student_ids, class_id=class_id).rows():
+                    key = (student_id, student_class_id, criteria_id)
+                    archived_counts[key] = archived_counts.get(key, 0) + (1 if value else 0)
+                rows = [key + (true_scores,) for key, true_scores in archived_counts.items()]
+            if live:
+                score_table = score_rows()
+                query = (
+                    self.db_session.query(
+                        score_table.c.student_id,
+                        Student.class_id,
+                        score_table.c.criteria_id,
+                        func.count(case((score_table.c.value.is_(True), 1)))
+                    )
+                    .join(Student, Student.id == score_table.c.student_id)
+                    .filter(score_table.c.lesson_date >= live[0], score_table.c.lesson_date <= live[1])
+                )
+                if class_id is not None:
+                    query = query.filter(Student.class_id == class_id)
+                if student_ids is not None:
+                    query = query.filter(score_table.c.student_id.in_(list(student_ids)))
+                rows += query.group_by(score_table.c.student_id, Student.class_id, score_table.c.criteria_id).all()
+
+            # for each student and score type, count the lessons with a true score in the month
+            score_labels = self.load_score_labels()
+            criteria_names = {criterion['id']: criterion['name'] for criterion in score_labels}
+            aggregated_scores = {}
+            student_classes = {}
+            for student_id, student_class_id, criteria_id, true_scores in rows:
+                if criteria_id not in criteria_names:
+                    continue
+                student_classes[student_id] = student_class_id
+                student_scores = aggregated_scores.setdefault(student_id, {criterion['name']: 0 for criterion in score_labels})
+                student_scores[criteria_names[criteria_id]] += true_scores
+
+            # the number of lessons each class was expected to have in the month, from the school calendar
+            expected_lessons = count_expected_lessons_by_class(self.db_session, set(student_classes.values()), *month_bounds(year, month))
+            reports = {}
+            for student_id, student_scores in aggregated_scores.items():
+                total_lessons = expected_lessons[student_classes[student_id]]
+                reports[student_id] = {
+                    score_type: round((aggregated_score / total_lessons) * 100, 2) if total_lessons else 0.0
+                    for score_type, aggregated_score in student_scores.items()
+                }
+            return reports
+        except SQLAlchemyError as e:
+            raise ValueError(f"Database error: Unable to compute monthly reports. {str(e)}")
 
     def load_teachers(self):
         """
@@ -398,8 +726,12 @@ class DataManager:
         Returns:
             List of dictionaries, each containing a teacher's ID, name, and their assigned classes.
         """
-        # Query all teachers and their relationships with classes
-        teachers_with_classes = self.db_session.query(Teacher).all()
+        # Query all teachers with their classes in one statement instead of two lazy loads per teacher
+        teachers_with_classes = (
+            self.db_session.query(Teacher)
+            .options(joinedload(Teacher.class_teachers).joinedload(ClassTeacher.class_))
+            .all()
+        )
 
         result = []
         for teacher in teachers_with_classes:
@@ -509,6 +841,7 @@ class DataManager:
             new_teacher = Teacher(name=teacher_name, password=encoded_password, username=teacher_username)
             self.db_session.add(new_teacher)
             self.db_session.commit()
+            reference_cache.invalidate_where(lambda key: key[0] == "teacher_name")
             return {"status": "success", "message": f"Teacher '{teacher_name}' added successfully."}
         except SQLAlchemyError as e:
             self.db_session.rollback()
@@ -540,7 +873,9 @@ class DataManager:
             # Assign the teacher to the class
             new_class_teacher = ClassTeacher(teacher_id=assigned_teacher_id, class_id=new_class.id)
             self.db_session.add(new_class_teacher)
+            self.mark_classes_changed([new_class.id])
             self.db_session.commit()
+            reference_cache.invalidate_where(lambda key: key[0] == "class")
             return {"status": "success",
                     "message": f"Class '{class_name}' added successfully and assigned to teacher {assigned_teacher_id}."}
         except SQLAlchemyError as e:
@@ -575,6 +910,7 @@ class DataManager:
                 active=True
             )
             self.db_session.add(new_student)
+            self.mark_classes_changed([class_id])
             self.db_session.commit()
             return {"status": "success", "message": f"Student '{student_name}' added successfully."}
         except SQLAlchemyError as e:
@@ -590,6 +926,8 @@ class DataManager:
             if not student:
                 raise ValueError(f"Student with ID {student_id} not found.")
 
+            previous_class_id = student.class_id
+
             # Update student details
             student.name = student_name
             student.class_id = class_id
@@ -603,6 +941,11 @@ class DataManager:
             else:
                 student.inactive_date = None
 
+            if previous_class_id != class_id:
+                # The student's scores now count towards the new class
+                refresh_rollup(self.db_session, [previous_class_id, class_id], get_student_lesson_dates(self.db_session, student_id))
+
+            self.mark_classes_changed([previous_class_id, class_id])
             self.db_session.commit()
             return {"status": "success", "message": f"Student '{student_name}' updated successfully."}
         except SQLAlchemyError as e:
@@ -636,6 +979,8 @@ class DataManager:
             if not student:
                 raise ValueError(f"Student with ID {student_id} not found.")
 
+            previous_class_id = student.class_id
+
             # Update student details
             student.name = name
             student.phone = phone
@@ -649,6 +994,11 @@ class DataManager:
             else:
                 student.inactive_date = None
 
+            if previous_class_id != class_id:
+                # The student's scores now count towards the new class
+                refresh_rollup(self.db_session, [previous_class_id, class_id], get_student_lesson_dates(self.db_session, student_id))
+
+            self.mark_classes_changed([previous_class_id, class_id])
             self.db_session.commit()
             return {"status": "success", "message": f"Student '{name}' updated successfully."}
         except SQLAlchemyError as e:
@@ -670,6 +1020,8 @@ class DataManager:
             else:
                 student.inactive_date = None
 
+            # Deactivated students keep their scores and class, so the attendance rollup is unaffected
+            self.mark_classes_changed([student.class_id])
             self.db_session.commit()
             return {"status": "success", "message": f"Student status updated successfully."}
         except SQLAlchemyError as e:
@@ -692,13 +1044,19 @@ class DataManager:
         This will also delete all associated scores.
         """
         try:
-            # First delete all scores associated with this student
-            self.db_session.query(Score).filter_by(student_id=student_id).delete()
+            # Remember which lessons the student's scores counted towards
+            lesson_dates = get_student_lesson_dates(self.db_session, student_id)
+
+            # First delete all scores and streak state associated with this student
+            delete_student_scores(self.db_session, student_id)
+            self.db_session.query(StudentStreak).filter_by(student_id=student_id).delete()
 
             # Then delete the student record
             student = self.db_session.query(Student).filter_by(id=student_id).first()
             if student:
                 self.db_session.delete(student)
+                refresh_rollup(self.db_session, [student.class_id], lesson_dates)
+                self.mark_classes_changed([student.class_id])
                 self.db_session.commit()
                 return {"status": "success", "message": f"Student with ID {student_id} permanently deleted."}
             else:
@@ -718,30 +1076,4 @@ class DataManager:
         """
         Return a list of lessons (date, subject, activity) for a class in a date range.
         """
-        from models import LessonInfo
-        query = self.db_session.query(LessonInfo).filter(LessonInfo.class_id == class_id)
-        if start_date:
-            query = query.filter(LessonInfo.lesson_date >= start_date)
-        if end_date:
-            query = query.filter(LessonInfo.lesson_date <= end_date)
-        lessons = query.order_by(LessonInfo.lesson_date.desc()).all()
-        return [
-            {
-                "date": lesson.lesson_date.isoformat(),
-                "subject": lesson.lesson_subject,
-                "activity": lesson.lesson_activity
-            }
-            for lesson in lessons
-        ]
-
-def count_fridays(year: int, month: int):
-    # Get the number of days in the month
-    days_in_month = calendar.monthrange(year, month)[1]
-
-    # Count Fridays
-    fridays = 0
-    for day in range(1, days_in_month + 1):
-        if datetime(year, month, day).weekday() == 4:  # Friday is 4 (Monday is 0)
-            fridays += 1
-
-    return fridays
+        return get_lessons_in_range(self.db_session, class_id, start_date, end_date)
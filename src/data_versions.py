@@ -0,0 +1,112 @@
+import hashlib
+from functools import wraps
+from datetime import date
+from typing import Iterable, Optional
+
+from flask import g, request, make_response
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Class, ClassDataVersion, Student
+from write_behind import score_queue
+
+
+def bump_class_versions(db_session, class_ids: Iterable[int]):
+    """
+    Increment the data version of each class. Runs inside the caller's transaction, so
+    the new version becomes visible together with the change it describes.
+    """
+    class_ids = sorted({class_id for class_id in class_ids if class_id is not None})
+    if not class_ids:
+        return
+    stmt = insert(ClassDataVersion).values([{"class_id": class_id, "version": 1} for class_id in class_ids])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ClassDataVersion.class_id],
+        set_={"version": ClassDataVersion.version + 1},
+    )
+    db_session.execute(stmt)
+
+
+def bump_all_class_versions(db_session):
+    """
+    Increment the data version of every class, for maintenance commands that change what
+    the API returns for the whole school (rollup, streaks, score layout, school calendar).
+    Runs inside the caller's transaction.
+    """
+    bump_class_versions(db_session, [row[0] for row in db_session.query(Class.id).all()])
+
+
+def get_class_version(db_session, class_id: int) -> int:
+    version = db_session.query(ClassDataVersion.version).filter(ClassDataVersion.class_id == class_id).scalar()
+    return version or 0
+
+
+def get_request_class_version(db_session, class_id: int) -> int:
+    """
+    The class's data version as conditional_on_data_version read it for this request's
+    ETag, so the view answers with the data the ETag names without reading it again.
+    """
+    versions = g.setdefault("class_data_versions", {})
+    if class_id not in versions:
+        versions[class_id] = get_class_version(db_session, class_id)
+    return versions[class_id]
+
+
+def get_school_version(db_session) -> str:
+    # Versions only grow, so their sum changes with every bump; the count covers new classes
+    total, classes = db_session.query(func.coalesce(func.sum(ClassDataVersion.version), 0), func.count()).one()
+    return f"{total}.{classes}"
+
+
+def _request_class_id(kwargs) -> Optional[int]:
+    class_id = kwargs.get("class_id")
+    if class_id is None and request.args.get("student_id") is not None:
+        # A student's data changes with their own class, whatever class_id the request names
+        try:
+            student_id = int(request.args["student_id"])
+        except ValueError:
+            return None
+        return db.session.query(Student.class_id).filter(Student.id == student_id).scalar()
+    if class_id is None:
+        class_id = request.args.get("class_id")
+    try:
+        return int(class_id) if class_id is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def conditional_on_data_version(view):
+    """
+    Answer GET requests with a strong ETag built from the data version of the requested
+    class (from the URL, the class of the student_id query argument, or the class_id query
+    argument), or of the whole school when the view is not about a single class. The URL and today's date are folded in, since views
+    fall back to today when no date is given. A matching If-None-Match gets a 304 without
+    running the view.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        class_id = _request_class_id(kwargs)
+        if class_id is not None:
+            version = f"class{class_id}.v{get_request_class_version(db.session, class_id)}"
+            if score_queue.enabled:
+                # Queued edits show in lesson sheets before they reach the data version
+                version += f".p{score_queue.pending_token(class_id)}"
+        else:
+            version = f"school.v{get_school_version(db.session)}"
+        # The URL (with its query string) picks the payload, the version says whether it is current.
+        # Views default missing dates to today, so the day is part of the key as well
+        url_digest = hashlib.sha1(f"{date.today().isoformat()} {request.full_path}".encode()).hexdigest()[:12]
+        etag = f"{version}.{url_digest}"
+
+        if request.if_none_match.contains(etag):
+            response = make_response("", 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        # Let browsers keep the payload but always revalidate it
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    return wrapper
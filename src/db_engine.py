@@ -0,0 +1,251 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+# DB_POOL_MODE:
+# "queue": each worker keeps a pool of connections sized from its thread count (default).
+# "pgbouncer": connections go through a transaction-pooling pgbouncer (e.g. Supabase's
+#              port 6543), so the app keeps none of its own and sets timeouts per transaction.
+QUEUE = "queue"
+PGBOUNCER = "pgbouncer"
+
+# Statement timeouts (milliseconds, 0 = none) per class of route. Interactive pages must
+# answer quickly; reports scan more rows; background work (CLI, write-behind flushes) runs
+# outside requests.
+INTERACTIVE = "interactive"
+REPORT = "report"
+BACKGROUND = "background"
+DEFAULT_STATEMENT_TIMEOUTS = {INTERACTIVE: 5000, REPORT: 30000, BACKGROUND: 0}
+
+# Blueprints whose routes are all reports
+REPORT_BLUEPRINTS = {"performance_api", "attendance_matrix"}
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def gunicorn_workers() -> int:
+    return _env_int("GUNICORN_WORKERS", 2)
+
+
+def gunicorn_threads() -> int:
+    return _env_int("GUNICORN_THREADS", 2)
+
+
+def statement_timeouts() -> Dict[str, int]:
+    return {
+        route_class: _env_int(f"STATEMENT_TIMEOUT_{route_class.upper()}_MS", default)
+        for route_class, default in DEFAULT_STATEMENT_TIMEOUTS.items()
+    }
+
+
+class _CheckoutTimingMixin:
+    """
+    Measures how long pool checkouts wait for a free connection, so pool exhaustion shows
+    up as a number instead of unexplained latency.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slow_wait = _env_int("DB_POOL_SLOW_WAIT_MS", 100) / 1000
+        self._timing_lock = threading.Lock()
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.checkout_timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._timing_lock:
+                self.checkout_timeouts += 1
+            logger.warning("database pool exhausted: no connection within %ss (%s)", self._timeout, self.status())
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._timing_lock:
+                self.checkouts += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+                if waited >= self.slow_wait:
+                    self.slow_checkouts += 1
+
+
+class TimedQueuePool(_CheckoutTimingMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options() -> Dict:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the configured pool mode.
+
+    In queue mode every worker gets one connection per gunicorn thread, plus one for the
+    write-behind flush thread, and DB_MAX_OVERFLOW (default: the thread count) extra ones
+    for bursts. Connections are pinged before use and recycled after DB_POOL_RECYCLE
+    seconds, and a checkout gives up after DB_POOL_TIMEOUT seconds. The interactive
+    statement timeout is the connections' default.
+    """
+    if os.getenv("DB_POOL_MODE", QUEUE) == PGBOUNCER:
+        # pgbouncer in transaction mode rejects startup options; timeouts are set per transaction
+        return {"poolclass": NullPool}
+
+    threads = gunicorn_threads()
+    pool_size = _env_int("DB_POOL_SIZE", threads + 1)
+    max_overflow = _env_int("DB_MAX_OVERFLOW", threads)
+    max_connections = _env_int("DB_MAX_CONNECTIONS", 0)
+    if max_connections and gunicorn_workers() * (pool_size + max_overflow) > max_connections:
+        logger.warning(
+            "%d workers x (pool %d + overflow %d) can open more than DB_MAX_CONNECTIONS=%d connections",
+            gunicorn_workers(), pool_size, max_overflow, max_connections,
+        )
+    options = {
+        "poolclass": TimedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 10),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": True,
+    }
+    interactive_timeout = statement_timeouts()[INTERACTIVE]
+    if interactive_timeout:
+        options["connect_args"] = {"options": f"-c statement_timeout={interactive_timeout}"}
+    return options
+
+
+def async_database_url(url: str) -> str:
+    """
+    DATABASE_URL for the asyncpg driver of the async serving mode (asgi.py).
+    """
+    url = make_url(url)
+    query = dict(url.query)
+    if "sslmode" in query:
+        # asyncpg names libpq's sslmode "ssl"
+        query["ssl"] = query.pop("sslmode")
+    return url.set(drivername="postgresql+asyncpg", query=query).render_as_string(hide_password=False)
+
+
+def async_engine_options() -> Dict:
+    """
+    Engine options for the async serving mode. One event loop serves many requests at once,
+    so its pool is sized by ASYNC_DB_POOL_SIZE and ASYNC_DB_MAX_OVERFLOW (default 10 each)
+    rather than by a thread count.
+    """
+    if os.getenv("DB_POOL_MODE", QUEUE) == PGBOUNCER:
+        # Transaction pooling cannot keep asyncpg's named prepared statements
+        return {"poolclass": NullPool, "connect_args": {"statement_cache_size": 0, "prepared_statement_cache_size": 0}}
+    options = {
+        "poolclass": TimedAsyncQueuePool,
+        "pool_size": _env_int("ASYNC_DB_POOL_SIZE", 10),
+        "max_overflow": _env_int("ASYNC_DB_MAX_OVERFLOW", 10),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 10),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": True,
+    }
+    interactive_timeout = statement_timeouts()[INTERACTIVE]
+    if interactive_timeout:
+        options["connect_args"] = {"server_settings": {"statement_timeout": str(interactive_timeout)}}
+    return options
+
+
+def statement_timeout(route_class: str):
+    """
+    Run a view under the statement timeout of `route_class` instead of its default. The
+    mark survives decorators that use functools.wraps, whichever order they are applied in.
+    """
+    def decorator(view):
+        view.route_class = route_class
+        return view
+    return decorator
+
+
+def current_route_class() -> str:
+    if not has_request_context():
+        return BACKGROUND
+    route_class = getattr(current_app.view_functions.get(request.endpoint), "route_class", None)
+    if route_class:
+        return route_class
+    return REPORT if request.blueprint in REPORT_BLUEPRINTS else INTERACTIVE
+
+
+def listen_statement_timeouts(target, connection_default: Optional[int]):
+    """
+    Set the statement timeout of every transaction of `target` (a session, session class or
+    scoped session) from the route class. Connections whose default already is the right
+    timeout skip the `SET LOCAL`; pass None when connections have no known default.
+    """
+    timeouts = statement_timeouts()
+
+    @event.listens_for(target, "after_begin")
+    def set_statement_timeout(session, transaction, connection):
+        timeout = timeouts[current_route_class()]
+        if timeout != connection_default:
+            # SET LOCAL ends with the transaction, so the pooled connection keeps its default
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+
+def connection_default_timeout(options: Dict) -> Optional[int]:
+    """
+    The statement timeout new connections start with under the given engine options.
+    """
+    if options.get("poolclass") is NullPool:
+        return None
+    return statement_timeouts()[INTERACTIVE]
+
+
+def init_engine(app, db):
+    """
+    Set the statement timeout of the app's transactions. Connections already default to the
+    interactive timeout in queue mode, so only other classes cost a `SET LOCAL`; behind
+    pgbouncer every transaction sets it.
+    """
+    listen_statement_timeouts(db.session, connection_default_timeout(app.config["SQLALCHEMY_ENGINE_OPTIONS"]))
+
+
+def pool_stats(engine) -> Dict:
+    """
+    Live state of a worker's connection pool.
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__, "mode": PGBOUNCER, "statement_timeouts_ms": statement_timeouts()}
+    stats = {
+        "pool": type(pool).__name__,
+        "mode": QUEUE,
+        "size": pool.size(),
+        "max_overflow": pool._max_overflow,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "timeout_seconds": pool.timeout(),
+        "statement_timeouts_ms": statement_timeouts(),
+    }
+    if isinstance(pool, _CheckoutTimingMixin):
+        with pool._timing_lock:
+            stats.update({
+                "checkouts": pool.checkouts,
+                "slow_checkouts": pool.slow_checkouts,
+                "checkout_timeouts": pool.checkout_timeouts,
+                "avg_wait_ms": round(pool.total_wait / pool.checkouts * 1000, 3) if pool.checkouts else None,
+                "max_wait_ms": round(pool.max_wait * 1000, 3),
+            })
+    return stats
@@ -0,0 +1,58 @@
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from models import LessonInfo
+
+
+def get_adjacent_lesson_dates(db_session, class_id: int, lesson_date: date) -> Tuple[Optional[date], Optional[date]]:
+    """
+    The class's lesson dates just before and just after `lesson_date`, in one round trip.
+    Each side is a single probe of the (class_id, lesson_date) index, however long the history.
+    """
+    previous_date = (
+        select(func.max(LessonInfo.lesson_date))
+        .where(LessonInfo.class_id == class_id, LessonInfo.lesson_date < lesson_date)
+        .scalar_subquery()
+    )
+    next_date = (
+        select(func.min(LessonInfo.lesson_date))
+        .where(LessonInfo.class_id == class_id, LessonInfo.lesson_date > lesson_date)
+        .scalar_subquery()
+    )
+    return db_session.execute(select(previous_date, next_date)).one()
+
+
+def get_lesson_dates(db_session, class_id: int, start: Optional[date] = None, end: Optional[date] = None) -> List[date]:
+    """
+    The class's lesson dates in a range, ascending.
+    """
+    q = db_session.query(LessonInfo.lesson_date).filter(LessonInfo.class_id == class_id)
+    if start:
+        q = q.filter(LessonInfo.lesson_date >= start)
+    if end:
+        q = q.filter(LessonInfo.lesson_date <= end)
+    return [row[0] for row in q.order_by(LessonInfo.lesson_date.asc()).all()]
+
+
+def get_lessons_in_range(db_session, class_id: int, start: Optional[date] = None, end: Optional[date] = None) -> List[Dict]:
+    """
+    Lessons (date, subject, activity) of a class in a range, newest first.
+    """
+    q = (
+        db_session.query(LessonInfo.lesson_date, LessonInfo.lesson_subject, LessonInfo.lesson_activity)
+        .filter(LessonInfo.class_id == class_id)
+    )
+    if start:
+        q = q.filter(LessonInfo.lesson_date >= start)
+    if end:
+        q = q.filter(LessonInfo.lesson_date <= end)
+    return [
+        {
+            "date": lesson_date.isoformat(),
+            "subject": lesson_subject,
+            "activity": lesson_activity
+        }
+        for lesson_date, lesson_subject, lesson_activity in q.order_by(LessonInfo.lesson_date.desc()).all()
+    ]
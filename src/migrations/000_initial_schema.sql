@@ -0,0 +1,67 @@
+-- Initial schema: teachers, classes, students, lessons and their scores, and the score
+-- criteria. Replaces database.sql.
+--
+-- A schema created before the migration runner already has these tables; 'flask schema
+-- upgrade' then records this migration as applied without running it.
+
+CREATE TABLE IF NOT EXISTS :"schema".teachers (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    username VARCHAR(100) NOT NULL,
+    password VARCHAR NOT NULL, -- base64-encoded
+    is_admin BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS :"schema".classes (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS :"schema".class_teachers (
+    id SERIAL PRIMARY KEY,
+    class_id INTEGER NOT NULL REFERENCES :"schema".classes (id) ON DELETE CASCADE,
+    teacher_id INTEGER NOT NULL REFERENCES :"schema".teachers (id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS :"schema".students (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    class_id INTEGER NOT NULL REFERENCES :"schema".classes (id) ON DELETE CASCADE,
+    phone VARCHAR(20),
+    parent_phone VARCHAR(20),
+    date_joined DATE,
+    active BOOLEAN DEFAULT TRUE,
+    inactive_date DATE
+);
+
+CREATE TABLE IF NOT EXISTS :"schema".criteria (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,    -- internal name of the criterion
+    label VARCHAR(255) NOT NULL    -- Arabic label shown in the app
+);
+
+CREATE TABLE IF NOT EXISTS :"schema".scores (
+    id SERIAL PRIMARY KEY,
+    student_id INTEGER NOT NULL REFERENCES :"schema".students (id) ON DELETE CASCADE,
+    lesson_date DATE NOT NULL,
+    criteria_id INTEGER NOT NULL REFERENCES :"schema".criteria (id) ON DELETE CASCADE,
+    value BOOLEAN NOT NULL DEFAULT FALSE,
+    notes VARCHAR(255)
+);
+
+CREATE TABLE IF NOT EXISTS :"schema".lesson_info (
+    id SERIAL PRIMARY KEY,
+    class_id INTEGER NOT NULL REFERENCES :"schema".classes (id) ON DELETE CASCADE,
+    lesson_date DATE NOT NULL,
+    lesson_subject VARCHAR(400) NOT NULL,
+    lesson_activity VARCHAR(400) NOT NULL
+);
+
+INSERT INTO :"schema".criteria (id, name, label) VALUES
+(1, 'attendance', 'الحضور'),
+(2, 'time', 'الالتزام بالوقت'),
+(3, 'uniform', 'اللباس الموحد'),
+(4, 'participate', 'المشاركة')
+ON CONFLICT (id) DO NOTHING;
+
+SELECT setval(pg_get_serial_sequence(':"schema".criteria', 'id'), (SELECT MAX(id) FROM :"schema".criteria));
@@ -0,0 +1,15 @@
+-- Attendance rollup: present/total score counts per class, lesson date and criterion.
+-- Maintained by DataManager writes and read by the performance API.
+--
+-- Apply with: flask schema upgrade
+-- Backfill:   flask rollup rebuild
+-- Check:      flask rollup verify
+
+CREATE TABLE IF NOT EXISTS :"schema".attendance_rollup (
+    class_id INTEGER NOT NULL REFERENCES :"schema".classes (id) ON DELETE CASCADE,
+    lesson_date DATE NOT NULL,
+    criteria_id INTEGER NOT NULL REFERENCES :"schema".criteria (id) ON DELETE CASCADE,
+    present_count INTEGER NOT NULL DEFAULT 0,
+    total_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (class_id, lesson_date, criteria_id)
+);
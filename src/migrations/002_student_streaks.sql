@@ -0,0 +1,17 @@
+-- Per-student attendance streak state, advanced by DataManager.save_scores and read by
+-- /api/performance/alerts.
+--
+-- Apply with: flask schema upgrade
+-- Backfill:   flask streaks rebuild
+
+CREATE TABLE IF NOT EXISTS :"schema".student_streaks (
+    student_id INTEGER PRIMARY KEY REFERENCES :"schema".students (id) ON DELETE CASCADE,
+    current_present_streak INTEGER NOT NULL DEFAULT 0,
+    current_absence_streak INTEGER NOT NULL DEFAULT 0,
+    longest_streak INTEGER NOT NULL DEFAULT 0,
+    last_lesson_date DATE,
+    last_lesson_present BOOLEAN
+);
+
+CREATE INDEX IF NOT EXISTS ix_student_streaks_current_absence_streak
+    ON :"schema".student_streaks (current_absence_streak);
@@ -0,0 +1,24 @@
+-- Compact score storage, used when SCORE_STORAGE=compact: one row per student per lesson
+-- with the boolean criteria packed into bitmasks (bit 1 << criteria_id), and notes only
+-- for the scores that have one.
+--
+-- Apply with: flask schema upgrade
+-- Copy data:  flask scores to-compact     (and back: flask scores to-rows)
+-- Check:      flask scores verify
+-- Then set SCORE_STORAGE=compact and run flask rollup rebuild.
+
+CREATE TABLE IF NOT EXISTS :"schema".lesson_scores (
+    student_id INTEGER NOT NULL REFERENCES :"schema".students (id) ON DELETE CASCADE,
+    lesson_date DATE NOT NULL,
+    recorded_mask INTEGER NOT NULL DEFAULT 0,
+    value_mask INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (student_id, lesson_date)
+);
+
+CREATE TABLE IF NOT EXISTS :"schema".lesson_score_notes (
+    student_id INTEGER NOT NULL REFERENCES :"schema".students (id) ON DELETE CASCADE,
+    lesson_date DATE NOT NULL,
+    criteria_id INTEGER NOT NULL REFERENCES :"schema".criteria (id) ON DELETE CASCADE,
+    notes VARCHAR(255) NOT NULL,
+    PRIMARY KEY (student_id, lesson_date, criteria_id)
+);
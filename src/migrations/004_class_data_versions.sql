@@ -0,0 +1,9 @@
+-- Per-class data version, bumped by every write that changes what the class's read
+-- endpoints return. The endpoints build their ETags from it.
+--
+-- Apply with: flask schema upgrade
+
+CREATE TABLE IF NOT EXISTS :"schema".class_data_versions (
+    class_id INTEGER PRIMARY KEY REFERENCES :"schema".classes (id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 0
+);
@@ -0,0 +1,9 @@
+-- Lesson calendar: previous/next lesson and lesson list lookups read lesson_info by
+-- (class_id, lesson_date). The lesson_info rows of lessons that only have scores are
+-- backfilled by 011_lesson_info_backfill.sql, once 007 has replaced the old
+-- UNIQUE (lesson_date) constraint that would have dropped the second class of a day.
+--
+-- Apply with: flask schema upgrade
+
+CREATE INDEX IF NOT EXISTS ix_lesson_info_class_id_lesson_date
+    ON :"schema".lesson_info (class_id, lesson_date);
@@ -0,0 +1,22 @@
+-- School calendar: the weekdays each class meets on and the holidays/closures when no
+-- lessons are expected. Classes without class_lesson_days rows meet on Fridays.
+--
+-- Apply with: flask schema upgrade
+
+CREATE TABLE IF NOT EXISTS :"schema".class_lesson_days (
+    class_id INTEGER NOT NULL REFERENCES :"schema".classes (id) ON DELETE CASCADE,
+    weekday SMALLINT NOT NULL CHECK (weekday BETWEEN 0 AND 6),
+    PRIMARY KEY (class_id, weekday)
+);
+
+CREATE TABLE IF NOT EXISTS :"schema".school_closures (
+    id SERIAL PRIMARY KEY,
+    class_id INTEGER REFERENCES :"schema".classes (id) ON DELETE CASCADE,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    reason VARCHAR(255),
+    CHECK (end_date >= start_date)
+);
+
+CREATE INDEX IF NOT EXISTS ix_school_closures_dates
+    ON :"schema".school_closures (start_date, end_date);
@@ -0,0 +1,36 @@
+-- One score per (student, lesson, criterion) and one lesson_info row per (class, lesson),
+-- so save_scores can upsert with INSERT ... ON CONFLICT DO UPDATE.
+--
+-- Duplicate scores are collapsed into the most recently written row (highest id).
+-- lesson_info.lesson_date stops being unique on its own, so two classes can meet on the
+-- same day. Run 'flask rollup rebuild' afterwards: the rollup counted the duplicates.
+--
+-- Apply with: flask schema upgrade
+
+DELETE FROM :"schema".scores s
+USING :"schema".scores newer
+WHERE newer.student_id = s.student_id
+  AND newer.lesson_date = s.lesson_date
+  AND newer.criteria_id = s.criteria_id
+  AND newer.id > s.id;
+
+ALTER TABLE :"schema".scores
+    DROP CONSTRAINT IF EXISTS uq_scores_student_lesson_criteria;
+ALTER TABLE :"schema".scores
+    ADD CONSTRAINT uq_scores_student_lesson_criteria UNIQUE (student_id, lesson_date, criteria_id);
+
+DELETE FROM :"schema".lesson_info li
+USING :"schema".lesson_info newer
+WHERE newer.class_id = li.class_id
+  AND newer.lesson_date = li.lesson_date
+  AND newer.id > li.id;
+
+ALTER TABLE :"schema".lesson_info
+    DROP CONSTRAINT IF EXISTS lesson_info_lesson_date_key;
+ALTER TABLE :"schema".lesson_info
+    DROP CONSTRAINT IF EXISTS uq_lesson_info_class_id_lesson_date;
+ALTER TABLE :"schema".lesson_info
+    ADD CONSTRAINT uq_lesson_info_class_id_lesson_date UNIQUE (class_id, lesson_date);
+
+-- The unique constraint's index replaces the one from 005_lesson_calendar_index.sql
+DROP INDEX IF EXISTS :"schema".ix_lesson_info_class_id_lesson_date;
@@ -0,0 +1,26 @@
+-- migration: no-transaction
+--
+-- Indexes for the hot read paths, built without blocking writes:
+-- * scores by student and lesson date (lesson sheets, monthly reports), covering the
+--   criterion and value so the reads are index-only;
+-- * scores by student, criterion and lesson date (per-criterion performance, streaks);
+-- * active students of a class (rosters, every lesson sheet and report).
+--
+-- CREATE INDEX CONCURRENTLY cannot run in a transaction, so each statement runs on its own.
+-- An interrupted build leaves an invalid index behind; the DROP before each CREATE clears
+-- it when the migration is run again.
+
+DROP INDEX CONCURRENTLY IF EXISTS :"schema".ix_scores_student_id_lesson_date;
+CREATE INDEX CONCURRENTLY ix_scores_student_id_lesson_date
+    ON :"schema".scores (student_id, lesson_date) INCLUDE (criteria_id, value);
+
+DROP INDEX CONCURRENTLY IF EXISTS :"schema".ix_scores_student_id_criteria_id_lesson_date;
+CREATE INDEX CONCURRENTLY ix_scores_student_id_criteria_id_lesson_date
+    ON :"schema".scores (student_id, criteria_id, lesson_date) INCLUDE (value);
+
+DROP INDEX CONCURRENTLY IF EXISTS :"schema".ix_students_class_id_active;
+CREATE INDEX CONCURRENTLY ix_students_class_id_active
+    ON :"schema".students (class_id, active);
+
+ANALYZE :"schema".scores;
+ANALYZE :"schema".students;
@@ -0,0 +1,18 @@
+-- Score archive catalog: the school years moved out of scores and lesson_info into
+-- compressed files of SCORE_ARCHIVE_DIR by 'flask archive'. Reads of a catalogued year go
+-- to its file; removed_at is set once the year's rows are gone from the live tables.
+--
+-- Apply with: flask schema upgrade
+
+CREATE TABLE IF NOT EXISTS :"schema".score_archives (
+    school_year INTEGER PRIMARY KEY,
+    first_date DATE NOT NULL,
+    last_date DATE NOT NULL,
+    file_name VARCHAR(255) NOT NULL,
+    score_count INTEGER NOT NULL,
+    lesson_count INTEGER NOT NULL,
+    sha256 VARCHAR(64) NOT NULL,
+    archived_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    removed_at TIMESTAMPTZ,
+    CHECK (last_date >= first_date)
+);
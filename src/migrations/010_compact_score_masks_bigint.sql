@@ -0,0 +1,9 @@
+-- Widen the compact layout's criteria bitmasks to BIGINT. With INTEGER masks, the bit of a
+-- criterion with id 31 or more wrapped around onto another criterion's bit. Criteria ids
+-- up to 62 fit now; 'flask scores to-compact' refuses larger ones.
+--
+-- Apply with: flask schema upgrade
+
+ALTER TABLE :"schema".lesson_scores
+    ALTER COLUMN recorded_mask TYPE BIGINT,
+    ALTER COLUMN value_mask TYPE BIGINT;
@@ -0,0 +1,17 @@
+-- Lessons saved before lesson_info existed only have scores; give them (empty) lesson_info
+-- rows to keep them on the lesson calendar. This used to run in 005, while the old
+-- UNIQUE (lesson_date) constraint was still there: a lesson of a second class on the same
+-- date hit it and was skipped. 007 replaced that constraint with (class_id, lesson_date).
+--
+-- Apply with: flask schema upgrade
+
+INSERT INTO :"schema".lesson_info (class_id, lesson_date, lesson_subject, lesson_activity)
+SELECT DISTINCT st.class_id, sc.lesson_date, '', ''
+FROM :"schema".scores sc
+JOIN :"schema".students st ON st.id = sc.student_id
+WHERE st.active
+  AND NOT EXISTS (
+      SELECT 1 FROM :"schema".lesson_info li
+      WHERE li.class_id = st.class_id AND li.lesson_date = sc.lesson_date
+  )
+ON CONFLICT (class_id, lesson_date) DO NOTHING;
@@ -0,0 +1,12 @@
+-- Version of the school calendar (class_lesson_days and school_closures), bumped by the
+-- flask calendar commands. Workers check their cached lesson dates against it, so a
+-- change made from the command line shows up in every worker at once.
+--
+-- Apply with: flask schema upgrade
+
+CREATE TABLE IF NOT EXISTS :"schema".school_calendar_version (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO :"schema".school_calendar_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
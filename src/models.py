@@ -36,7 +36,12 @@ class ClassTeacher(db.Model):
 
 class Student(db.Model):
     __tablename__ = 'students'
-    __table_args__ = {'schema': get_schema()}  # Use the configured schema
+    __table_args__ = (
+        # Rosters: the (active) students of a class
+        db.Index('ix_students_class_id_active', 'class_id', 'active'),
+        {'schema': get_schema()},  # Use the configured schema
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(100), nullable=False)
     class_id = db.Column(db.Integer, db.ForeignKey(f'{get_schema()}.classes.id'), nullable=False)
@@ -46,9 +51,17 @@ class Student(db.Model):
     active = db.Column(db.Boolean, default=True)
     inactive_date = db.Column(db.Date, nullable=True)
 
+
 class Score(db.Model):
     __tablename__ = 'scores'
-    __table_args__ = {'schema': get_schema()}  # Use the configured schema
+    __table_args__ = (
+        # One score per student, lesson and criterion; save_scores upserts against it
+        db.UniqueConstraint('student_id', 'lesson_date', 'criteria_id', name='uq_scores_student_lesson_criteria'),
+        # Covering indexes of the hot reads (see migrations/008_hot_path_indexes.sql)
+        db.Index('ix_scores_student_id_lesson_date', 'student_id', 'lesson_date', postgresql_include=['criteria_id', 'value']),
+        db.Index('ix_scores_student_id_criteria_id_lesson_date', 'student_id', 'criteria_id', 'lesson_date', postgresql_include=['value']),
+        {'schema': get_schema()},  # Use the configured schema
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey(f'{get_schema()}.students.id'), nullable=False)
@@ -72,13 +85,121 @@ class Criteria(db.Model):
 
 class LessonInfo(db.Model):
     __tablename__ = 'lesson_info'
-    __table_args__ = {'schema': get_schema()}  # Use the configured schema
+    __table_args__ = (
+        # One lesson per class and date; also serves the lesson calendar's lookups in date order
+        db.UniqueConstraint('class_id', 'lesson_date', name='uq_lesson_info_class_id_lesson_date'),
+        {'schema': get_schema()},  # Use the configured schema
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     class_id = db.Column(db.Integer, db.ForeignKey(f'{get_schema()}.classes.id'), nullable=False)
-    lesson_date = db.Column(db.Date, nullable=False, unique=True)
+    lesson_date = db.Column(db.Date, nullable=False)
     lesson_subject = db.Column(db.String(400), nullable=False)
     lesson_activity = db.Column(db.String(400), nullable=False)
 
     # Relationships
-    class_ = db.relationship('Class', backref='lesson_info', lazy=True)
\ No newline at end of file
+    class_ = db.relationship('Class', backref='lesson_info', lazy=True)
+
+class AttendanceRollup(db.Model):
+    __tablename__ = 'attendance_rollup'
+    __table_args__ = {'schema': get_schema()}  # Use the configured schema
+
+    # Present/total score counts per class, lesson date and criterion, kept in sync by DataManager writes
+    class_id = db.Column(db.Integer, db.ForeignKey(f'{get_schema()}.classes.id'), primary_key=True)
+    lesson_date = db.Column(db.Date, primary_key=True)
+    criteria_id = db.Column(db.Integer, db.ForeignKey(f'{get_schema()}.criteria.id'), primary_key=True)
+    present_count = db.Column(db.Integer, nullable=False, default=0)
+    total_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class StudentStreak(db.Model):
+    __tablename__ = 'student_streaks'
+    __table_args__ = {'schema': get_schema()}  # Use the configured schema
+
+    # Attendance streak state per student, updated incrementally as attendance is saved
+    student_id = db.Column(db.Integer, db.ForeignKey(f'{get_schema()}.students.id'), primary_key=True)
+    current_present_streak = db.Column(db.Integer, nullable=False, default=0)
+    current_absence_streak = db.Column(db.Integer, nullable=False, default=0, index=True)
+    longest_streak = db.Column(db.Integer, nullable=False, default=0)
+    last_lesson_date = db.Column(db.Date, nullable=True)
+    last_lesson_present = db.Column(db.Boolean, nullable=True)
+
+
+class LessonScore(db.Model):
+    __tablename__ = 'lesson_scores'
+    __table_args__ = {'schema': get_schema()}  # Use the configured schema
+
+    # Compact score storage (SCORE_STORAGE=compact): one row per student per lesson. Bit
+    # (1 << criteria_id) of recorded_mask is set when the criterion was scored, and the same
+    # bit of value_mask holds its value. Criteria ids above 62 do not fit.
+    student_id = db.Column(db.Integer, db.ForeignKey(f'{get_schema()}.students.id'), primary_key=True)
+    lesson_date = db.Column(db.Date, primary_key=True)
+    recorded_mask = db.Column(db.BigInteger, nullable=False, default=0)
+    value_mask = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class LessonScoreNote(db.Model):
+    __tablename__ = 'lesson_score_notes'
+    __table_args__ = {'schema': get_schema()}  # Use the configured schema
+
+    # Notes for compact score storage; only criteria that actually have a note get a row
+    student_id = db.Column(db.Integer, db.ForeignKey(f'{get_schema()}.students.id'), primary_key=True)
+    lesson_date = db.Column(db.Date, primary_key=True)
+    criteria_id = db.Column(db.Integer, db.ForeignKey(f'{get_schema()}.criteria.id'), primary_key=True)
+    notes = db.Column(db.String(255), nullable=False)
+
+
+class ClassDataVersion(db.Model):
+    __tablename__ = 'class_data_versions'
+    __table_args__ = {'schema': get_schema()}  # Use the configured schema
+
+    # Bumped whenever a class's scores, lessons or students change; used for ETags
+    class_id = db.Column(db.Integer, db.ForeignKey(f'{get_schema()}.classes.id'), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class ClassLessonDay(db.Model):
+    __tablename__ = 'class_lesson_days'
+    __table_args__ = {'schema': get_schema()}  # Use the configured schema
+
+    # Weekdays (0 = Monday ... 6 = Sunday) a class meets on; classes without rows meet on Fridays
+    class_id = db.Column(db.Integer, db.ForeignKey(f'{get_schema()}.classes.id'), primary_key=True)
+    weekday = db.Column(db.SmallInteger, primary_key=True)
+
+
+class SchoolClosure(db.Model):
+    __tablename__ = 'school_closures'
+    __table_args__ = {'schema': get_schema()}  # Use the configured schema
+
+    # Holidays and cancelled lessons: no lessons are expected from start_date to end_date
+    # (inclusive) for one class, or for the whole school when class_id is NULL
+    id = db.Column(db.Integer, primary_key=True)
+    class_id = db.Column(db.Integer, db.ForeignKey(f'{get_schema()}.classes.id'), nullable=True)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+    reason = db.Column(db.String(255), nullable=True)
+
+
+class SchoolCalendarVersion(db.Model):
+    __tablename__ = 'school_calendar_version'
+    __table_args__ = {'schema': get_schema()}  # Use the configured schema
+
+    # A single row, bumped whenever class_lesson_days or school_closures change
+    id = db.Column(db.SmallInteger, primary_key=True, default=1)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class ScoreArchive(db.Model):
+    __tablename__ = 'score_archives'
+    __table_args__ = {'schema': get_schema()}  # Use the configured schema
+
+    # A school year moved out of scores and lesson_info into a file of SCORE_ARCHIVE_DIR
+    school_year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    first_date = db.Column(db.Date, nullable=False)
+    last_date = db.Column(db.Date, nullable=False)
+    file_name = db.Column(db.String(255), nullable=False)
+    score_count = db.Column(db.Integer, nullable=False)
+    lesson_count = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    archived_at = db.Column(db.DateTime(timezone=True), nullable=False, server_default=db.func.now())
+    removed_at = db.Column(db.DateTime(timezone=True), nullable=True)  # rows deleted from the live tables
@@ -0,0 +1,282 @@
+# Optional range partitioning of scores and lesson_info by school year.
+#
+# A partitioned table has one partition per school year: scores_y2024 holds the lessons from
+# 2024-09-01 to 2025-08-31. Queries bounded by lesson date, like the performance API's and
+# the monthly reports', only read the partitions of their range, and each year's indexes and
+# vacuum work stay the size of one year. Past years can be detached without blocking reads
+# or writes. There is no default partition, because DETACH ... CONCURRENTLY does not allow
+# one, so a lesson saved outside the created years fails; keep partitions created ahead.
+import re
+from datetime import date
+from typing import Dict, List, Optional
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+from models import db, get_schema
+from school_calendar import school_year_bounds, school_year_of
+from schema_migrations import autocommit_connection, migration_status, quote_identifier
+
+
+PARTITIONED_TABLES = ("scores", "lesson_info")
+PARTITION_KEY = "lesson_date"
+
+# School years to have partitions for beyond the current one
+DEFAULT_YEARS_AHEAD = 1
+
+
+def partition_name(table: str, school_year: int) -> str:
+    return f"{table}_y{school_year}"
+
+
+def is_partitioned(connection, schema: str, table: str) -> bool:
+    return bool(connection.execute(
+        text("""
+            SELECT c.relkind = 'p' FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = :schema AND c.relname = :table
+        """),
+        {"schema": schema, "table": table},
+    ).scalar())
+
+
+def list_partitions(connection, schema: str, table: str) -> List[Dict]:
+    """
+    The partitions of `table` in school year order: name, school year, estimated rows and
+    whether a concurrent detach of it was interrupted.
+    """
+    rows = connection.execute(text("""
+        SELECT child.relname, child.reltuples, i.inhdetachpending
+        FROM pg_inherits i
+        JOIN pg_class parent ON parent.oid = i.inhparent
+        JOIN pg_class child ON child.oid = i.inhrelid
+        JOIN pg_namespace n ON n.oid = parent.relnamespace
+        WHERE n.nspname = :schema AND parent.relname = :table
+        ORDER BY child.relname
+    """), {"schema": schema, "table": table}).all()
+    partitions = []
+    for name, estimated_rows, detach_pending in rows:
+        match = re.fullmatch(rf"{re.escape(table)}_y(\d{{4}})", name)
+        partitions.append({
+            "name": name,
+            "school_year": int(match.group(1)) if match else None,
+            "estimated_rows": max(int(estimated_rows), 0),
+            "detach_pending": detach_pending,
+        })
+    return partitions
+
+
+def _create_partition(connection, schema: str, table: str, school_year: int, parent: Optional[str] = None):
+    first_day, _ = school_year_bounds(school_year)
+    next_first_day, _ = school_year_bounds(school_year + 1)
+    quoted = quote_identifier(schema)
+    connection.exec_driver_sql(
+        f"CREATE TABLE {quoted}.{partition_name(table, school_year)} PARTITION OF {quoted}.{parent or table} "
+        f"FOR VALUES FROM ('{first_day.isoformat()}') TO ('{next_first_day.isoformat()}')"
+    )
+
+
+def _table_definition(connection, schema: str, table: str):
+    """
+    The primary key, unique and foreign key constraints of a table as (name, type, columns,
+    definition), and the definitions of its other indexes.
+    """
+    constraints = connection.execute(text("""
+        SELECT con.conname, con.contype,
+               ARRAY(SELECT a.attname FROM unnest(con.conkey) k JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k),
+               pg_get_constraintdef(con.oid)
+        FROM pg_constraint con
+        JOIN pg_class c ON c.oid = con.conrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relname = :table AND con.contype IN ('p', 'u', 'f')
+        ORDER BY con.contype, con.conname
+    """), {"schema": schema, "table": table}).all()
+    indexes = connection.execute(text("""
+        SELECT pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relname = :table
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint con WHERE con.conindid = i.indexrelid)
+    """), {"schema": schema, "table": table}).scalars().all()
+    return constraints, indexes
+
+
+def partition_table(connection, schema: str, table: str, last_school_year: int) -> int:
+    """
+    Replace `table` by a table partitioned by school year with the same columns,
+    constraints and indexes, with partitions from the school year of its oldest lesson to
+    `last_school_year`, and copy its rows over. Runs in one transaction: reads go on while
+    the rows are copied, writes wait until it commits. Returns the rows copied.
+
+    The primary key gains lesson_date, which every key of a partitioned table must hold.
+    """
+    quoted = quote_identifier(schema)
+    staging = f"{table}_partitioned"
+    connection.exec_driver_sql("BEGIN")
+    try:
+        connection.exec_driver_sql(f"LOCK TABLE {quoted}.{table} IN EXCLUSIVE MODE")
+        constraints, indexes = _table_definition(connection, schema, table)
+        for name, kind, columns, _ in constraints:
+            if kind == "u" and PARTITION_KEY not in columns:
+                raise ValueError(f"Unique constraint {name} of {table} does not hold {PARTITION_KEY}.")
+
+        oldest = connection.exec_driver_sql(f"SELECT MIN({PARTITION_KEY}) FROM {quoted}.{table}").scalar()
+        first_school_year = min(school_year_of(oldest or date.today()), last_school_year)
+
+        connection.exec_driver_sql(
+            f"CREATE TABLE {quoted}.{staging} (LIKE {quoted}.{table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS "
+            f"INCLUDING STORAGE INCLUDING COMMENTS) PARTITION BY RANGE ({PARTITION_KEY})"
+        )
+        for school_year in range(first_school_year, last_school_year + 1):
+            _create_partition(connection, schema, table, school_year, parent=staging)
+        copied = connection.exec_driver_sql(f"INSERT INTO {quoted}.{staging} SELECT * FROM {quoted}.{table}").rowcount
+
+        # The id sequence belongs to the old table's column and would be dropped with it
+        sequences = connection.execute(text("""
+            SELECT a.attname, pg_get_serial_sequence(:table, a.attname)
+            FROM pg_attribute a
+            WHERE a.attrelid = CAST(:table AS regclass) AND a.attnum > 0 AND NOT a.attisdropped
+        """), {"table": f"{quoted}.{table}"}).all()
+        for column, sequence in sequences:
+            if sequence:
+                connection.exec_driver_sql(f"ALTER SEQUENCE {sequence} OWNED BY {quoted}.{staging}.{quote_identifier(column)}")
+
+        connection.exec_driver_sql(f"DROP TABLE {quoted}.{table}")
+        connection.exec_driver_sql(f"ALTER TABLE {quoted}.{staging} RENAME TO {table}")
+
+        # Keys and indexes under their old names; the index definitions name the table, which
+        # now is the partitioned one, and are built on every partition
+        for name, kind, columns, definition in constraints:
+            if kind == "p":
+                key_columns = columns if PARTITION_KEY in columns else [*columns, PARTITION_KEY]
+                definition = f"PRIMARY KEY ({', '.join(quote_identifier(column) for column in key_columns)})"
+            connection.exec_driver_sql(f"ALTER TABLE {quoted}.{table} ADD CONSTRAINT {quote_identifier(name)} {definition}")
+        for definition in indexes:
+            connection.exec_driver_sql(definition)
+    except Exception:
+        connection.exec_driver_sql("ROLLBACK")
+        raise
+    connection.exec_driver_sql("COMMIT")
+    connection.exec_driver_sql(f"ANALYZE {quoted}.{table}")
+    return copied
+
+
+def create_partitions(connection, schema: str, last_school_year: int, first_school_year: Optional[int] = None) -> List[str]:
+    """
+    Create the missing partitions of the partitioned tables up to `last_school_year`, from
+    `first_school_year` (default: the year after the newest partition). Returns their names.
+    """
+    created = []
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(connection, schema, table):
+            continue
+        years = [p["school_year"] for p in list_partitions(connection, schema, table) if p["school_year"] is not None]
+        start = first_school_year if first_school_year is not None else (max(years) + 1 if years else school_year_of(date.today()))
+        for school_year in range(start, last_school_year + 1):
+            name = partition_name(table, school_year)
+            exists = connection.execute(text("SELECT to_regclass(:name)"), {"name": f"{quote_identifier(schema)}.{name}"}).scalar()
+            if school_year in years or exists is not None:
+                continue
+            _create_partition(connection, schema, table, school_year)
+            created.append(name)
+    return created
+
+
+def detach_school_year(connection, schema: str, school_year: int) -> List[str]:
+    """
+    Detach the school year's partitions with DETACH PARTITION ... CONCURRENTLY, which waits
+    for running queries instead of blocking new ones. A detach that was interrupted is
+    finished instead. The partitions stay as tables of their own. Returns their names.
+    """
+    if school_year >= school_year_of(date.today()):
+        raise ValueError(f"School year {school_year} is not over yet.")
+    quoted = quote_identifier(schema)
+    detached = []
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(connection, schema, table):
+            continue
+        for partition in list_partitions(connection, schema, table):
+            if partition["school_year"] != school_year:
+                continue
+            mode = "FINALIZE" if partition["detach_pending"] else "CONCURRENTLY"
+            connection.exec_driver_sql(f"ALTER TABLE {quoted}.{table} DETACH PARTITION {quoted}.{partition['name']} {mode}")
+            detached.append(partition["name"])
+    return detached
+
+
+partitions_cli = AppGroup("partitions", help="Partition scores and lesson_info by school year.")
+
+
+def _last_school_year(years_ahead: int) -> int:
+    return school_year_of(date.today()) + years_ahead
+
+
+@partitions_cli.command("enable")
+@click.option("--ahead", type=int, default=DEFAULT_YEARS_AHEAD, show_default=True, help="School years to create beyond the current one.")
+def enable_command(ahead):
+    """Convert scores and lesson_info to tables partitioned by school year."""
+    schema = get_schema()
+    pending = [row["version"] for row in migration_status(db.engine.url, schema) if row["applied_at"] is None]
+    if pending:
+        raise click.ClickException(f"Run 'flask schema upgrade' first (pending: {', '.join(pending)}).")
+    connection = autocommit_connection(db.engine.url)
+    try:
+        for table in PARTITIONED_TABLES:
+            if is_partitioned(connection, schema, table):
+                click.echo(f"{table} is already partitioned.")
+                continue
+            try:
+                copied = partition_table(connection, schema, table, _last_school_year(ahead))
+            except ValueError as e:
+                raise click.ClickException(str(e))
+            click.echo(f"{table} partitioned by school year: {copied} rows copied.")
+    finally:
+        connection.close()
+
+
+@partitions_cli.command("create")
+@click.option("--ahead", type=int, default=DEFAULT_YEARS_AHEAD, show_default=True, help="School years to create beyond the current one.")
+@click.option("--since", type=int, default=None, help="Also create missing partitions from this school year on.")
+def create_command(ahead, since):
+    """Create the partitions of the coming school years (run once a year)."""
+    connection = autocommit_connection(db.engine.url)
+    try:
+        created = create_partitions(connection, get_schema(), _last_school_year(ahead), since)
+    finally:
+        connection.close()
+    click.echo(f"Created {', '.join(created)}." if created else "All partitions exist.")
+
+
+@partitions_cli.command("detach")
+@click.argument("school_year", type=int)
+def detach_command(school_year):
+    """Detach a past SCHOOL_YEAR (e.g. 2022 for 2022/23) without blocking the app."""
+    connection = autocommit_connection(db.engine.url)
+    try:
+        detached = detach_school_year(connection, get_schema(), school_year)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    finally:
+        connection.close()
+    if not detached:
+        click.echo(f"No partitions of school year {school_year}.")
+        return
+    click.echo(f"Detached {', '.join(detached)}; they remain as tables of their own.")
+
+
+@partitions_cli.command("status")
+def status_command():
+    """List the partitions of each table."""
+    schema = get_schema()
+    connection = autocommit_connection(db.engine.url)
+    try:
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(connection, schema, table):
+                click.echo(f"{table}: not partitioned")
+                continue
+            for partition in list_partitions(connection, schema, table):
+                pending = " (detach pending: run 'flask partitions detach' again)" if partition["detach_pending"] else ""
+                click.echo(f"{table}: {partition['name']} ~{partition['estimated_rows']} rows{pending}")
+    finally:
+        connection.close()
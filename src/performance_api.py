@@ -1,14 +1,28 @@
+import os
 from datetime import datetime, date
 from typing import List, Dict, Optional, Tuple
 
 from flask import Blueprint, request, jsonify
-from models import db, Student, Class, Score, Criteria
+from sqlalchemy import distinct, func
+from models import db, Student, Class, AttendanceRollup
+from score_storage import score_rows
+from score_archive import archived_scores, split_range
+from caching import cached_criteria
+from data_versions import conditional_on_data_version
+from attendance_streaks import get_absence_alerts
+from school_calendar import count_expected_lessons_by_class
 
 
 bp = Blueprint("performance_api", __name__)
 
 ATTENDANCE_CRITERION_NAME = "attendance"
 
+# Ranges longer than this (or open-ended) are computed with the vectorized attendance matrix
+MATRIX_MIN_RANGE_DAYS = int(os.getenv("MATRIX_MIN_RANGE_DAYS", "120"))
+
+# Consecutive absences after which a student shows up in /alerts
+DEFAULT_ABSENCE_ALERT_THRESHOLD = int(os.getenv("ABSENCE_ALERT_THRESHOLD", "3"))
+
 
 def parse_date(value: Optional[str]) -> Optional[date]:
     if not value:
@@ -17,22 +31,28 @@ def parse_date(value: Optional[str]) -> Optional[date]:
 
 
 def get_attendance_criteria_id() -> Optional[int]:
-    crit = db.session.query(Criteria).filter(Criteria.name == ATTENDANCE_CRITERION_NAME).first()
-    return crit.id if crit else None
+    return next((c["id"] for c in cached_criteria(db.session) if c["name"] == ATTENDANCE_CRITERION_NAME), None)
 
 
 def get_class_lessons_in_range(class_id: int, start: Optional[date], end: Optional[date]) -> List[date]:
     # Distinct lesson dates for the class based on scores across students in the class
-    q = (
-        db.session.query(Score.lesson_date)
-        .join(Student, Student.id == Score.student_id)
-        .filter(Student.class_id == class_id)
-    )
-    if start:
-        q = q.filter(Score.lesson_date >= start)
-    if end:
-        q = q.filter(Score.lesson_date <= end)
-    dates = [r[0] for r in q.distinct().order_by(Score.lesson_date.asc()).all()]
+    archived, live = split_range(db.session, start, end)
+    dates = []
+    if archived:
+        dates = sorted({r[2] for r in archived_scores(db.session, archived, class_id=class_id).rows()})
+    if live:
+        start, end = live
+        scores = score_rows()
+        q = (
+            db.session.query(scores.c.lesson_date)
+            .join(Student, Student.id == scores.c.student_id)
+            .filter(Student.class_id == class_id)
+        )
+        if start:
+            q = q.filter(scores.c.lesson_date >= start)
+        if end:
+            q = q.filter(scores.c.lesson_date <= end)
+        dates += [r[0] for r in q.distinct().order_by(scores.c.lesson_date.asc()).all()]
     return dates
 
 
@@ -52,35 +72,53 @@ def get_class_students(class_id: int) -> List[Student]:
 
 
 def get_present_dates_for_student(student_id: int, start: Optional[date], end: Optional[date], attendance_criteria_id: int) -> List[date]:
-    q = (
-        db.session.query(Score.lesson_date)
-        .filter(
-            Score.student_id == student_id,
-            Score.criteria_id == attendance_criteria_id,
-            Score.value.is_(True),
+    archived, live = split_range(db.session, start, end)
+    dates = []
+    if archived:
+        rows = archived_scores(db.session, archived, student_ids=[student_id], criteria_ids=[attendance_criteria_id]).rows()
+        dates = sorted({r[2] for r in rows if r[4]})
+    if live:
+        start, end = live
+        scores = score_rows()
+        q = (
+            db.session.query(scores.c.lesson_date)
+            .filter(
+                scores.c.student_id == student_id,
+                scores.c.criteria_id == attendance_criteria_id,
+                scores.c.value.is_(True),
+            )
         )
-    )
-    if start:
-        q = q.filter(Score.lesson_date >= start)
-    if end:
-        q = q.filter(Score.lesson_date <= end)
-    return [r[0] for r in q.distinct().order_by(Score.lesson_date.asc()).all()]
+        if start:
+            q = q.filter(scores.c.lesson_date >= start)
+        if end:
+            q = q.filter(scores.c.lesson_date <= end)
+        dates += [r[0] for r in q.distinct().order_by(scores.c.lesson_date.asc()).all()]
+    return dates
 
 
 def get_attendance_lesson_dates_for_student(student_id: int, start: Optional[date], end: Optional[date], attendance_criteria_id: int) -> List[date]:
     # All lesson dates that have an attendance record for this student, regardless of True/False
-    q = (
-        db.session.query(Score.lesson_date)
-        .filter(
-            Score.student_id == student_id,
-            Score.criteria_id == attendance_criteria_id,
+    archived, live = split_range(db.session, start, end)
+    dates = []
+    if archived:
+        rows = archived_scores(db.session, archived, student_ids=[student_id], criteria_ids=[attendance_criteria_id]).rows()
+        dates = sorted({r[2] for r in rows})
+    if live:
+        start, end = live
+        scores = score_rows()
+        q = (
+            db.session.query(scores.c.lesson_date)
+            .filter(
+                scores.c.student_id == student_id,
+                scores.c.criteria_id == attendance_criteria_id,
+            )
         )
-    )
-    if start:
-        q = q.filter(Score.lesson_date >= start)
-    if end:
-        q = q.filter(Score.lesson_date <= end)
-    return [r[0] for r in q.distinct().order_by(Score.lesson_date.asc()).all()]
+        if start:
+            q = q.filter(scores.c.lesson_date >= start)
+        if end:
+            q = q.filter(scores.c.lesson_date <= end)
+        dates += [r[0] for r in q.distinct().order_by(scores.c.lesson_date.asc()).all()]
+    return dates
 
 
 def compute_streaks(lesson_dates: List[date], present_dates: set) -> Tuple[int, int]:
@@ -103,9 +141,13 @@ def compute_student_performance(student_id: int, class_id: int, start: Optional[
 
     # Only include lessons where this student has an attendance record (True or False)
     lesson_dates = get_attendance_lesson_dates_for_student(student_id, start, end, attendance_criteria_id)
-    total_lessons = len(lesson_dates)
-
     present_dates = set(get_present_dates_for_student(student_id, start, end, attendance_criteria_id))
+    return build_student_performance(student_id, class_id, start, end, lesson_dates, present_dates)
+
+
+def build_student_performance(student_id: int, class_id: int, start: Optional[date], end: Optional[date], lesson_dates: List[date], present_dates: set) -> Dict:
+    # lesson_dates must be sorted ascending for the streaks to be meaningful
+    total_lessons = len(lesson_dates)
     attended = len([d for d in lesson_dates if d in present_dates])
     percentage = round((attended / total_lessons) * 100, 2) if total_lessons else 0.0
 
@@ -124,31 +166,129 @@ def compute_student_performance(student_id: int, class_id: int, start: Optional[
     }
 
 
-def compute_class_performance(class_id: int, start: Optional[date], end: Optional[date]) -> Dict:
+def compute_class_student_performances(class_id: int, start: Optional[date], end: Optional[date], student_ids: Optional[List[int]] = None) -> Dict[int, Dict]:
+    # Same per-student result as compute_student_performance, keyed by student_id.
+    # When student_ids is None, every student with attendance records in the range is included.
     attendance_criteria_id = get_attendance_criteria_id()
     if not attendance_criteria_id:
-        return {"error": f"Attendance criterion '{ATTENDANCE_CRITERION_NAME}' not found."}
+        error = {"error": f"Attendance criterion '{ATTENDANCE_CRITERION_NAME}' not found."}
+        return {student_id: error for student_id in (student_ids or [])}
+
+    if not start or not end or (end - start).days > MATRIX_MIN_RANGE_DAYS:
+        return compute_class_student_performances_vectorized(class_id, start, end, student_ids)
+
+    # One query for the whole class instead of two per student; archived lessons come first
+    archived, live = split_range(db.session, start, end)
+    rows = []
+    if archived:
+        archived_rows = archived_scores(db.session, archived, student_ids=student_ids, class_id=class_id, criteria_ids=[attendance_criteria_id]).rows()
+        rows = [(student_id, lesson_date, value) for student_id, _, lesson_date, _, value in archived_rows]
+    if live:
+        live_start, live_end = live
+        scores = score_rows()
+        q = (
+            db.session.query(scores.c.student_id, scores.c.lesson_date, scores.c.value)
+            .join(Student, Student.id == scores.c.student_id)
+            .filter(
+                Student.class_id == class_id,
+                scores.c.criteria_id == attendance_criteria_id,
+            )
+        )
+        if student_ids is not None:
+            q = q.filter(scores.c.student_id.in_(student_ids))
+        if live_start:
+            q = q.filter(scores.c.lesson_date >= live_start)
+        if live_end:
+            q = q.filter(scores.c.lesson_date <= live_end)
+        rows += q.order_by(scores.c.student_id, scores.c.lesson_date).all()
+
+    # student_id -> {lesson_date: present}; a date counts as present if any of its records is True
+    attendance_by_student: Dict[int, Dict[date, bool]] = {}
+    for student_id, lesson_date, value in rows:
+        dates = attendance_by_student.setdefault(student_id, {})
+        dates[lesson_date] = dates.get(lesson_date, False) or bool(value)
+
+    if student_ids is None:
+        student_ids = sorted(attendance_by_student)
+
+    results = {}
+    for student_id in student_ids:
+        dates = attendance_by_student.get(student_id, {})
+        lesson_dates = list(dates)
+        present_dates = {d for d, present in dates.items() if present}
+        results[student_id] = build_student_performance(student_id, class_id, start, end, lesson_dates, present_dates)
+    return results
+
+
+def compute_class_student_performances_vectorized(class_id: int, start: Optional[date], end: Optional[date], student_ids: Optional[List[int]] = None) -> Dict[int, Dict]:
+    # Same results as compute_class_student_performances, with streaks computed by NumPy over the whole class at once
+    from attendance_matrix import load_matrix, student_attendance
+
+    matrix = load_matrix(db.session, start, end, class_id, criteria_names=[ATTENDANCE_CRITERION_NAME])
+    performances = student_attendance(matrix)
+    if student_ids is None:
+        student_ids = sorted(performances)
+
+    empty = {
+        "attended_lessons": 0,
+        "total_lessons": 0,
+        "attendance_percentage": 0.0,
+        "longest_attendance_streak": 0,
+        "current_attendance_streak": 0,
+    }
+    return {
+        student_id: {
+            "student_id": student_id,
+            "class_id": class_id,
+            "start_date": start.isoformat() if start else None,
+            "end_date": end.isoformat() if end else None,
+            **performances.get(student_id, empty),
+        }
+        for student_id in student_ids
+    }
 
-    # Get all attendance scores for the class in the date range
+
+def get_class_attendance_totals(start: Optional[date], end: Optional[date], class_id: Optional[int] = None) -> Dict[int, Tuple[int, int, int]]:
+    # class_id -> (present records, total records, distinct lesson dates), read from the attendance rollup
+    # so the cost depends on the number of lessons in range, not on the number of score rows
+    attendance_criteria_id = get_attendance_criteria_id()
     q = (
-        db.session.query(Score)
-        .join(Student, Student.id == Score.student_id)
+        db.session.query(
+            AttendanceRollup.class_id,
+            func.coalesce(func.sum(AttendanceRollup.present_count), 0),
+            func.coalesce(func.sum(AttendanceRollup.total_count), 0),
+            func.count(distinct(AttendanceRollup.lesson_date)),
+        )
         .filter(
-            Student.class_id == class_id,
-            Score.criteria_id == attendance_criteria_id
+            AttendanceRollup.criteria_id == attendance_criteria_id,
+            AttendanceRollup.total_count > 0,
         )
     )
-
+    if class_id is not None:
+        q = q.filter(AttendanceRollup.class_id == class_id)
     if start:
-        q = q.filter(Score.lesson_date >= start)
+        q = q.filter(AttendanceRollup.lesson_date >= start)
     if end:
-        q = q.filter(Score.lesson_date <= end)
+        q = q.filter(AttendanceRollup.lesson_date <= end)
+
+    return {
+        row_class_id: (int(present), int(total), lesson_dates_count)
+        for row_class_id, present, total, lesson_dates_count in q.group_by(AttendanceRollup.class_id).all()
+    }
+
 
-    all_attendance_scores = q.all()
+def get_expected_lessons_counts(class_ids: List[int], start: Optional[date], end: Optional[date]) -> Dict[int, Optional[int]]:
+    """
+    Lessons each class was expected to have in the range according to the school calendar;
+    None for open-ended ranges.
+    """
+    if not start or not end:
+        return {class_id: None for class_id in class_ids}
+    return count_expected_lessons_by_class(db.session, class_ids, start, end)
 
-    # Count total attendance records and those marked as present
-    total_attendance_records = len(all_attendance_scores)
-    present_attendance_records = sum(1 for score in all_attendance_scores if score.value is True)
+
+def build_class_performance(class_id: int, start: Optional[date], end: Optional[date], totals: Tuple[int, int, int], expected_lessons_count: Optional[int] = None) -> Dict:
+    present_attendance_records, total_attendance_records, lesson_dates_count = totals
 
     # Calculate percentage
     percentage = (
@@ -157,22 +297,40 @@ def compute_class_performance(class_id: int, start: Optional[date], end: Optiona
         else 0.0
     )
 
-    # Get unique lesson dates for reference
-    lesson_dates = list(set(score.lesson_date for score in all_attendance_scores))
-    lesson_dates.sort()
-
     return {
         "class_id": class_id,
         "start_date": start.isoformat() if start else None,
         "end_date": end.isoformat() if end else None,
-        "lesson_dates_count": len(lesson_dates),
+        "lesson_dates_count": lesson_dates_count,
+        "expected_lessons_count": expected_lessons_count,
         "total_present_attendance_records": present_attendance_records,
         "total_attendance_records": total_attendance_records,
         "class_attendance_percentage": percentage,
     }
 
 
+def compute_class_performance(class_id: int, start: Optional[date], end: Optional[date]) -> Dict:
+    if not get_attendance_criteria_id():
+        return {"error": f"Attendance criterion '{ATTENDANCE_CRITERION_NAME}' not found."}
+
+    totals = get_class_attendance_totals(start, end, class_id)
+    expected = get_expected_lessons_counts([class_id], start, end)
+    return build_class_performance(class_id, start, end, totals.get(class_id, (0, 0, 0)), expected[class_id])
+
+
+def compute_school_performance(start: Optional[date], end: Optional[date]) -> List[Dict]:
+    class_ids = [r[0] for r in db.session.query(Class.id).order_by(Class.id.asc()).all()]
+    if not get_attendance_criteria_id():
+        return [{"error": f"Attendance criterion '{ATTENDANCE_CRITERION_NAME}' not found."} for _ in class_ids]
+
+    # A single grouped query for all classes instead of one scan per class
+    totals = get_class_attendance_totals(start, end)
+    expected = get_expected_lessons_counts(class_ids, start, end)
+    return [build_class_performance(class_id, start, end, totals.get(class_id, (0, 0, 0)), expected[class_id]) for class_id in class_ids]
+
+
 @bp.route("/student", methods=["GET"])
+@conditional_on_data_version
 def student_performance():
     try:
         student_id = int(request.args.get("student_id"))
@@ -188,6 +346,7 @@ def student_performance():
 
 
 @bp.route("/class/<int:class_id>", methods=["GET"])
+@conditional_on_data_version
 def class_performance(class_id: int):
     start = parse_date(request.args.get("start_date"))
     end = parse_date(request.args.get("end_date"))
@@ -195,12 +354,42 @@ def class_performance(class_id: int):
     return jsonify(result)
 
 
+@bp.route("/class/<int:class_id>/students", methods=["GET"])
+@conditional_on_data_version
+def class_students_performance(class_id: int):
+    start = parse_date(request.args.get("start_date"))
+    end = parse_date(request.args.get("end_date"))
+
+    student_ids = [
+        r[0]
+        for r in db.session.query(Student.id)
+        .filter(Student.class_id == class_id, Student.active.is_(True))
+        .order_by(Student.id.asc())
+        .all()
+    ]
+    results = compute_class_student_performances(class_id, start, end, student_ids)
+    return jsonify({"class_id": class_id, "students": [results[sid] for sid in student_ids]})
+
+
 @bp.route("/school", methods=["GET"])
+@conditional_on_data_version
 def school_performance():
     start = parse_date(request.args.get("start_date"))
     end = parse_date(request.args.get("end_date"))
 
-    classes = db.session.query(Class).order_by(Class.id.asc()).all()
-    results = [compute_class_performance(c.id, start, end) for c in classes]
-
+    results = compute_school_performance(start, end)
     return jsonify({"classes": results})
+
+
+@bp.route("/alerts", methods=["GET"])
+@conditional_on_data_version
+def absence_alerts():
+    try:
+        threshold = int(request.args.get("threshold", DEFAULT_ABSENCE_ALERT_THRESHOLD))
+    except (TypeError, ValueError):
+        return jsonify({"error": "threshold must be an integer"}), 400
+    if threshold < 1:
+        return jsonify({"error": "threshold must be at least 1"}), 400
+
+    alerts = get_absence_alerts(db.session, threshold)
+    return jsonify({"threshold": threshold, "students": alerts})
@@ -0,0 +1,186 @@
+import logging
+import os
+import time
+from collections import Counter as StatementCounter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from flask import g, request
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+# A statement run this many times with different parameters in one request is probably a
+# query per row (N+1) that should be one query
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+# Statements slower than this are logged with their EXPLAIN plan (0 disables it)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements run per request.", ["route"],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Time spent in SQL statements per request.", ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+N_PLUS_ONE_SUSPECTED = Counter("db_n_plus_one_suspected_total", "Requests that repeated a statement N_PLUS_ONE_THRESHOLD times or more.", ["route"])
+SLOW_QUERIES = Counter("db_slow_queries_total", "Statements slower than SLOW_QUERY_MS.", ["route"])
+
+
+class QueryStats:
+    """
+    The statements run in one scope (a request, or a `track_queries` block).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = StatementCounter()
+        self.slow: List[Tuple[float, str]] = []
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+        """
+        (statement, times) of the statements run at least `threshold` times.
+        """
+        return [(statement, times) for statement, times in self.statements.most_common() if times >= threshold]
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def _explain(cursor, statement: str, parameters) -> Optional[str]:
+    # Only queries: LOCK, SET, DDL and the like have no plan to show
+    if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return "(no plan: not a query)"
+    # A second cursor on the same DBAPI connection; plain EXPLAIN plans without running the
+    # statement. Inside a transaction it runs in a savepoint, so a failing EXPLAIN cannot
+    # abort the request's transaction
+    try:
+        explain_cursor = cursor.connection.cursor()
+        try:
+            try:
+                explain_cursor.execute("SAVEPOINT query_tracker_explain")
+            except Exception:
+                # Not in a transaction block (autocommit): nothing to protect
+                return _run_explain(explain_cursor, statement, parameters)
+            try:
+                plan = _run_explain(explain_cursor, statement, parameters)
+            except Exception:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT query_tracker_explain")
+                raise
+            finally:
+                explain_cursor.execute("RELEASE SAVEPOINT query_tracker_explain")
+            return plan
+        finally:
+            explain_cursor.close()
+    except Exception as e:
+        return f"(no plan: {e})"
+
+
+def _run_explain(explain_cursor, statement: str, parameters) -> str:
+    explain_cursor.execute("EXPLAIN " + statement, parameters)
+    return "\n".join(row[0] for row in explain_cursor.fetchall())
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    stats = _current_stats.get()
+    if stats is None:
+        return
+    seconds = time.perf_counter() - started
+    stats.record(statement, seconds)
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS and not executemany:
+        stats.slow.append((seconds, statement))
+        logger.warning(
+            "slow query (%.1f ms): %s\nparameters: %r\n%s",
+            seconds * 1000, statement, parameters, _explain(cursor, statement, parameters),
+        )
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get("query_started"):
+        context.connection.info["query_started"].pop()
+
+
+@contextmanager
+def track_queries():
+    """
+    Count the statements run inside the block (on any engine, in this thread or task).
+    Yields the QueryStats.
+    """
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+@contextmanager
+def max_queries(limit: int):
+    """
+    Fail with AssertionError when the block runs more than `limit` statements, listing them:
+
+        with max_queries(2):
+            data_manager.get_teachers_with_assigned_classes()
+    """
+    with track_queries() as stats:
+        yield stats
+    if stats.count > limit:
+        listing = "\n".join(f"  {times}x {statement}" for statement, times in stats.statements.most_common())
+        raise AssertionError(f"{stats.count} queries run, at most {limit} expected:\n{listing}")
+
+
+def _start_request():
+    g.query_stats_token = _current_stats.set(QueryStats())
+
+
+def _finish_request(response):
+    stats = _current_stats.get()
+    if stats is None or "query_stats_token" not in g:
+        return response
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    QUERIES_PER_REQUEST.labels(route).observe(stats.count)
+    DB_TIME_PER_REQUEST.labels(route).observe(stats.seconds)
+    if stats.slow:
+        SLOW_QUERIES.labels(route).inc(len(stats.slow))
+    repeated = stats.repeated()
+    if repeated:
+        N_PLUS_ONE_SUSPECTED.labels(route).inc()
+        for statement, times in repeated:
+            logger.warning("suspected N+1 in %s %s: %d runs of %s", request.method, route, times, " ".join(statement.split()))
+    return response
+
+
+def _end_request(exc):
+    token = g.pop("query_stats_token", None)
+    if token is not None:
+        _current_stats.reset(token)
+
+
+def init_query_tracking(app):
+    """
+    Count the statements and database time of every request of `app`, and warn about
+    statements repeated N_PLUS_ONE_THRESHOLD times.
+    """
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
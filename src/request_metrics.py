@@ -0,0 +1,182 @@
+import atexit
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess,
+)
+
+
+# With PROMETHEUS_MULTIPROC_DIR set (before the app is imported), every gunicorn worker writes its
+# samples to files there and /metrics adds them up, so the numbers cover the whole server
+# rather than the worker that happens to answer the scrape.
+MULTIPROCESS = bool(os.getenv("PROMETHEUS_MULTIPROC_DIR"))
+
+# Upper bounds (seconds) of the latency buckets; p95/p99 can only be as precise as these
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time spent answering a request.",
+    ["method", "route"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter("http_requests_total", "Requests answered.", ["method", "route", "status"])
+REQUEST_ERRORS = Counter("http_request_errors_total", "Requests that failed with a 5xx status.", ["method", "route"])
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests being answered.", ["route"],
+    multiprocess_mode="livesum",
+)
+
+ACCESS_LOG_FORMAT = '%(levelname)s:%(name)s:%(remote_addr)s - - [%(asctime)s] "%(method)s %(path)s %(protocol)s" %(status)s - %(duration).3fs'
+ACCESS_LOG_DATE_FORMAT = "%d/%b/%Y %H:%M:%S"
+
+
+def _route() -> str:
+    # The URL rule, not the path, so that ids and dates do not each become a time series
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.metrics_route = _route()
+    REQUESTS_IN_FLIGHT.labels(g.metrics_route).inc()
+
+
+def _finish_request(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    duration = time.perf_counter() - started
+    route = g.metrics_route
+    REQUEST_LATENCY.labels(request.method, route).observe(duration)
+    REQUESTS.labels(request.method, route, str(response.status_code)).inc()
+    if response.status_code >= 500:
+        REQUEST_ERRORS.labels(request.method, route).inc()
+    access_logger.info("", extra={
+        "remote_addr": request.remote_addr,
+        "method": request.method,
+        "path": request.path,
+        "protocol": request.environ.get("SERVER_PROTOCOL"),
+        "status": response.status_code,
+        "duration": duration,
+    })
+    return response
+
+
+def _end_request(exc):
+    route = g.pop("metrics_route", None)
+    if route is not None:
+        REQUESTS_IN_FLIGHT.labels(route).dec()
+
+
+class BackgroundLogHandler(QueueHandler):
+    """
+    Puts records on a queue that a background thread writes to `target`. The thread is
+    started on first use in each process, since threads do not survive gunicorn's fork of
+    a preloaded app. QueueHandler only merges msg and args in the calling thread; the
+    timestamp and the line are formatted by the background thread.
+    """
+
+    def __init__(self, target: logging.Handler):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self._pid = None
+        self._listener = None
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.queue = queue.SimpleQueue()
+            self._listener = QueueListener(self.queue, self.target)
+            self._listener.start()
+            atexit.register(self._listener.stop)
+        self.queue.put_nowait(record)
+
+
+access_logger = logging.getLogger("custom")
+
+
+def configure_access_log(use_queue: bool):
+    """
+    Write one line per request, from a background thread with `use_queue`.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(ACCESS_LOG_FORMAT, ACCESS_LOG_DATE_FORMAT))
+    access_logger.handlers.clear()
+    access_logger.propagate = False
+    access_logger.setLevel(logging.INFO)
+    access_logger.addHandler(BackgroundLogHandler(handler) if use_queue else handler)
+
+
+def init_metrics(app):
+    """
+    Count and time every request of `app` and write the access log. ACCESS_LOG_QUEUE=1 moves
+    the access log writes off the request path.
+    """
+    configure_access_log(os.getenv("ACCESS_LOG_QUEUE", "0") == "1")
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+
+
+def metrics_registry() -> CollectorRegistry:
+    if not MULTIPROCESS:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    The metrics in Prometheus text format, with their content type.
+    """
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
+
+
+def _quantile(buckets: List[Tuple[float, float]], q: float) -> Optional[float]:
+    # Like Prometheus' histogram_quantile: linear interpolation inside the bucket holding the rank
+    total = buckets[-1][1]
+    if not total:
+        return None
+    rank = q * total
+    lower_bound, lower_count = 0.0, 0.0
+    for upper_bound, count in buckets:
+        if count >= rank:
+            if upper_bound == float("inf"):
+                return lower_bound
+            return lower_bound + (upper_bound - lower_bound) * (rank - lower_count) / ((count - lower_count) or 1)
+        lower_bound, lower_count = upper_bound, count
+    return lower_bound
+
+
+def latency_summary() -> List[Dict]:
+    """
+    Request count and estimated p50/p95/p99 latency (ms) per method and route, slowest p95 first.
+    """
+    buckets: Dict[Tuple[str, str], Dict[float, float]] = {}
+    for metric in metrics_registry().collect():
+        if metric.name != "http_request_duration_seconds":
+            continue
+        for sample in metric.samples:
+            if sample.name.endswith("_bucket"):
+                key = (sample.labels["method"], sample.labels["route"])
+                upper_bound = float(sample.labels["le"])
+                route_buckets = buckets.setdefault(key, {})
+                route_buckets[upper_bound] = route_buckets.get(upper_bound, 0.0) + sample.value
+
+    summary = []
+    for (method, route), route_buckets in buckets.items():
+        cumulative = sorted(route_buckets.items())
+        quantiles = {f"p{int(q * 100)}_ms": _quantile(cumulative, q) for q in (0.5, 0.95, 0.99)}
+        summary.append({
+            "method": method,
+            "route": route,
+            "requests": int(cumulative[-1][1]),
+            **{name: round(value * 1000, 1) if value is not None else None for name, value in quantiles.items()},
+        })
+    return sorted(summary, key=lambda row: row["p95_ms"] or 0, reverse=True)
@@ -0,0 +1,245 @@
+import os
+import re
+import sys
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from db_engine import BACKGROUND, statement_timeouts
+from models import db, get_schema
+
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# First line of a migration that must run outside a transaction (CREATE INDEX CONCURRENTLY).
+# Its statements run one by one, so each must end with ';' at the end of a line.
+NO_TRANSACTION = "-- migration: no-transaction"
+
+# Migration that creates the tables a schema made before the runner already has
+BASELINE = "000"
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: str
+    name: str
+    path: str
+
+    def sql(self, schema: str) -> str:
+        """
+        The migration's SQL for `schema`: every :"schema" (psql's quoted variable syntax,
+        which the files were first written for) replaced by the quoted schema name.
+        """
+        with open(self.path, encoding="utf-8") as sql_file:
+            return sql_file.read().replace(':"schema"', quote_identifier(schema))
+
+    @property
+    def transactional(self) -> bool:
+        with open(self.path, encoding="utf-8") as sql_file:
+            return sql_file.readline().strip() != NO_TRANSACTION
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def find_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    """
+    The NNN_name.sql files of `directory`, in version order.
+    """
+    migrations = []
+    for file_name in sorted(os.listdir(directory)):
+        match = re.fullmatch(r"(\d{3})_(\w+)\.sql", file_name)
+        if match:
+            migrations.append(Migration(match.group(1), match.group(2), os.path.join(directory, file_name)))
+    return migrations
+
+
+def split_statements(sql: str) -> List[str]:
+    # Only for no-transaction migrations, which hold simple statements
+    lines = [line for line in sql.splitlines() if not line.lstrip().startswith("--")]
+    return [statement.strip() for statement in re.split(r";\s*$", "\n".join(lines), flags=re.MULTILINE) if statement.strip()]
+
+
+def autocommit_connection(url):
+    # A connection of its own in autocommit mode: the runner issues BEGIN/COMMIT itself, and
+    # CREATE INDEX CONCURRENTLY must run outside a transaction. No statement timeout, as for
+    # other background work.
+    engine = create_engine(url, poolclass=NullPool, isolation_level="AUTOCOMMIT")
+    connection = engine.connect()
+    connection.exec_driver_sql(f"SET statement_timeout = {int(statement_timeouts()[BACKGROUND])}")
+    return connection
+
+
+def _prepare(connection, schema: str):
+    quoted = quote_identifier(schema)
+    # Two runners on the same schema (e.g. containers starting together) take turns
+    connection.execute(text("SELECT pg_advisory_lock(hashtext('schema_migrations.' || :schema))"), {"schema": schema})
+    connection.exec_driver_sql(f"CREATE SCHEMA IF NOT EXISTS {quoted}")
+    connection.exec_driver_sql(f"""
+        CREATE TABLE IF NOT EXISTS {quoted}.schema_migrations (
+            version VARCHAR(16) PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+
+
+def _applied(connection, schema: str) -> Dict[str, object]:
+    rows = connection.exec_driver_sql(f"SELECT version, applied_at FROM {quote_identifier(schema)}.schema_migrations")
+    return {version: applied_at for version, applied_at in rows}
+
+
+def _record(connection, schema: str, migration: Migration):
+    connection.execute(
+        text(f"INSERT INTO {quote_identifier(schema)}.schema_migrations (version, name) VALUES (:version, :name)"),
+        {"version": migration.version, "name": migration.name},
+    )
+
+
+def _apply(connection, schema: str, migration: Migration):
+    sql = migration.sql(schema)
+    if not migration.transactional:
+        for statement in split_statements(sql):
+            connection.exec_driver_sql(statement)
+        _record(connection, schema, migration)
+        return
+    connection.exec_driver_sql("BEGIN")
+    try:
+        connection.exec_driver_sql(sql)
+        _record(connection, schema, migration)
+    except Exception:
+        connection.exec_driver_sql("ROLLBACK")
+        raise
+    connection.exec_driver_sql("COMMIT")
+
+
+def upgrade(url, schema: str, target: Optional[str] = None, echo: Callable[[str], None] = lambda message: None) -> List[str]:
+    """
+    Apply the migrations of MIGRATIONS_DIR that `schema` has not had yet, up to and
+    including version `target` (default: all), each in a transaction of its own unless it
+    is marked no-transaction. Returns the versions applied.
+
+    A schema that has the tables of the baseline migration but no schema_migrations table
+    predates the runner: the baseline is recorded as applied and the later migrations run.
+    They are written to be safe on a schema that already had them applied by hand.
+    """
+    connection = autocommit_connection(url)
+    try:
+        _prepare(connection, schema)
+        applied = _applied(connection, schema)
+        pending = [m for m in find_migrations() if m.version not in applied and (target is None or m.version <= target)]
+        if not applied and pending and pending[0].version == BASELINE:
+            existing = connection.execute(text("SELECT to_regclass(:table)"), {"table": f"{quote_identifier(schema)}.teachers"}).scalar()
+            if existing is not None:
+                _record(connection, schema, pending.pop(0))
+                echo(f"{BASELINE} recorded as applied: the schema predates the migration runner.")
+        done = []
+        for migration in pending:
+            echo(f"Applying {migration.version}_{migration.name}...")
+            _apply(connection, schema, migration)
+            done.append(migration.version)
+        return done
+    finally:
+        connection.close()
+
+
+def migration_status(url, schema: str) -> List[Dict]:
+    """
+    Every migration file with the time it was applied to `schema` (None when pending).
+    """
+    connection = autocommit_connection(url)
+    try:
+        exists = connection.execute(text("SELECT to_regclass(:table)"), {"table": f"{quote_identifier(schema)}.schema_migrations"}).scalar()
+        applied = _applied(connection, schema) if exists is not None else {}
+    finally:
+        connection.close()
+    return [{"version": m.version, "name": m.name, "applied_at": applied.get(m.version)} for m in find_migrations()]
+
+
+def clone_schema(url, source: str, destination: str, echo: Callable[[str], None] = lambda message: None) -> Dict[str, int]:
+    """
+    Create `destination` with the migrations and copy every table of `source` into it
+    (e.g. production data into a development schema). `source` must be fully migrated and
+    `destination` must not exist. Returns the rows copied per table.
+    """
+    pending = [row["version"] for row in migration_status(url, source) if row["applied_at"] is None]
+    if pending:
+        raise ValueError(f"Schema {source!r} is missing migrations {', '.join(pending)}; upgrade it first.")
+    connection = autocommit_connection(url)
+    try:
+        if connection.execute(text("SELECT 1 FROM pg_namespace WHERE nspname = :schema"), {"schema": destination}).scalar():
+            raise ValueError(f"Schema {destination!r} already exists.")
+    finally:
+        connection.close()
+
+    upgrade(url, destination, echo=echo)
+    source_quoted, destination_quoted = quote_identifier(source), quote_identifier(destination)
+    connection = autocommit_connection(url)
+    copied = {}
+    try:
+        connection.exec_driver_sql("BEGIN")
+        # Every table of the models, parents before children. The initial data of the
+        # migrations (the criteria) is replaced by the source's.
+        tables = db.metadata.sorted_tables
+        for table in reversed(tables):
+            connection.exec_driver_sql(f"DELETE FROM {destination_quoted}.{table.name}")
+        for table in tables:
+            columns = ", ".join(quote_identifier(column.name) for column in table.columns)
+            result = connection.exec_driver_sql(
+                f"INSERT INTO {destination_quoted}.{table.name} ({columns}) SELECT {columns} FROM {source_quoted}.{table.name}"
+            )
+            copied[table.name] = result.rowcount
+            if "id" in table.columns:
+                connection.execute(
+                    text(f"SELECT setval(pg_get_serial_sequence(:table, 'id'), COALESCE((SELECT MAX(id) FROM {destination_quoted}.{table.name}), 0) + 1, false)"),
+                    {"table": f"{destination_quoted}.{table.name}"},
+                )
+            echo(f"{table.name}: {result.rowcount} rows")
+        connection.exec_driver_sql("COMMIT")
+    except Exception:
+        connection.exec_driver_sql("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+    return copied
+
+
+schema_cli = AppGroup("schema", help="Apply and inspect database schema migrations.")
+
+
+@schema_cli.command("upgrade")
+@click.option("--schema", default=None, help="Schema to migrate (default: DB_SCHEMA).")
+@click.option("--to", "target", default=None, help="Stop after this migration version.")
+def upgrade_command(schema, target):
+    """Apply the pending migrations of src/migrations."""
+    applied = upgrade(db.engine.url, schema or get_schema(), target, echo=click.echo)
+    click.echo(f"Applied {len(applied)} migrations." if applied else "Schema is up to date.")
+
+
+@schema_cli.command("status")
+@click.option("--schema", default=None, help="Schema to inspect (default: DB_SCHEMA).")
+def status_command(schema):
+    """List the migrations and when each was applied."""
+    rows = migration_status(db.engine.url, schema or get_schema())
+    for row in rows:
+        applied_at = row["applied_at"].isoformat(timespec="seconds") if row["applied_at"] else "pending"
+        click.echo(f"{row['version']}_{row['name']}: {applied_at}")
+    if any(row["applied_at"] is None for row in rows):
+        sys.exit(1)
+
+
+@schema_cli.command("clone")
+@click.argument("source")
+@click.argument("destination")
+def clone_command(source, destination):
+    """Create DESTINATION from the migrations and copy SOURCE's data into it."""
+    try:
+        copied = clone_schema(db.engine.url, source, destination, echo=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Cloned {source} into {destination}: {sum(copied.values())} rows.")
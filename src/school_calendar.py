@@ -0,0 +1,244 @@
+import calendar
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Class, ClassLessonDay, SchoolClosure, SchoolCalendarVersion
+from caching import calendar_cache
+from data_versions import bump_class_versions, bump_all_class_versions
+
+
+DEFAULT_LESSON_WEEKDAYS = (4,)  # classes without class_lesson_days rows meet on Fridays (Monday is 0)
+SCHOOL_YEAR_START_MONTH = 9     # a school year runs from September 1st to August 31st
+
+
+def school_year_of(day: date) -> int:
+    """
+    The school year containing `day`, named after the calendar year it starts in.
+    """
+    return day.year if day.month >= SCHOOL_YEAR_START_MONTH else day.year - 1
+
+
+def school_year_bounds(school_year: int) -> Tuple[date, date]:
+    first_day = date(school_year, SCHOOL_YEAR_START_MONTH, 1)
+    return first_day, date(school_year + 1, SCHOOL_YEAR_START_MONTH, 1) - timedelta(days=1)
+
+
+def month_bounds(year: int, month: int) -> Tuple[date, date]:
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _lesson_dates(first_day: date, last_day: date, weekdays: Iterable[int], closures: List[Tuple[date, date]]) -> Tuple[date, ...]:
+    lesson_dates = []
+    for weekday in set(weekdays):
+        day = first_day + timedelta(days=(weekday - first_day.weekday()) % 7)
+        while day <= last_day:
+            if not any(start <= day <= end for start, end in closures):
+                lesson_dates.append(day)
+            day += timedelta(days=7)
+    return tuple(sorted(lesson_dates))
+
+
+def get_calendar_version(db_session) -> int:
+    version = db_session.query(SchoolCalendarVersion.version).filter(SchoolCalendarVersion.id == 1).scalar()
+    return version or 0
+
+
+def bump_calendar_version(db_session):
+    """
+    Increment the calendar version. Runs inside the caller's transaction, so other workers
+    drop their cached lesson dates once the calendar change is committed.
+    """
+    stmt = insert(SchoolCalendarVersion).values(id=1, version=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[SchoolCalendarVersion.id],
+        set_={"version": SchoolCalendarVersion.version + 1},
+    )
+    db_session.execute(stmt)
+
+
+def precompute_school_year(db_session, school_year: int, class_ids: Optional[Iterable[int]] = None, calendar_version: Optional[int] = None) -> Dict[int, Tuple[date, ...]]:
+    """
+    Compute the expected lesson dates of a whole school year for the given classes (every
+    class by default) with two queries, and keep them in the calendar cache, tagged with
+    the calendar version. Month and range counts are then answered from the cached dates
+    with a single version lookup.
+    """
+    if calendar_version is None:
+        calendar_version = get_calendar_version(db_session)
+    if class_ids is None:
+        class_ids = [row[0] for row in db_session.query(Class.id).all()]
+    class_ids = set(class_ids)
+    if not class_ids:
+        return {}
+    first_day, last_day = school_year_bounds(school_year)
+    version = calendar_cache.version
+
+    weekdays: Dict[int, set] = {}
+    for class_id, weekday in db_session.query(ClassLessonDay.class_id, ClassLessonDay.weekday).filter(ClassLessonDay.class_id.in_(class_ids)).all():
+        weekdays.setdefault(class_id, set()).add(weekday)
+    closures = (
+        db_session.query(SchoolClosure.class_id, SchoolClosure.start_date, SchoolClosure.end_date)
+        .filter(
+            SchoolClosure.start_date <= last_day,
+            SchoolClosure.end_date >= first_day,
+            or_(SchoolClosure.class_id.is_(None), SchoolClosure.class_id.in_(class_ids)),
+        )
+        .all()
+    )
+
+    lesson_dates_by_class = {}
+    for class_id in class_ids:
+        class_closures = [(start, end) for closure_class_id, start, end in closures if closure_class_id in (None, class_id)]
+        lesson_dates = _lesson_dates(first_day, last_day, weekdays.get(class_id, DEFAULT_LESSON_WEEKDAYS), class_closures)
+        calendar_cache.set(("lesson_dates", class_id, school_year), (calendar_version, lesson_dates), version)
+        lesson_dates_by_class[class_id] = lesson_dates
+    return lesson_dates_by_class
+
+
+def _school_year_lesson_dates(db_session, class_ids: Iterable[int], school_year: int, calendar_version: int) -> Dict[int, Tuple[date, ...]]:
+    cached = {}
+    missing = []
+    for class_id in class_ids:
+        entry = calendar_cache.get(("lesson_dates", class_id, school_year), is_valid=lambda entry: entry[0] == calendar_version)
+        if entry is None:
+            missing.append(class_id)
+        else:
+            cached[class_id] = entry[1]
+    if missing:
+        cached.update(precompute_school_year(db_session, school_year, missing, calendar_version))
+    return cached
+
+
+def get_expected_lesson_dates_by_class(db_session, class_ids: Iterable[int], start: date, end: date) -> Dict[int, List[date]]:
+    """
+    The dates in [start, end] on which each class is expected to have a lesson: its lesson
+    weekdays, minus the school-wide and class closures.
+    """
+    class_ids = list(class_ids)
+    expected = {class_id: [] for class_id in class_ids}
+    if start > end:
+        return expected
+    calendar_version = get_calendar_version(db_session)
+    for school_year in range(school_year_of(start), school_year_of(end) + 1):
+        for class_id, lesson_dates in _school_year_lesson_dates(db_session, class_ids, school_year, calendar_version).items():
+            expected[class_id].extend(lesson_dates[bisect_left(lesson_dates, start):bisect_right(lesson_dates, end)])
+    return expected
+
+
+def get_expected_lesson_dates(db_session, class_id: int, start: date, end: date) -> List[date]:
+    return get_expected_lesson_dates_by_class(db_session, [class_id], start, end)[class_id]
+
+
+def count_expected_lessons_by_class(db_session, class_ids: Iterable[int], start: date, end: date) -> Dict[int, int]:
+    return {
+        class_id: len(lesson_dates)
+        for class_id, lesson_dates in get_expected_lesson_dates_by_class(db_session, class_ids, start, end).items()
+    }
+
+
+def count_expected_lessons(db_session, class_id: int, start: date, end: date) -> int:
+    return len(get_expected_lesson_dates(db_session, class_id, start, end))
+
+
+def expected_lessons_in_month(db_session, class_id: int, year: int, month: int) -> int:
+    """
+    Number of lessons a class is expected to have in a month (what count_fridays used to estimate).
+    """
+    return count_expected_lessons(db_session, class_id, *month_bounds(year, month))
+
+
+def invalidate_calendar():
+    """
+    Drop this process's cached lesson dates; call after committing a change to the calendar
+    tables. Other processes notice the change through the calendar version.
+    """
+    calendar_cache.invalidate()
+
+
+calendar_cli = AppGroup("calendar", help="Manage class lesson weekdays and school closures.")
+
+
+def _parse_date(value: str) -> date:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise click.BadParameter(f"{value!r} is not a YYYY-MM-DD date")
+
+
+def _bump_closure_classes(class_id: Optional[int]):
+    # Expected lesson counts change for the closed class, or for every class on a school-wide closure
+    if class_id is None:
+        bump_all_class_versions(db.session)
+    else:
+        bump_class_versions(db.session, [class_id])
+
+
+@calendar_cli.command("weekdays")
+@click.argument("class_id", type=int)
+@click.argument("weekdays", type=click.IntRange(0, 6), nargs=-1)
+def weekdays_command(class_id, weekdays):
+    """Set the weekdays (0 = Monday ... 6 = Sunday) a class meets on; none restores Friday."""
+    db.session.query(ClassLessonDay).filter_by(class_id=class_id).delete()
+    for weekday in sorted(set(weekdays)):
+        db.session.add(ClassLessonDay(class_id=class_id, weekday=weekday))
+    bump_class_versions(db.session, [class_id])
+    bump_calendar_version(db.session)
+    db.session.commit()
+    invalidate_calendar()
+    click.echo(f"Class {class_id} meets on weekdays {sorted(set(weekdays)) or list(DEFAULT_LESSON_WEEKDAYS)}.")
+
+
+@calendar_cli.command("close")
+@click.argument("start")
+@click.argument("end", required=False)
+@click.option("--class-id", type=int, default=None, help="Close one class only (default: the whole school).")
+@click.option("--reason", default=None)
+def close_command(start, end, class_id, reason):
+    """Record a holiday or cancelled lessons from START to END (inclusive)."""
+    start_date = _parse_date(start)
+    end_date = _parse_date(end) if end else start_date
+    if end_date < start_date:
+        raise click.BadParameter("END must not be before START")
+    closure = SchoolClosure(class_id=class_id, start_date=start_date, end_date=end_date, reason=reason)
+    db.session.add(closure)
+    _bump_closure_classes(closure.class_id)
+    bump_calendar_version(db.session)
+    db.session.commit()
+    invalidate_calendar()
+    click.echo(f"Closure {closure.id} recorded.")
+
+
+@calendar_cli.command("reopen")
+@click.argument("closure_id", type=int)
+def reopen_command(closure_id):
+    """Delete a closure."""
+    closure = db.session.get(SchoolClosure, closure_id)
+    deleted = db.session.query(SchoolClosure).filter_by(id=closure_id).delete()
+    if closure is not None:
+        _bump_closure_classes(closure.class_id)
+        bump_calendar_version(db.session)
+    db.session.commit()
+    invalidate_calendar()
+    click.echo(f"Closure {closure_id} deleted." if deleted else f"No closure {closure_id}.")
+
+
+@calendar_cli.command("show")
+@click.option("--school-year", type=int, default=None, help="Starting calendar year (default: the current school year).")
+def show_command(school_year):
+    """Print the expected lessons per class and month of a school year."""
+    if school_year is None:
+        school_year = school_year_of(date.today())
+    for closure in db.session.query(SchoolClosure).order_by(SchoolClosure.start_date).all():
+        scope = f"class {closure.class_id}" if closure.class_id else "school"
+        click.echo(f"closure {closure.id}: {closure.start_date.isoformat()}..{closure.end_date.isoformat()} {scope} {closure.reason or ''}".rstrip())
+    for class_id, lesson_dates in sorted(precompute_school_year(db.session, school_year).items()):
+        per_month = {}
+        for lesson_date in lesson_dates:
+            per_month[lesson_date.strftime("%Y-%m")] = per_month.get(lesson_date.strftime("%Y-%m"), 0) + 1
+        click.echo(f"class {class_id}: " + " ".join(f"{month}={count}" for month, count in per_month.items()))
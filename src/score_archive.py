@@ -0,0 +1,463 @@
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+from sqlalchemy import func, text
+
+from caching import archive_cache, reference_cache
+from models import db, LessonInfo, ScoreArchive, Student, get_schema
+from partitioning import detach_school_year
+from schema_migrations import autocommit_connection, quote_identifier
+from school_calendar import school_year_bounds, school_year_of
+from score_storage import score_rows
+
+
+# Where the archived school years are written; /app/data is the container's volume
+ARCHIVE_DIR = os.getenv("SCORE_ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "archive"))
+
+# Live tables whose rows of an archived school year are removed, in either score layout
+LIVE_TABLES = ("scores", "lesson_scores", "lesson_score_notes", "lesson_info")
+
+DateRange = Tuple[Optional[date], Optional[date]]  # inclusive, None for open-ended
+
+
+@dataclass(frozen=True)
+class ArchivedYear:
+    """
+    One school year of scores and lessons, as read from its archive file. Scores are
+    sorted by (student_id, lesson_day, criteria_id), so a student's rows are one slice.
+    Days are date ordinals.
+    """
+    school_year: int
+    student_id: np.ndarray
+    lesson_day: np.ndarray
+    criteria_id: np.ndarray
+    value: np.ndarray
+    note_index: np.ndarray  # positions of the scores that have notes
+    note_text: np.ndarray
+    lesson_class_id: np.ndarray
+    lesson_info_day: np.ndarray
+    lesson_subject: np.ndarray
+    lesson_activity: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__dataclass_fields__ if name != "school_year")
+
+    def positions(self, student_ids: np.ndarray) -> np.ndarray:
+        """
+        Positions of the scores of the given (sorted, distinct) students.
+        """
+        starts = np.searchsorted(self.student_id, student_ids, side="left")
+        ends = np.searchsorted(self.student_id, student_ids, side="right")
+        slices = [np.arange(start, end) for start, end in zip(starts, ends) if end > start]
+        return np.concatenate(slices) if slices else np.zeros(0, dtype=np.int64)
+
+
+@dataclass(frozen=True)
+class ScoreColumns:
+    """
+    Scores as parallel arrays, with each student's current class as the live reads join it.
+    """
+    student_id: np.ndarray
+    class_id: np.ndarray
+    lesson_day: np.ndarray
+    criteria_id: np.ndarray
+    value: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.student_id)
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Tuple[int, int, date, int, bool]]) -> "ScoreColumns":
+        # (student_id, class_id, lesson_date, criteria_id, value) rows of a live query
+        if not rows:
+            return cls.concatenate([])
+        student_col, class_col, date_col, criteria_col, value_col = zip(*rows)
+        return cls(
+            np.array(student_col, dtype=np.int64),
+            np.array(class_col, dtype=np.int64),
+            np.array([d.toordinal() for d in date_col], dtype=np.int64),
+            np.array(criteria_col, dtype=np.int64),
+            np.array(value_col, dtype=bool),
+        )
+
+    @classmethod
+    def concatenate(cls, parts: List["ScoreColumns"]) -> "ScoreColumns":
+        if not parts:
+            empty = np.zeros(0, dtype=np.int64)
+            return cls(empty, empty, empty, empty, np.zeros(0, dtype=bool))
+        return cls(*(np.concatenate([getattr(part, name) for part in parts]) for name in cls.__dataclass_fields__))
+
+    def rows(self) -> List[Tuple[int, int, date, int, bool]]:
+        """
+        (student_id, class_id, lesson_date, criteria_id, value) tuples, like a live query's rows.
+        """
+        return [
+            (student_id, class_id, date.fromordinal(day), criteria_id, value)
+            for student_id, class_id, day, criteria_id, value in zip(
+                self.student_id.tolist(), self.class_id.tolist(), self.lesson_day.tolist(), self.criteria_id.tolist(), self.value.tolist()
+            )
+        ]
+
+
+def archive_catalog(db_session) -> List[Dict]:
+    """
+    The archived school years, oldest first (cached like other reference data, so a new
+    archive is noticed by every worker within REFERENCE_CACHE_TTL).
+    """
+    def load():
+        return [
+            {
+                "school_year": entry.school_year,
+                "first_date": entry.first_date,
+                "last_date": entry.last_date,
+                "file_name": entry.file_name,
+                "sha256": entry.sha256,
+            }
+            for entry in db_session.query(ScoreArchive).order_by(ScoreArchive.school_year).all()
+        ]
+
+    return reference_cache.get_or_load(("score_archives",), load)
+
+
+def archived_through(db_session) -> Optional[date]:
+    """
+    The last day served by the archive. Years are archived oldest first, so every lesson
+    up to this day is read from the files and every later one from the database.
+    """
+    catalog = archive_catalog(db_session)
+    return catalog[-1]["last_date"] if catalog else None
+
+
+def is_archived(db_session, day: date) -> bool:
+    cutoff = archived_through(db_session)
+    return cutoff is not None and day <= cutoff
+
+
+def archived_lesson_message(day: date) -> str:
+    return f"The {school_year_of(day)} school year is archived; its lessons can no longer be changed."
+
+
+def split_range(db_session, start: Optional[date], end: Optional[date]) -> Tuple[Optional[DateRange], Optional[DateRange]]:
+    """
+    Split an inclusive lesson date range into the part read from the archive and the part
+    read from the database; either is None when the range has no such part.
+    """
+    cutoff = archived_through(db_session)
+    if cutoff is None or (start is not None and start > cutoff):
+        return None, (start, end)
+    if end is not None and end <= cutoff:
+        return (start, end), None
+    return (start, cutoff), (cutoff + timedelta(days=1), end)
+
+
+def archive_path(file_name: str) -> str:
+    return os.path.join(ARCHIVE_DIR, file_name)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as archive_file:
+        for chunk in iter(lambda: archive_file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_archive(path: str, school_year: int, sha256: str) -> ArchivedYear:
+    with open(path, "rb") as archive_file:
+        content = archive_file.read()
+    if hashlib.sha256(content).hexdigest() != sha256:
+        raise ValueError(f"{path} does not match the checksum in the score archive catalog.")
+    with np.load(io.BytesIO(content), allow_pickle=False) as arrays:
+        return ArchivedYear(school_year, **{name: arrays[name] for name in ArchivedYear.__dataclass_fields__ if name != "school_year"})
+
+
+def load_archived_year(db_session, school_year: int) -> Optional[ArchivedYear]:
+    entry = next((entry for entry in archive_catalog(db_session) if entry["school_year"] == school_year), None)
+    if entry is None:
+        return None
+    return archive_cache.get_or_load(
+        (school_year, entry["sha256"]),
+        lambda: read_archive(archive_path(entry["file_name"]), school_year, entry["sha256"]),
+    )
+
+
+def archived_scores(db_session, date_range: DateRange, student_ids: Optional[Iterable[int]] = None, class_id: Optional[int] = None, criteria_ids: Optional[Iterable[int]] = None) -> ScoreColumns:
+    """
+    Archived scores of the range, sorted by student and lesson date, restricted to existing
+    students (of a class, or from `student_ids`) and optionally to some criteria. Students
+    are attributed to their current class, as the live queries join them.
+    """
+    catalog = archive_catalog(db_session)
+    if not catalog:
+        return ScoreColumns.concatenate([])
+    start = date_range[0] or catalog[0]["first_date"]
+    end = min(date_range[1] or catalog[-1]["last_date"], catalog[-1]["last_date"])
+    if start > end:
+        return ScoreColumns.concatenate([])
+
+    students = db_session.query(Student.id, Student.class_id)
+    if class_id is not None:
+        students = students.filter(Student.class_id == class_id)
+    if student_ids is not None:
+        students = students.filter(Student.id.in_(list(student_ids)))
+    student_classes = np.array(students.order_by(Student.id).all(), dtype=np.int64).reshape(-1, 2)
+    if not len(student_classes):
+        return ScoreColumns.concatenate([])
+    criteria = np.array(sorted(set(criteria_ids)), dtype=np.int64) if criteria_ids is not None else None
+
+    parts = []
+    for school_year in range(school_year_of(start), school_year_of(end) + 1):
+        year = load_archived_year(db_session, school_year)
+        if year is None:
+            continue
+        positions = year.positions(student_classes[:, 0])
+        days = year.lesson_day[positions]
+        keep = (days >= start.toordinal()) & (days <= end.toordinal())
+        if criteria is not None:
+            keep &= np.isin(year.criteria_id[positions], criteria)
+        positions = positions[keep]
+        student_id = year.student_id[positions].astype(np.int64)
+        parts.append(ScoreColumns(
+            student_id,
+            student_classes[np.searchsorted(student_classes[:, 0], student_id), 1],
+            year.lesson_day[positions].astype(np.int64),
+            year.criteria_id[positions].astype(np.int64),
+            year.value[positions],
+        ))
+    return ScoreColumns.concatenate(parts)
+
+
+def read_school_year(db_session, school_year: int) -> Dict[str, np.ndarray]:
+    """
+    The school year's scores (with their notes) and lessons as the arrays of its archive
+    file, in a fixed order. Reads through the active score layout.
+    """
+    first_day, last_day = school_year_bounds(school_year)
+    scores = score_rows()
+    rows = (
+        db_session.query(scores.c.student_id, scores.c.lesson_date, scores.c.criteria_id, scores.c.value, scores.c.notes)
+        .filter(scores.c.lesson_date >= first_day, scores.c.lesson_date <= last_day)
+        .all()
+    )
+    lessons = (
+        db_session.query(LessonInfo.class_id, LessonInfo.lesson_date, LessonInfo.lesson_subject, LessonInfo.lesson_activity)
+        .filter(LessonInfo.lesson_date >= first_day, LessonInfo.lesson_date <= last_day)
+        .order_by(LessonInfo.class_id, LessonInfo.lesson_date)
+        .all()
+    )
+
+    student_id = np.array([row[0] for row in rows], dtype=np.int32)
+    lesson_day = np.array([row[1].toordinal() for row in rows], dtype=np.int32)
+    criteria_id = np.array([row[2] for row in rows], dtype=np.int16)
+    order = np.lexsort((criteria_id, lesson_day, student_id))
+    notes = [rows[position][4] for position in order.tolist()]
+    arrays = {
+        "student_id": student_id[order],
+        "lesson_day": lesson_day[order],
+        "criteria_id": criteria_id[order],
+        "value": np.array([bool(row[3]) for row in rows], dtype=bool)[order],
+        "note_index": np.array([position for position, note in enumerate(notes) if note], dtype=np.int64),
+        "note_text": np.array([note for note in notes if note], dtype=str),
+        "lesson_class_id": np.array([lesson[0] for lesson in lessons], dtype=np.int32),
+        "lesson_info_day": np.array([lesson[1].toordinal() for lesson in lessons], dtype=np.int32),
+        "lesson_subject": np.array([lesson[2] for lesson in lessons], dtype=str),
+        "lesson_activity": np.array([lesson[3] for lesson in lessons], dtype=str),
+    }
+    return arrays
+
+
+def content_digest(arrays: Dict[str, np.ndarray]) -> str:
+    """
+    sha256 of the values of read_school_year's arrays. Unlike the file's checksum it does
+    not depend on compression, so it tells whether the live rows still match an export.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(arrays):
+        array = np.ascontiguousarray(arrays[name])
+        digest.update(f"{name}:{array.dtype.str}:{array.shape}".encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def export_school_year(db_session, school_year: int) -> Tuple[str, int, int, str, str]:
+    """
+    Write the school year's scores (with their notes) and lessons to a compressed NumPy
+    file of ARCHIVE_DIR, replacing any earlier export. Returns (file name, scores, lessons,
+    sha256 of the file, content_digest of what was written).
+    """
+    arrays = read_school_year(db_session, school_year)
+
+    # Written next to its final name and moved into place, so readers never see half a file
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    file_name = f"scores_{school_year}.npz"
+    handle, temporary_path = tempfile.mkstemp(dir=ARCHIVE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as archive_file:
+            np.savez_compressed(archive_file, **arrays)
+            archive_file.flush()
+            os.fsync(archive_file.fileno())
+        os.chmod(temporary_path, 0o644)
+        sha256 = file_sha256(temporary_path)
+        os.replace(temporary_path, archive_path(file_name))
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return file_name, len(arrays["student_id"]), len(arrays["lesson_class_id"]), sha256, content_digest(arrays)
+
+
+def remove_school_year(url, schema: str, school_year: int, echo: Callable[[str], None] = lambda message: None):
+    """
+    Remove an archived school year from the live tables and mark it removed in the
+    catalog. Partitions of the year are detached and dropped; other tables get a DELETE.
+    The attendance rollup and streaks are kept.
+    """
+    first_day, last_day = school_year_bounds(school_year)
+    quoted = quote_identifier(schema)
+    connection = autocommit_connection(url)
+    try:
+        for partition in detach_school_year(connection, schema, school_year):
+            connection.exec_driver_sql(f"DROP TABLE {quoted}.{partition}")
+            echo(f"{school_year}: dropped partition {partition}")
+        connection.exec_driver_sql("BEGIN")
+        try:
+            for table in LIVE_TABLES:
+                if connection.execute(text("SELECT to_regclass(:table)"), {"table": f"{quoted}.{table}"}).scalar() is None:
+                    continue
+                result = connection.execute(
+                    text(f"DELETE FROM {quoted}.{table} WHERE lesson_date BETWEEN :first_day AND :last_day"),
+                    {"first_day": first_day, "last_day": last_day},
+                )
+                if result.rowcount:
+                    echo(f"{school_year}: {result.rowcount} rows deleted from {table}")
+            connection.execute(text(f"UPDATE {quoted}.score_archives SET removed_at = now() WHERE school_year = :school_year"), {"school_year": school_year})
+        except Exception:
+            connection.exec_driver_sql("ROLLBACK")
+            raise
+        connection.exec_driver_sql("COMMIT")
+    finally:
+        connection.close()
+
+
+def _first_school_year(db_session) -> Optional[int]:
+    scores = score_rows()
+    firsts = [
+        db_session.query(func.min(scores.c.lesson_date)).scalar(),
+        db_session.query(func.min(LessonInfo.lesson_date)).scalar(),
+    ]
+    firsts = [first for first in firsts if first is not None]
+    return school_year_of(min(firsts)) if firsts else None
+
+
+def archive_school_years(db_session, through_year: int, wait: float, echo: Callable[[str], None] = lambda message: None) -> List[int]:
+    """
+    Archive every school year up to and including `through_year`, oldest first, so one
+    cutoff date separates the archive from the live tables. Each year is exported and
+    catalogued, which switches its reads to the file; after `wait` seconds (the time every
+    worker needs to see the catalog) its rows are removed from the live tables. A year whose
+    rows were added, deleted or updated in the meantime (its content digest differs from the
+    export's) is left in place for the next run, which exports it again. Returns the years
+    removed.
+    """
+    if through_year >= school_year_of(date.today()):
+        raise ValueError(f"School year {through_year} is not over yet.")
+    catalog = {entry.school_year: entry for entry in db_session.query(ScoreArchive).all()}
+    first_year = min(catalog) if catalog else _first_school_year(db_session)
+    if first_year is None:
+        return []
+
+    pending = []
+    digests = {}
+    for school_year in range(first_year, through_year + 1):
+        entry = catalog.get(school_year)
+        if entry is not None and entry.removed_at is not None:
+            continue
+        file_name, score_count, lesson_count, sha256, digests[school_year] = export_school_year(db_session, school_year)
+        if entry is None:
+            first_day, last_day = school_year_bounds(school_year)
+            entry = ScoreArchive(school_year=school_year, first_date=first_day, last_date=last_day)
+            db_session.add(entry)
+        entry.file_name = file_name
+        entry.score_count = score_count
+        entry.lesson_count = lesson_count
+        entry.sha256 = sha256
+        pending.append(entry)
+        echo(f"{school_year}: {score_count} scores and {lesson_count} lessons written to {file_name}")
+    db_session.commit()
+    reference_cache.invalidate(("score_archives",))
+    if not pending:
+        return []
+
+    if wait > 0:
+        echo(f"Waiting {wait:g}s for every worker to read the archived years from their files...")
+        time.sleep(wait)
+    removed = []
+    for entry in pending:
+        live = content_digest(read_school_year(db_session, entry.school_year))
+        # End the read transaction, which would hold up the partition detach
+        db_session.commit()
+        if live != digests[entry.school_year]:
+            echo(f"{entry.school_year}: changed while it was being archived; run the command again.")
+            continue
+        remove_school_year(db.engine.url, get_schema(), entry.school_year, echo)
+        removed.append(entry.school_year)
+    return removed
+
+
+def verify_archive(db_session) -> List[str]:
+    """
+    Problems with the archive files: missing files and checksum mismatches.
+    """
+    problems = []
+    for entry in archive_catalog(db_session):
+        path = archive_path(entry["file_name"])
+        if not os.path.exists(path):
+            problems.append(f"{entry['school_year']}: {path} is missing")
+        elif file_sha256(path) != entry["sha256"]:
+            problems.append(f"{entry['school_year']}: {path} does not match its checksum")
+    return problems
+
+
+archive_cli = AppGroup("archive", help="Move closed school years out of the live tables into compressed files.")
+
+
+@archive_cli.command("move")
+@click.argument("through_year", type=int)
+@click.option("--wait", type=float, default=None, help="Seconds between cataloguing and removing the rows (default: REFERENCE_CACHE_TTL).")
+def move_command(through_year, wait):
+    """Archive every school year up to and including THROUGH_YEAR."""
+    try:
+        removed = archive_school_years(db.session, through_year, reference_cache.ttl if wait is None else wait, echo=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Archived {', '.join(map(str, removed))}." if removed else "Nothing to archive.")
+
+
+@archive_cli.command("status")
+def status_command():
+    """List the archived school years."""
+    for entry in db.session.query(ScoreArchive).order_by(ScoreArchive.school_year).all():
+        removed = f"removed {entry.removed_at.isoformat(timespec='seconds')}" if entry.removed_at else "rows still in the live tables"
+        click.echo(f"{entry.school_year}: {entry.file_name}, {entry.score_count} scores, {entry.lesson_count} lessons, {removed}")
+
+
+@archive_cli.command("verify")
+def verify_command():
+    """Check that every archive file exists and matches its checksum."""
+    problems = verify_archive(db.session)
+    for problem in problems:
+        click.echo(problem)
+    if problems:
+        sys.exit(1)
+    click.echo("Archive files match the catalog.")
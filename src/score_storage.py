@@ -0,0 +1,294 @@
+import os
+import sys
+from datetime import date
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import BigInteger, and_, cast, func, literal, or_, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Score, Criteria, LessonScore, LessonScoreNote, get_schema
+from data_versions import bump_all_class_versions
+
+
+# "rows": one scores row per (student, lesson, criterion), the original layout.
+# "compact": one lesson_scores row per (student, lesson) with criteria packed into bitmasks,
+# plus lesson_score_notes for the few scores that have notes.
+ROW_STORAGE = "rows"
+COMPACT_STORAGE = "compact"
+SCORE_STORAGE = os.getenv("SCORE_STORAGE", ROW_STORAGE)
+
+ScoreKey = Tuple[int, int]  # (student_id, criteria_id)
+
+# Highest criteria id the compact layout can hold: bit (1 << id) of a BIGINT mask, sign bit excluded
+MAX_COMPACT_CRITERIA_ID = 62
+
+
+def is_compact() -> bool:
+    return SCORE_STORAGE == COMPACT_STORAGE
+
+
+def _criteria_bit(criteria_id):
+    return cast(literal(1), BigInteger).op("<<")(criteria_id)
+
+
+def _has_bit(mask, criteria_id):
+    # Postgres takes the shift modulo 64, so larger ids must not be tested at all
+    return and_(criteria_id <= MAX_COMPACT_CRITERIA_ID, mask.op("&")(_criteria_bit(criteria_id)) != 0)
+
+
+def criteria_too_large_for_compact(db_session):
+    """
+    Ids of the criteria that have no bit in the compact layout's masks.
+    """
+    return [row[0] for row in db_session.query(Criteria.id).filter(Criteria.id > MAX_COMPACT_CRITERIA_ID).order_by(Criteria.id).all()]
+
+
+def score_rows():
+    """
+    The scores of the active storage layout as a selectable with the columns
+    student_id, lesson_date, criteria_id, value and notes. Readers query `.c` columns of
+    this instead of the Score model so they work on either layout.
+    """
+    if not is_compact():
+        return Score.__table__
+
+    bit = _criteria_bit(Criteria.id)
+    return (
+        select(
+            LessonScore.student_id.label("student_id"),
+            LessonScore.lesson_date.label("lesson_date"),
+            Criteria.id.label("criteria_id"),
+            (LessonScore.value_mask.op("&")(bit) != 0).label("value"),
+            LessonScoreNote.notes.label("notes"),
+        )
+        .join(Criteria, _has_bit(LessonScore.recorded_mask, Criteria.id))
+        .outerjoin(
+            LessonScoreNote,
+            and_(
+                LessonScoreNote.student_id == LessonScore.student_id,
+                LessonScoreNote.lesson_date == LessonScore.lesson_date,
+                LessonScoreNote.criteria_id == Criteria.id,
+            ),
+        )
+        .subquery("scores")
+    )
+
+
+def load_lesson_scores(db_session, student_ids: Iterable[int], lesson_date: date) -> Dict[ScoreKey, Tuple[bool, Optional[str]]]:
+    """
+    Existing (value, notes) per (student_id, criteria_id) for one lesson.
+    """
+    scores = score_rows()
+    rows = (
+        db_session.query(scores.c.student_id, scores.c.criteria_id, scores.c.value, scores.c.notes)
+        .filter(scores.c.student_id.in_(list(student_ids)), scores.c.lesson_date == lesson_date)
+        .all()
+    )
+    return {(student_id, criteria_id): (value, notes) for student_id, criteria_id, value, notes in rows}
+
+
+def write_scores(db_session, lesson_date: date, scores: Dict[ScoreKey, Tuple[bool, Optional[str]]]) -> Set[ScoreKey]:
+    """
+    Write (value, notes) pairs for one lesson and return the keys that were inserted or
+    actually changed; rows that already hold the same value and notes are left untouched.
+    Empty notes are stored as NULL. Does not commit.
+    """
+    if not scores:
+        return set()
+    scores = {key: (value, notes if notes else None) for key, (value, notes) in scores.items()}
+
+    if is_compact():
+        existing = load_lesson_scores(db_session, {student_id for student_id, _ in scores}, lesson_date)
+        changes = {key: score for key, score in scores.items() if existing.get(key) != score}
+        if changes:
+            _write_compact_scores(db_session, lesson_date, changes)
+        return set(changes)
+
+    # One statement for the whole sheet; the unique (student_id, lesson_date, criteria_id)
+    # constraint turns existing rows into updates, and RETURNING reports the rows written
+    table = Score.__table__
+    stmt = insert(table).values([
+        {"student_id": student_id, "lesson_date": lesson_date, "criteria_id": criteria_id, "value": value, "notes": notes}
+        for (student_id, criteria_id), (value, notes) in scores.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.student_id, table.c.lesson_date, table.c.criteria_id],
+        set_={"value": stmt.excluded.value, "notes": stmt.excluded.notes},
+        where=or_(
+            table.c.value.is_distinct_from(stmt.excluded.value),
+            table.c.notes.is_distinct_from(stmt.excluded.notes),
+        ),
+    ).returning(table.c.student_id, table.c.criteria_id)
+    return {(student_id, criteria_id) for student_id, criteria_id in db_session.execute(stmt)}
+
+
+def _write_compact_scores(db_session, lesson_date: date, changes: Dict[ScoreKey, Tuple[bool, Optional[str]]]):
+    too_large = sorted({criteria_id for _, criteria_id in changes if criteria_id > MAX_COMPACT_CRITERIA_ID})
+    if too_large:
+        raise ValueError(f"Criteria {too_large} do not fit in the compact score layout (ids up to {MAX_COMPACT_CRITERIA_ID}).")
+    masks: Dict[int, Tuple[int, int]] = {}  # student_id -> (recorded bits, value bits) being written
+    for (student_id, criteria_id), (value, _) in changes.items():
+        recorded, values = masks.get(student_id, (0, 0))
+        masks[student_id] = (recorded | (1 << criteria_id), values | ((1 << criteria_id) if value else 0))
+
+    stmt = insert(LessonScore).values([
+        {"student_id": student_id, "lesson_date": lesson_date, "recorded_mask": recorded, "value_mask": values}
+        for student_id, (recorded, values) in masks.items()
+    ])
+    # Merge into the existing row: written bits replace their old values, the rest are kept
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[LessonScore.student_id, LessonScore.lesson_date],
+        set_={
+            "recorded_mask": LessonScore.recorded_mask.op("|")(stmt.excluded.recorded_mask),
+            "value_mask": (
+                LessonScore.value_mask - LessonScore.value_mask.op("&")(stmt.excluded.recorded_mask)
+            ).op("|")(stmt.excluded.value_mask),
+        },
+    )
+    db_session.execute(stmt)
+
+    with_notes = [
+        {"student_id": student_id, "lesson_date": lesson_date, "criteria_id": criteria_id, "notes": notes}
+        for (student_id, criteria_id), (_, notes) in changes.items()
+        if notes
+    ]
+    without_notes = [key for key, (_, notes) in changes.items() if not notes]
+    if with_notes:
+        stmt = insert(LessonScoreNote).values(with_notes)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[LessonScoreNote.student_id, LessonScoreNote.lesson_date, LessonScoreNote.criteria_id],
+            set_={"notes": stmt.excluded.notes},
+        )
+        db_session.execute(stmt)
+    if without_notes:
+        db_session.query(LessonScoreNote).filter(
+            LessonScoreNote.lesson_date == lesson_date,
+            tuple_(LessonScoreNote.student_id, LessonScoreNote.criteria_id).in_(without_notes),
+        ).delete(synchronize_session=False)
+
+
+def delete_lesson_scores(db_session, student_ids: Iterable[int], lesson_date: date):
+    """
+    Delete the scores of the given students for one lesson. Does not commit.
+    """
+    student_ids = list(student_ids)
+    if is_compact():
+        for model in (LessonScoreNote, LessonScore):
+            db_session.query(model).filter(model.lesson_date == lesson_date, model.student_id.in_(student_ids)).delete(synchronize_session=False)
+    else:
+        db_session.query(Score).filter(Score.lesson_date == lesson_date, Score.student_id.in_(student_ids)).delete()
+
+
+def delete_student_scores(db_session, student_id: int):
+    """
+    Delete every score of a student from both layouts, so no row is left referencing
+    the student whichever layout is active. Does not commit.
+    """
+    db_session.query(LessonScoreNote).filter_by(student_id=student_id).delete()
+    db_session.query(LessonScore).filter_by(student_id=student_id).delete()
+    db_session.query(Score).filter_by(student_id=student_id).delete()
+
+
+def copy_rows_to_compact(db_session):
+    """
+    Fill lesson_scores and lesson_score_notes from the scores table. Duplicate score rows
+    collapse into one criterion bit, True if any of them is True. Does not commit.
+    """
+    schema = get_schema()
+    db_session.execute(text(f"""
+        INSERT INTO "{schema}".lesson_scores (student_id, lesson_date, recorded_mask, value_mask)
+        SELECT student_id, lesson_date,
+               bit_or(CAST(1 AS BIGINT) << criteria_id),
+               bit_or(CASE WHEN value THEN CAST(1 AS BIGINT) << criteria_id ELSE 0 END)
+        FROM "{schema}".scores
+        GROUP BY student_id, lesson_date
+        ON CONFLICT (student_id, lesson_date) DO UPDATE
+            SET recorded_mask = EXCLUDED.recorded_mask, value_mask = EXCLUDED.value_mask
+    """))
+    db_session.execute(text(f"""
+        INSERT INTO "{schema}".lesson_score_notes (student_id, lesson_date, criteria_id, notes)
+        SELECT DISTINCT ON (student_id, lesson_date, criteria_id) student_id, lesson_date, criteria_id, notes
+        FROM "{schema}".scores
+        WHERE notes IS NOT NULL AND notes <> ''
+        ORDER BY student_id, lesson_date, criteria_id, id DESC
+        ON CONFLICT (student_id, lesson_date, criteria_id) DO UPDATE SET notes = EXCLUDED.notes
+    """))
+
+
+def copy_compact_to_rows(db_session):
+    """
+    Rebuild the scores table from the compact layout (to switch back). Does not commit.
+    """
+    schema = get_schema()
+    db_session.execute(text(f'DELETE FROM "{schema}".scores'))
+    db_session.execute(text(f"""
+        INSERT INTO "{schema}".scores (student_id, lesson_date, criteria_id, value, notes)
+        SELECT ls.student_id, ls.lesson_date, c.id,
+               (ls.value_mask & (CAST(1 AS BIGINT) << c.id)) <> 0,
+               n.notes
+        FROM "{schema}".lesson_scores ls
+        JOIN "{schema}".criteria c ON c.id <= {MAX_COMPACT_CRITERIA_ID} AND (ls.recorded_mask & (CAST(1 AS BIGINT) << c.id)) <> 0
+        LEFT JOIN "{schema}".lesson_score_notes n
+            ON n.student_id = ls.student_id AND n.lesson_date = ls.lesson_date AND n.criteria_id = c.id
+    """))
+
+
+def compare_layouts(db_session):
+    """
+    Number of (student, lesson, criterion) scores that differ between the two layouts.
+    """
+    bit = _criteria_bit(Criteria.id)
+    compact = (
+        select(
+            LessonScore.student_id,
+            LessonScore.lesson_date,
+            Criteria.id.label("criteria_id"),
+            (LessonScore.value_mask.op("&")(bit) != 0).label("value"),
+        )
+        .join(Criteria, _has_bit(LessonScore.recorded_mask, Criteria.id))
+    )
+    rows = (
+        select(Score.student_id, Score.lesson_date, Score.criteria_id, func.bool_or(Score.value).label("value"))
+        .group_by(Score.student_id, Score.lesson_date, Score.criteria_id)
+    )
+    only_rows = db_session.execute(select(func.count()).select_from(rows.except_(compact).subquery())).scalar()
+    only_compact = db_session.execute(select(func.count()).select_from(compact.except_(rows).subquery())).scalar()
+    return only_rows, only_compact
+
+
+scores_cli = AppGroup("scores", help="Migrate scores between the row and compact storage layouts.")
+
+
+@scores_cli.command("to-compact")
+def to_compact_command():
+    """Copy the scores table into lesson_scores/lesson_score_notes."""
+    too_large = criteria_too_large_for_compact(db.session)
+    if too_large:
+        raise click.ClickException(f"Criteria {too_large} do not fit in the compact layout (ids up to {MAX_COMPACT_CRITERIA_ID}).")
+    copy_rows_to_compact(db.session)
+    bump_all_class_versions(db.session)
+    db.session.commit()
+    only_rows, only_compact = compare_layouts(db.session)
+    click.echo(f"Copied scores to the compact layout ({only_rows + only_compact} differences).")
+    click.echo("Set SCORE_STORAGE=compact and run 'flask rollup rebuild' to switch over.")
+
+
+@scores_cli.command("to-rows")
+def to_rows_command():
+    """Rebuild the scores table from the compact layout."""
+    copy_compact_to_rows(db.session)
+    bump_all_class_versions(db.session)
+    db.session.commit()
+    click.echo("Copied compact scores back to the scores table.")
+    click.echo("Set SCORE_STORAGE=rows and run 'flask rollup rebuild' to switch over.")
+
+
+@scores_cli.command("verify")
+def verify_command():
+    """Compare the two layouts score by score."""
+    only_rows, only_compact = compare_layouts(db.session)
+    click.echo(f"Only in scores: {only_rows}. Only in lesson_scores: {only_compact}.")
+    if only_rows or only_compact:
+        sys.exit(1)
@@ -0,0 +1,526 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+# "off": score edits are written synchronously (default).
+# "memory": edits are acknowledged once queued in the worker's memory; a crash loses them.
+# "disk": edits are also appended to a per-worker journal before they are acknowledged, and
+#         journals left by a dead worker are replayed by a live worker's flush thread.
+OFF = "off"
+MEMORY = "memory"
+DISK = "disk"
+
+# Notes value of a cell whose stored notes must be kept (the edit did not send any)
+KEEP_NOTES = object()
+
+# Longest wait between two attempts at writing a lesson that keeps failing
+RETRY_MAX_DELAY = 300.0
+# Lessons given up on that stats() keeps reporting (the most recent ones)
+DEAD_LETTER_LIMIT = 100
+
+LessonKey = Tuple[int, str]  # (class_id, lesson date as 'YYYY-MM-DD')
+CellKey = Tuple[int, int]    # (student_id, criteria_id)
+
+
+class PendingLesson:
+    """
+    The coalesced, not yet written edits of one lesson: the latest (value, notes) per cell
+    and the latest subject/activity (None when not edited).
+    """
+
+    def __init__(self, now: float):
+        self.cells: Dict[CellKey, Tuple[bool, Optional[str]]] = {}
+        self.lesson_subject: Optional[str] = None
+        self.lesson_activity: Optional[str] = None
+        self.first_edit_at = now
+        self.last_edit_at = now
+        self.attempts = 0  # failed writes so far
+        self.retry_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def merge(self, cells: Dict[CellKey, Tuple[bool, Optional[str]]], lesson_subject, lesson_activity, now: float) -> int:
+        """
+        Apply newer edits; return how many of them replaced a pending edit of the same cell.
+        """
+        coalesced = sum(1 for key in cells if key in self.cells)
+        self.cells.update(cells)
+        if lesson_subject is not None:
+            self.lesson_subject = lesson_subject
+        if lesson_activity is not None:
+            self.lesson_activity = lesson_activity
+        self.last_edit_at = now
+        return coalesced
+
+    def absorb(self, newer: "PendingLesson"):
+        """
+        Put edits back in front of `newer` ones (after a failed flush).
+        """
+        self.merge(newer.cells, newer.lesson_subject, newer.lesson_activity, newer.last_edit_at)
+        self.first_edit_at = min(self.first_edit_at, newer.first_edit_at)
+
+
+def _journal_entry(class_id: int, lesson_date: str, cells, lesson_subject, lesson_activity) -> Dict:
+    entry = {
+        "class_id": class_id,
+        "lesson_date": lesson_date,
+        "cells": [
+            {"student_id": student_id, "criteria_id": criteria_id, "value": value, **({} if notes is KEEP_NOTES else {"notes": notes})}
+            for (student_id, criteria_id), (value, notes) in cells.items()
+        ],
+        "ts": time.time(),
+    }
+    if lesson_subject is not None:
+        entry["lesson_subject"] = lesson_subject
+    if lesson_activity is not None:
+        entry["lesson_activity"] = lesson_activity
+    return entry
+
+
+def _entry_cells(entry: Dict) -> Dict[CellKey, Tuple[bool, Optional[str]]]:
+    return {
+        (cell["student_id"], cell["criteria_id"]): (cell["value"], cell.get("notes", KEEP_NOTES))
+        for cell in entry["cells"]
+    }
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WriteBehindQueue:
+    """
+    Coalesces score edits per (class_id, lesson_date) and writes them in the background.
+
+    An edit is pending from `submit` until a flush commits it. A lesson is flushed once no
+    edit has arrived for `delay` seconds, or at the latest `max_delay` seconds after its
+    first pending edit; all lessons due at the same time are written in one batch. When a
+    batch fails, its lessons are written one by one, so one bad lesson does not hold back
+    the others. A lesson that fails is retried on its own after `retry_delay` seconds,
+    doubling up to RETRY_MAX_DELAY; after `max_attempts` failures it is given up on and
+    listed in the dead letters (its journal is kept as `*.dead`). The flush thread is
+    started on the first submit or journal read in each process, so it also works when
+    gunicorn forks workers from a preloaded app.
+
+    Each worker has its own queue. In memory mode, reads only see the pending edits of the
+    worker that serves them; in disk mode they see the journals of all workers.
+    """
+
+    def __init__(self, mode: str = OFF, delay: float = 2.0, max_delay: float = 10.0, journal_dir: str = "data/write_behind", fsync: bool = True,
+                 max_attempts: int = 5, retry_delay: float = 1.0, recover_interval: float = 60.0):
+        self.mode = mode
+        self.delay = delay
+        self.max_delay = max_delay
+        self.journal_dir = journal_dir
+        self.fsync = fsync
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.recover_interval = recover_interval
+        self._flush_batch: Optional[Callable[[List[Tuple[LessonKey, PendingLesson]]], None]] = None
+        self._pending: Dict[LessonKey, PendingLesson] = {}
+        self._flushing: Dict[LessonKey, PendingLesson] = {}
+        self._condition = threading.Condition()
+        self._setup_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopping = False
+        # counters
+        self.submitted_edits = 0
+        self.coalesced_edits = 0
+        self.flushes = 0
+        self.flushed_lessons = 0
+        self.flushed_cells = 0
+        self.flush_errors = 0
+        self.last_flush_seconds = None
+        self.max_pending_seconds = 0.0
+        self.total_pending_seconds = 0.0
+        self.replayed_journals = 0
+        self.dead_lettered_lessons = 0
+        self.dead_letters: List[Dict] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in (MEMORY, DISK)
+
+    def init_app(self, flush_batch: Callable[[List[Tuple[LessonKey, PendingLesson]]], None]):
+        """
+        Set the function that writes a batch of pending lessons in one transaction. It must
+        raise when the batch was not written, so the edits stay queued.
+        """
+        self._flush_batch = flush_batch
+        if self.enabled:
+            atexit.register(self.flush_all)
+
+    # --- journal -------------------------------------------------------------------
+
+    def _journal_path(self, pid: int, key: LessonKey) -> str:
+        class_id, lesson_date = key
+        return os.path.join(self.journal_dir, f"{pid}_{class_id}_{lesson_date}.jsonl")
+
+    def _journal_files(self, class_id: Optional[int] = None, lesson_date: Optional[str] = None):
+        """
+        (pid, key, path) of the journal files, optionally of one class or lesson.
+        """
+        try:
+            names = os.listdir(self.journal_dir)
+        except FileNotFoundError:
+            return []
+        files = []
+        for name in names:
+            if not name.endswith(".jsonl"):
+                continue
+            try:
+                pid, file_class_id, file_date = name[:-len(".jsonl")].split("_")
+                pid, file_class_id = int(pid), int(file_class_id)
+            except ValueError:
+                continue
+            if class_id is not None and file_class_id != class_id:
+                continue
+            if lesson_date is not None and file_date != lesson_date:
+                continue
+            files.append((pid, (file_class_id, file_date), os.path.join(self.journal_dir, name)))
+        return files
+
+    def _append_journal(self, key: LessonKey, entry: Dict):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        with open(self._journal_path(os.getpid(), key), "a", encoding="utf-8") as journal:
+            journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            journal.flush()
+            if self.fsync:
+                os.fsync(journal.fileno())
+
+    @staticmethod
+    def _read_journal(path: str) -> List[Dict]:
+        entries = []
+        try:
+            with open(path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        break  # a torn last line from a crash mid-write
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _recover_journals(self, include_own: bool = True):
+        """
+        Queue the edits of journals left behind: by workers that are gone, and (when the
+        flush thread starts) by this pid in an earlier life. Journals of other live workers
+        are theirs to flush.
+        """
+        my_pid = os.getpid()
+        for pid, key, path in self._journal_files():
+            if pid == my_pid and not include_own:
+                continue
+            if pid != my_pid and _pid_alive(pid):
+                continue
+            if pid != my_pid:
+                # Claim the journal atomically so only one worker replays it
+                claimed = f"{path}.{my_pid}.claimed"
+                try:
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    continue
+                path = claimed
+            entries = self._read_journal(path)
+            with self._condition:
+                for entry in entries:
+                    self._queue(key, _entry_cells(entry), entry.get("lesson_subject"), entry.get("lesson_activity"), journal=pid != my_pid)
+            if pid != my_pid:
+                os.remove(path)
+            self.replayed_journals += 1
+            logger.info("write-behind: replayed %d edits of lesson %s from %s", len(entries), key, path)
+
+    # --- queue ---------------------------------------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        # Requests arriving together in a fresh worker must not both set it up: the second
+        # would reset the queue and lose an edit the first one has already acknowledged
+        with self._setup_lock:
+            if self._pid != os.getpid():
+                # First use in this process (threads and their queue do not survive a fork)
+                self._pid = os.getpid()
+                self._pending = {}
+                self._flushing = {}
+                self._condition = threading.Condition()
+                if self.mode == DISK:
+                    self._recover_journals()
+            elif self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="write-behind-flusher", daemon=True)
+            self._thread.start()
+
+    def _queue(self, key: LessonKey, cells, lesson_subject, lesson_activity, journal: bool = True):
+        # caller holds self._condition
+        if journal and self.mode == DISK:
+            self._append_journal(key, _journal_entry(key[0], key[1], cells, lesson_subject, lesson_activity))
+        now = time.monotonic()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = PendingLesson(now)
+        self.submitted_edits += len(cells)
+        self.coalesced_edits += pending.merge(cells, lesson_subject, lesson_activity, now)
+        self._condition.notify()
+
+    def submit(self, class_id: int, lesson_date: str, cells: Dict[CellKey, Tuple[bool, Optional[str]]], lesson_subject: Optional[str] = None, lesson_activity: Optional[str] = None):
+        """
+        Queue validated edits of one lesson. Returns once they are as durable as the mode
+        promises (in memory, or in the journal on disk).
+        """
+        self._ensure_thread()
+        with self._condition:
+            self._queue((class_id, lesson_date), cells, lesson_subject, lesson_activity)
+
+    def discard(self, class_id: int, lesson_date: str):
+        """
+        Drop the pending edits of a lesson of this worker (e.g. the lesson was deleted).
+        """
+        key = (class_id, lesson_date)
+        with self._condition:
+            self._pending.pop(key, None)
+            if self.mode == DISK:
+                try:
+                    os.remove(self._journal_path(os.getpid(), key))
+                except FileNotFoundError:
+                    pass
+
+    def pending_for(self, class_id: int, lesson_date: str) -> Optional[PendingLesson]:
+        """
+        The edits of a lesson that are not written yet, including those being flushed
+        (and, in disk mode, those in other workers' journals), or None.
+        """
+        if not self.enabled:
+            return None
+        key = (class_id, lesson_date)
+        merged = None
+        if self.mode == DISK:
+            # A worker that only reads journals also replays those of dead workers
+            self._ensure_thread()
+            my_pid = os.getpid()
+            entries = []
+            for pid, _, path in self._journal_files(class_id, lesson_date):
+                if pid != my_pid:
+                    entries.extend(self._read_journal(path))
+            for entry in sorted(entries, key=lambda entry: entry.get("ts", 0)):
+                merged = merged or PendingLesson(time.monotonic())
+                merged.merge(_entry_cells(entry), entry.get("lesson_subject"), entry.get("lesson_activity"), merged.last_edit_at)
+        with self._condition:
+            for own in (self._flushing.get(key), self._pending.get(key)):
+                if own is not None:
+                    merged = merged or PendingLesson(own.first_edit_at)
+                    merged.merge(own.cells, own.lesson_subject, own.lesson_activity, own.last_edit_at)
+        return merged
+
+    def pending_token(self, class_id: int) -> str:
+        """
+        A string that changes whenever the pending edits of a class change, for ETags.
+        """
+        if self.mode == DISK:
+            self._ensure_thread()
+            sizes = []
+            for _, _, path in self._journal_files(class_id):
+                try:
+                    sizes.append(os.path.getsize(path))
+                except FileNotFoundError:
+                    pass
+            return f"{len(sizes)}-{sum(sizes)}"
+        with self._condition:
+            edits = [lesson for (lesson_class_id, _), lesson in list(self._pending.items()) + list(self._flushing.items()) if lesson_class_id == class_id]
+        if not edits:
+            return "0"
+        return f"{sum(len(lesson.cells) for lesson in edits)}-{max(lesson.last_edit_at for lesson in edits):.6f}"
+
+    # --- flushing ------------------------------------------------------------------
+
+    def _deadline(self, lesson: PendingLesson) -> float:
+        if lesson.retry_at is not None:
+            return lesson.retry_at
+        return min(lesson.last_edit_at + self.delay, lesson.first_edit_at + self.max_delay)
+
+    def _due(self, now: float, force: bool = False):
+        return [key for key, lesson in self._pending.items() if force or self._deadline(lesson) <= now]
+
+    def _next_wakeup(self, now: float) -> Optional[float]:
+        deadlines = [self._deadline(lesson) for lesson in self._pending.values()]
+        return max(0.0, min(deadlines) - now) if deadlines else None
+
+    def _run(self):
+        next_recovery = time.monotonic() + self.recover_interval
+        while not self._stopping:
+            with self._condition:
+                now = time.monotonic()
+                timeout = self._next_wakeup(now)
+                if self.mode == DISK:
+                    timeout = min(timeout, next_recovery - now) if timeout is not None else next_recovery - now
+                    timeout = max(0.0, timeout)
+                self._condition.wait(timeout=timeout)
+            if self.mode == DISK and time.monotonic() >= next_recovery:
+                try:
+                    self._recover_journals(include_own=False)
+                except Exception:
+                    logger.exception("write-behind: replaying the journals of dead workers failed")
+                next_recovery = time.monotonic() + self.recover_interval
+            self.flush_due()
+
+    def _write(self, group) -> Optional[Exception]:
+        try:
+            self._flush_batch(group)
+        except Exception as e:
+            return e
+        return None
+
+    def _dead_letter(self, key: LessonKey, lesson: PendingLesson):
+        # caller holds self._condition
+        class_id, lesson_date = key
+        journal = None
+        if self.mode == DISK:
+            # Keep the edits on disk for the operator, out of reach of reads and replays
+            path = self._journal_path(os.getpid(), key)
+            journal = f"{path}.{int(time.time())}.dead"
+            try:
+                os.rename(path, journal)
+            except FileNotFoundError:
+                journal = None
+        self.dead_lettered_lessons += 1
+        self.dead_letters.append({
+            "class_id": class_id,
+            "lesson_date": lesson_date,
+            "cells": len(lesson.cells),
+            "attempts": lesson.attempts,
+            "error": lesson.last_error,
+            "failed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "journal": journal,
+        })
+        del self.dead_letters[:-DEAD_LETTER_LIMIT]
+        logger.error("write-behind: giving up on lesson %s after %d attempts: %s", key, lesson.attempts, lesson.last_error)
+
+    def flush_due(self, force: bool = False):
+        """
+        Write every lesson whose coalescing window is over (every lesson with `force`). New
+        lessons go in one batch; lessons that failed before are retried one at a time.
+        """
+        with self._condition:
+            keys = self._due(time.monotonic(), force)
+            batch = [(key, self._pending.pop(key)) for key in keys]
+            self._flushing.update(batch)
+        if not batch:
+            return
+
+        started = time.monotonic()
+        groups = [[item for item in batch if item[1].attempts == 0]]
+        groups += [[item] for item in batch if item[1].attempts > 0]
+        written, failed, errors = [], [], 0
+        for group in groups:
+            if not group:
+                continue
+            error = self._write(group)
+            if error is None:
+                written.extend(group)
+                continue
+            errors += 1
+            if len(group) == 1:
+                failed.append((group[0], error))
+                continue
+            logger.warning("write-behind: flushing %d lessons failed (%s), writing them one by one", len(group), error)
+            for item in group:
+                error = self._write([item])
+                if error is None:
+                    written.append(item)
+                else:
+                    errors += 1
+                    failed.append((item, error))
+
+        finished = time.monotonic()
+        with self._condition:
+            self.flush_errors += errors
+            for (key, lesson), error in failed:
+                self._flushing.pop(key, None)
+                newer = self._pending.pop(key, None)
+                if newer is not None:
+                    lesson.absorb(newer)
+                lesson.attempts += 1
+                lesson.last_error = str(error)
+                if lesson.attempts >= self.max_attempts and not force:
+                    self._dead_letter(key, lesson)
+                    continue
+                lesson.retry_at = finished + min(self.retry_delay * 2 ** (lesson.attempts - 1), RETRY_MAX_DELAY)
+                self._pending[key] = lesson
+                logger.warning("write-behind: writing lesson %s failed (attempt %d), retrying in %.1fs: %s",
+                               key, lesson.attempts, lesson.retry_at - finished, error)
+            for key, lesson in written:
+                self._flushing.pop(key, None)
+                waited = finished - lesson.first_edit_at
+                self.total_pending_seconds += waited
+                self.max_pending_seconds = max(self.max_pending_seconds, waited)
+                self.flushed_cells += len(lesson.cells)
+                if self.mode == DISK and key not in self._pending:
+                    try:
+                        os.remove(self._journal_path(os.getpid(), key))
+                    except FileNotFoundError:
+                        pass
+            if written:
+                self.flushes += 1
+                self.flushed_lessons += len(written)
+                self.last_flush_seconds = round(finished - started, 4)
+
+    def flush_all(self):
+        """
+        Write everything that is pending now (used at exit).
+        """
+        if self._pid == os.getpid() and self._pending:
+            self.flush_due(force=True)
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._condition:
+            pending = list(self._pending.values())
+            return {
+                "mode": self.mode,
+                "delay_seconds": self.delay,
+                "max_delay_seconds": self.max_delay,
+                "fsync": self.fsync if self.mode == DISK else None,
+                "pending_lessons": len(pending),
+                "pending_cells": sum(len(lesson.cells) for lesson in pending),
+                "oldest_pending_seconds": round(max((now - lesson.first_edit_at for lesson in pending), default=0.0), 3),
+                "submitted_edits": self.submitted_edits,
+                "coalesced_edits": self.coalesced_edits,
+                "flushes": self.flushes,
+                "flushed_lessons": self.flushed_lessons,
+                "flushed_cells": self.flushed_cells,
+                "flush_errors": self.flush_errors,
+                "last_flush_seconds": self.last_flush_seconds,
+                "avg_pending_seconds": round(self.total_pending_seconds / self.flushed_lessons, 3) if self.flushed_lessons else None,
+                "max_pending_seconds": round(self.max_pending_seconds, 3),
+                "replayed_journals": self.replayed_journals,
+                "max_attempts": self.max_attempts,
+                "retrying_lessons": sum(1 for lesson in pending if lesson.attempts),
+                "dead_lettered_lessons": self.dead_lettered_lessons,
+                "dead_letters": list(self.dead_letters),
+            }
+
+
+score_queue = WriteBehindQueue(
+    mode=os.getenv("WRITE_BEHIND", OFF),
+    delay=float(os.getenv("WRITE_BEHIND_DELAY", "2")),
+    max_delay=float(os.getenv("WRITE_BEHIND_MAX_DELAY", "10")),
+    journal_dir=os.getenv("WRITE_BEHIND_JOURNAL_DIR", "data/write_behind"),
+    fsync=os.getenv("WRITE_BEHIND_FSYNC", "1") != "0",
+    max_attempts=int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "5")),
+    retry_delay=float(os.getenv("WRITE_BEHIND_RETRY_DELAY", "1")),
+    recover_interval=float(os.getenv("WRITE_BEHIND_RECOVER_INTERVAL", "60")),
+)
@@ -0,0 +1,119 @@
+import math
+import os
+import sys
+import unittest
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from attendance_matrix import AttendanceMatrix, compute_streaks_vectorized, criteria_correlations  # noqa: E402
+from performance_api import compute_streaks  # noqa: E402
+
+
+def scalar_streaks(recorded, present):
+    # performance_api.compute_streaks over each student's own lesson dates
+    results = []
+    for recorded_row, present_row in zip(recorded.tolist(), present.tolist()):
+        days = [date(2024, 9, 6) + timedelta(weeks=i) for i in range(len(recorded_row))]
+        lesson_dates = [day for day, is_recorded in zip(days, recorded_row) if is_recorded]
+        present_dates = {day for day, is_recorded, is_present in zip(days, recorded_row, present_row) if is_recorded and is_present}
+        results.append(compute_streaks(lesson_dates, present_dates))
+    return results
+
+
+def scalar_correlation(recorded, values, i, j):
+    # Pearson correlation of criteria i and j over the cells where both were recorded
+    both = recorded[:, :, i] & recorded[:, :, j]
+    x = (values[:, :, i] & recorded[:, :, i])[both].astype(float).tolist()
+    y = (values[:, :, j] & recorded[:, :, j])[both].astype(float).tolist()
+    if not x:
+        return None
+    mean_x, mean_y = sum(x) / len(x), sum(y) / len(y)
+    cov = sum((a - mean_x) * (b - mean_y) for a, b in zip(x, y))
+    var_x = sum((a - mean_x) ** 2 for a in x)
+    var_y = sum((b - mean_y) ** 2 for b in y)
+    if var_x == 0 or var_y == 0:
+        return None
+    return round(cov / math.sqrt(var_x * var_y), 4)
+
+
+def matrix(recorded, values):
+    n_students, n_lessons, n_criteria = recorded.shape
+    return AttendanceMatrix(
+        student_ids=np.arange(1, n_students + 1),
+        class_ids=np.ones(n_students, dtype=np.int64),
+        lesson_dates=[date(2024, 9, 6) + timedelta(weeks=i) for i in range(n_lessons)],
+        criteria=[{"id": i + 1, "name": f"c{i}", "label": f"C{i}"} for i in range(n_criteria)],
+        recorded=recorded,
+        values=values,
+    )
+
+
+class TestStreaks(unittest.TestCase):
+    def assert_matches_scalar(self, recorded, present):
+        recorded = np.array(recorded, dtype=bool)
+        present = np.array(present, dtype=bool)
+        longest, current = compute_streaks_vectorized(recorded, present)
+        self.assertEqual(list(zip(longest.tolist(), current.tolist())), scalar_streaks(recorded, present))
+
+    def test_all_present_and_all_absent(self):
+        self.assert_matches_scalar([[1, 1, 1, 1], [1, 1, 1, 1]], [[1, 1, 1, 1], [0, 0, 0, 0]])
+
+    def test_unrecorded_lessons_at_the_ends_and_between(self):
+        self.assert_matches_scalar(
+            [[0, 1, 1, 1, 0], [0, 0, 1, 1, 1], [1, 1, 0, 1, 1], [0, 0, 0, 0, 0]],
+            # a present value without a record does not count
+            [[1, 1, 1, 1, 1], [0, 0, 1, 0, 1], [1, 1, 0, 1, 0], [1, 1, 1, 1, 1]],
+        )
+
+    def test_random_rows(self):
+        rng = np.random.default_rng(6)
+        recorded = rng.random((50, 30)) < 0.8
+        present = rng.random((50, 30)) < 0.7
+        self.assert_matches_scalar(recorded, present)
+
+    def test_empty_shapes(self):
+        for shape in ((0, 5), (3, 0)):
+            longest, current = compute_streaks_vectorized(np.zeros(shape, dtype=bool), np.zeros(shape, dtype=bool))
+            self.assertEqual(longest.tolist(), [0] * shape[0])
+            self.assertEqual(current.tolist(), [0] * shape[0])
+
+
+class TestCorrelations(unittest.TestCase):
+    def assert_matches_scalar(self, recorded, values):
+        correlations = criteria_correlations(matrix(recorded, values))
+        n_criteria = recorded.shape[2]
+        for i in range(n_criteria):
+            for j in range(n_criteria):
+                expected = scalar_correlation(recorded, values, i, j)
+                actual = correlations[f"c{i}"][f"c{j}"]
+                if expected is None:
+                    self.assertIsNone(actual, (i, j))
+                else:
+                    self.assertAlmostEqual(actual, expected, places=4, msg=(i, j))
+
+    def test_random_matrix(self):
+        rng = np.random.default_rng(6)
+        recorded = rng.random((20, 15, 4)) < 0.85
+        values = rng.random((20, 15, 4)) < 0.6
+        self.assert_matches_scalar(recorded, values)
+
+    def test_constant_and_unrecorded_criteria_are_undefined(self):
+        rng = np.random.default_rng(7)
+        recorded = np.ones((6, 8, 4), dtype=bool)
+        values = rng.random((6, 8, 4)) < 0.5
+        values[:, :, 1] = True    # always true: phi undefined
+        values[:, :, 2] = False   # always false: phi undefined
+        recorded[:, :, 3] = False  # never recorded
+        self.assert_matches_scalar(recorded, values)
+        correlations = criteria_correlations(matrix(recorded, values))
+        self.assertIsNone(correlations["c0"]["c1"])
+        self.assertIsNone(correlations["c2"]["c0"])
+        self.assertIsNone(correlations["c3"]["c3"])
+        self.assertEqual(correlations["c0"]["c0"], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import sys
+import unittest
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from attendance_streaks import _advance  # noqa: E402
+from models import StudentStreak  # noqa: E402
+
+
+def expected_streak(history):
+    """
+    Streak state of a [(lesson_date, present)] history, counted from scratch.
+    """
+    present_run = absence_run = longest = 0
+    for _, present in sorted(history):
+        present_run = present_run + 1 if present else 0
+        absence_run = 0 if present else absence_run + 1
+        longest = max(longest, present_run)
+    return {
+        "current_present_streak": present_run,
+        "current_absence_streak": absence_run,
+        "longest_streak": longest,
+        "last_lesson_date": max(history)[0] if history else None,
+    }
+
+
+def streak_state(streak):
+    return {
+        "current_present_streak": streak.current_present_streak,
+        "current_absence_streak": streak.current_absence_streak,
+        "longest_streak": streak.longest_streak,
+        "last_lesson_date": streak.last_lesson_date,
+    }
+
+
+class TestAdvance(unittest.TestCase):
+    def test_advance_counts_runs(self):
+        streak = StudentStreak(student_id=1)
+        history = [(date(2024, 9, 6) + timedelta(weeks=week), present) for week, present in enumerate([True, True, True, False, False, True])]
+        for lesson_date, present in history:
+            _advance(streak, lesson_date, present)
+        self.assertEqual(streak_state(streak), {
+            "current_present_streak": 1,
+            "current_absence_streak": 0,
+            "longest_streak": 3,
+            "last_lesson_date": date(2024, 10, 11),
+        })
+        self.assertTrue(streak.last_lesson_present)
+
+    def test_first_lesson_absent(self):
+        streak = StudentStreak(student_id=1, current_present_streak=0, current_absence_streak=0, longest_streak=0)
+        _advance(streak, date(2024, 9, 6), False)
+        self.assertEqual(streak.current_absence_streak, 1)
+        self.assertEqual(streak.current_present_streak, 0)
+        self.assertEqual(streak.longest_streak, 0)
+
+
+@unittest.skipUnless(os.getenv("TEST_DATABASE_URL"), "TEST_DATABASE_URL is not set")
+class TestStreakUpdates(unittest.TestCase):
+    """
+    Incremental updates and rebuilds against the seeded database; every test rolls back.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ["DATABASE_URL"] = os.environ["TEST_DATABASE_URL"]
+        from app import app, data_manager
+        from models import db
+        from performance_api import get_attendance_criteria_id
+        cls.app = app
+        cls.data_manager = data_manager
+        cls.db = db
+        cls.get_attendance_criteria_id = staticmethod(get_attendance_criteria_id)
+
+    def setUp(self):
+        self.context = self.app.test_request_context()
+        self.context.push()
+        self.attendance_criteria_id = self.get_attendance_criteria_id()
+        student = self.data_manager.get_all_students_with_details()[0]
+        self.student_id = student['id']
+        self.class_id = student['class_id']
+
+    def tearDown(self):
+        self.db.session.rollback()
+        self.context.pop()
+
+    def history(self):
+        from score_storage import score_rows
+        scores = score_rows()
+        attendance = {}
+        for lesson_date, value in self.db.session.query(scores.c.lesson_date, scores.c.value).filter(
+            scores.c.student_id == self.student_id, scores.c.criteria_id == self.attendance_criteria_id
+        ):
+            attendance[lesson_date] = attendance.get(lesson_date, False) or bool(value)
+        return list(attendance.items())
+
+    def streak(self):
+        return streak_state(self.db.session.get(StudentStreak, self.student_id, populate_existing=True))
+
+    def write(self, lesson_date, present):
+        self.data_manager.write_lesson_scores(self.class_id, lesson_date, {(self.student_id, self.attendance_criteria_id): (present, None)}, self.attendance_criteria_id)
+        self.db.session.flush()
+
+    def test_next_lesson_is_applied_incrementally(self):
+        from attendance_streaks import rebuild_streaks
+        rebuild_streaks(self.db.session, self.attendance_criteria_id, [self.student_id])
+        self.write(date(2030, 1, 4), False)
+        self.write(date(2030, 1, 11), False)
+        self.assertEqual(self.streak(), expected_streak(self.history()))
+
+    def test_out_of_order_lesson_rebuilds_the_streak(self):
+        from attendance_streaks import rebuild_streaks
+        rebuild_streaks(self.db.session, self.attendance_criteria_id, [self.student_id])
+        history = self.history()
+        if not history:
+            self.skipTest("no attendance")
+        first_date, first_present = min(history)
+        self.write(first_date, not first_present)
+        self.assertEqual(self.streak(), expected_streak(self.history()))
+        # a lesson between two stored ones
+        self.write(first_date + timedelta(days=1), True)
+        self.assertEqual(self.streak(), expected_streak(self.history()))
+
+    def test_rebuild_after_deleting_a_lesson(self):
+        from attendance_streaks import rebuild_streaks
+        from score_storage import delete_lesson_scores
+        history = self.history()
+        if len(history) < 2:
+            self.skipTest("not enough attendance")
+        # as delete_lesson does, without committing
+        deleted_date = sorted(history)[len(history) // 2][0]
+        delete_lesson_scores(self.db.session, [self.student_id], deleted_date)
+        rebuild_streaks(self.db.session, self.attendance_criteria_id, [self.student_id])
+        self.db.session.flush()
+        self.assertEqual(self.streak(), expected_streak([item for item in history if item[0] != deleted_date]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from caching import LRUCache  # noqa: E402
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_missing_rows_are_not_cached(self):
+        cache = LRUCache("test")
+        rows = {}
+        self.assertIsNone(cache.get_or_load(("class", 1), lambda: rows.get(1)))
+        rows[1] = {"id": 1, "name": "C1"}
+        self.assertEqual(cache.get_or_load(("class", 1), lambda: rows.get(1)), rows[1])
+
+    def test_loaded_values_are_cached(self):
+        cache = LRUCache("test")
+        self.assertEqual(cache.get_or_load("key", lambda: 1), 1)
+        self.assertEqual(cache.get_or_load("key", lambda: 2), 1)
+        self.assertEqual(cache.hits, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
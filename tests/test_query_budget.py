@@ -0,0 +1,108 @@
+import os
+import sys
+import unittest
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from query_tracker import max_queries, track_queries  # noqa: E402
+
+
+class TestQueryTracker(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+
+    def test_counts_statements_in_block(self):
+        with self.engine.connect() as conn:
+            conn.execute(text("select 1"))
+            with track_queries() as stats:
+                conn.execute(text("select 1"))
+                conn.execute(text("select 2"))
+            conn.execute(text("select 3"))
+        self.assertEqual(stats.count, 2)
+
+    def test_flags_repeated_statement(self):
+        with self.engine.connect() as conn, track_queries() as stats:
+            for i in range(6):
+                conn.execute(text("select :i"), {"i": i})
+            conn.execute(text("select 0"))
+        self.assertEqual(stats.repeated(threshold=5), [("select ?", 6)])
+
+    def test_max_queries_fails_over_budget(self):
+        with self.engine.connect() as conn:
+            with max_queries(2):
+                conn.execute(text("select 1"))
+                conn.execute(text("select 2"))
+            with self.assertRaises(AssertionError) as raised:
+                with max_queries(1):
+                    conn.execute(text("select 1"))
+                    conn.execute(text("select 2"))
+        self.assertIn("2 queries run, at most 1 expected", str(raised.exception))
+
+
+@unittest.skipUnless(os.getenv("TEST_DATABASE_URL"), "TEST_DATABASE_URL is not set")
+class TestSlowQueryPlans(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(os.environ["TEST_DATABASE_URL"])
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_failing_explain_keeps_the_transaction_usable(self):
+        from query_tracker import _explain
+        with self.engine.connect() as conn:
+            conn.execute(text("select 1"))
+            cursor = conn.connection.dbapi_connection.cursor()
+            self.assertIn("no plan", _explain(cursor, "SELECT * FROM no_such_table", {}))
+            self.assertIn("no plan", _explain(cursor, "LOCK TABLE no_such_table", {}))
+            self.assertIn("Result", _explain(cursor, "SELECT 1", {}))
+            self.assertEqual(conn.execute(text("select 2")).scalar(), 2)
+
+
+@unittest.skipUnless(os.getenv("TEST_DATABASE_URL"), "TEST_DATABASE_URL is not set")
+class TestQueryBudgets(unittest.TestCase):
+    """
+    Query budgets of hot paths, against a seeded database.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ["DATABASE_URL"] = os.environ["TEST_DATABASE_URL"]
+        from app import app, data_manager
+        cls.app = app
+        cls.data_manager = data_manager
+
+    def setUp(self):
+        # Inside a request, as the views run (no per-transaction timeout statement)
+        self.context = self.app.test_request_context()
+        self.context.push()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def test_teachers_with_classes_is_one_query(self):
+        with max_queries(1):
+            self.data_manager.get_teachers_with_assigned_classes()
+
+    def test_lesson_sheet_does_not_query_per_student(self):
+        class_id = self.data_manager.load_classes()[0]['id']
+        with track_queries() as stats:
+            self.data_manager.load_scores_by_date('2024-09-06', class_id, include_adjacent_dates=True)
+        self.assertEqual(stats.repeated(threshold=2), [])
+        self.assertLessEqual(stats.count, 6)
+
+    def test_monthly_reports_do_not_query_per_student(self):
+        from score_archive import archive_catalog
+        class_id = self.data_manager.load_classes()[0]['id']
+        # Criteria and the archive catalog are cached reference data; the first call fills the calendar cache
+        self.data_manager.load_score_labels()
+        archive_catalog(self.data_manager.db_session)
+        self.data_manager.get_monthly_reports(9, 2024, class_id=class_id)
+        # the grouped scores and the calendar version
+        with max_queries(2):
+            reports = self.data_manager.get_monthly_reports(9, 2024, class_id=class_id)
+        self.assertTrue(reports)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import json
+import os
+import re
+import sys
+import unittest
+from datetime import date
+
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Tables that grow with the school's history or size; reading one of them whole on a hot
+# path means an index is missing
+LARGE_TABLES = {
+    "scores", "lesson_scores", "lesson_score_notes", "lesson_info", "students",
+    "attendance_rollup", "student_streaks",
+}
+
+
+def full_scans(plan, found=None):
+    """
+    (node type, table) of the plan nodes that read a large table without an index
+    condition: sequential scans, and index scans that walk the whole index.
+    """
+    found = [] if found is None else found
+    # Partitions (scores_y2024) count as their table
+    table = re.sub(r"_y\d{4}$", "", plan.get("Relation Name", ""))
+    if table in LARGE_TABLES:
+        if plan["Node Type"] == "Seq Scan":
+            found.append((plan["Node Type"], table))
+        elif plan["Node Type"] in ("Index Scan", "Index Only Scan") and "Index Cond" not in plan:
+            found.append((plan["Node Type"], table))
+    for child in plan.get("Plans", []):
+        full_scans(child, found)
+    return found
+
+
+def relations(plan, found=None):
+    found = set() if found is None else found
+    if "Relation Name" in plan:
+        found.add(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        relations(child, found)
+    return found
+
+
+@unittest.skipUnless(os.getenv("TEST_DATABASE_URL"), "TEST_DATABASE_URL is not set")
+class TestQueryPlans(unittest.TestCase):
+    """
+    EXPLAIN every statement of the DataManager and performance API hot paths against a
+    seeded, fully migrated database ('flask schema upgrade'). Sequential scans, hash and
+    merge joins are disabled while planning, so a table that is still read whole has no
+    index to use instead, however small the test data is.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ["DATABASE_URL"] = os.environ["TEST_DATABASE_URL"]
+        from app import app, data_manager
+        from models import db
+        import performance_api
+        cls.app = app
+        cls.db = db
+        cls.data_manager = data_manager
+        cls.performance_api = performance_api
+
+    def setUp(self):
+        self.context = self.app.test_request_context()
+        self.context.push()
+        classes = self.data_manager.load_classes()
+        self.class_id = classes[0]['id']
+        students = self.data_manager.get_students_by_class(self.class_id)
+        self.student_id = students[0]['id']
+        lessons = self.data_manager.get_lessons_in_range(self.class_id, None, None)
+        self.lesson_date = date.fromisoformat(lessons[len(lessons) // 2]['date'])
+        self.start = date(self.lesson_date.year, self.lesson_date.month, 1)
+        self.end = self.lesson_date
+
+    def tearDown(self):
+        self.context.pop()
+
+    def statements_of(self, function):
+        statements = []
+
+        def collect(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(("SELECT", "WITH")) and not executemany:
+                statements.append((statement, parameters))
+
+        engine = self.db.engine
+        event.listen(engine, "before_cursor_execute", collect)
+        try:
+            function()
+        finally:
+            event.remove(engine, "before_cursor_execute", collect)
+        return statements
+
+    def plans_of(self, function):
+        """
+        (statement, plan) of the SELECTs `function` runs, planned without sequential scans,
+        hash and merge joins.
+        """
+        statements = self.statements_of(function)
+        self.assertTrue(statements, "no statements were run")
+        plans = []
+        with self.db.engine.connect() as conn:
+            # Hash and merge joins may read a whole index; without them the planner looks the
+            # joined rows up by key wherever an index allows it
+            for setting in ("enable_seqscan", "enable_hashjoin", "enable_mergejoin"):
+                conn.exec_driver_sql(f"SET LOCAL {setting} = off")
+            for statement, parameters in statements:
+                plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                plans.append((" ".join(statement.split()), plan[0]["Plan"]))
+            conn.rollback()
+        return plans
+
+    def assert_no_full_scans(self, function):
+        problems = [f"{scans}: {statement}" for statement, plan in self.plans_of(function) if (scans := full_scans(plan))]
+        if problems:
+            self.fail("Large tables read without an index:\n" + "\n".join(problems))
+
+    def test_lesson_sheet(self):
+        def load():
+            self.data_manager.load_scores_by_date(self.lesson_date.isoformat(), self.class_id, include_adjacent_dates=True)
+        self.assert_no_full_scans(load)
+
+    def test_roster(self):
+        self.assert_no_full_scans(lambda: self.data_manager.get_students_by_class(self.class_id))
+        self.assert_no_full_scans(lambda: self.data_manager.get_class_roster_ids(self.class_id))
+
+    def test_student_month(self):
+        self.data_manager.load_score_labels()
+        self.assert_no_full_scans(lambda: self.data_manager.get_scores_by_student_and_month(self.student_id, self.lesson_date.month, self.lesson_date.year))
+
+    def test_monthly_reports(self):
+        self.assert_no_full_scans(lambda: self.data_manager.get_monthly_report(self.student_id, self.class_id, self.lesson_date.month, self.lesson_date.year))
+        self.assert_no_full_scans(lambda: self.data_manager.get_monthly_reports(self.lesson_date.month, self.lesson_date.year, class_id=self.class_id))
+
+    def test_lesson_list(self):
+        self.assert_no_full_scans(lambda: self.data_manager.get_lessons_in_range(self.class_id, self.start, self.end))
+
+    def test_student_performance(self):
+        self.assert_no_full_scans(lambda: self.performance_api.compute_student_performance(self.student_id, self.class_id, self.start, self.end))
+
+    def test_class_student_performances(self):
+        self.assert_no_full_scans(lambda: self.performance_api.compute_class_student_performances(self.class_id, self.start, self.end))
+        self.assert_no_full_scans(lambda: self.performance_api.compute_class_student_performances_vectorized(self.class_id, self.start, self.end))
+
+    def test_class_performance(self):
+        self.assert_no_full_scans(lambda: self.performance_api.compute_class_performance(self.class_id, self.start, self.end))
+
+    def test_absence_alerts(self):
+        from attendance_streaks import get_absence_alerts
+        self.assert_no_full_scans(lambda: get_absence_alerts(self.db.session, 3))
+
+    def test_month_reads_one_partition(self):
+        from models import get_schema
+        from partitioning import is_partitioned
+        with self.db.engine.connect() as conn:
+            partitioned = is_partitioned(conn, get_schema(), "scores")
+        if not partitioned:
+            self.skipTest("scores is not partitioned ('flask partitions enable')")
+        self.data_manager.load_score_labels()
+        plans = self.plans_of(lambda: self.data_manager.get_scores_by_student_and_month(self.student_id, self.lesson_date.month, self.lesson_date.year))
+        for statement, plan in plans:
+            partitions = {name for name in relations(plan) if re.fullmatch(r"scores_y\d{4}", name)}
+            self.assertEqual(len(partitions), 1, f"{sorted(partitions)}: {statement}")
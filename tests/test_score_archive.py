@@ -0,0 +1,107 @@
+import os
+import sys
+import tempfile
+import unittest
+from datetime import date
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from score_archive import ArchivedYear, ScoreColumns  # noqa: E402
+
+
+def archived_year(student_id, lesson_day, criteria_id, value):
+    empty = np.zeros(0, dtype=np.int32)
+    return ArchivedYear(
+        2024, np.array(student_id), np.array(lesson_day), np.array(criteria_id), np.array(value, dtype=bool),
+        empty, np.array([], dtype=str), empty, empty, np.array([], dtype=str), np.array([], dtype=str),
+    )
+
+
+class TestArchivedYear(unittest.TestCase):
+    def test_positions_are_the_students_slices(self):
+        year = archived_year([1, 1, 3, 3, 3, 7], [10, 11, 10, 11, 12, 10], [1] * 6, [True] * 6)
+        self.assertEqual(year.positions(np.array([1, 7])).tolist(), [0, 1, 5])
+        self.assertEqual(year.positions(np.array([2, 8])).tolist(), [])
+
+    def test_score_columns_round_trip(self):
+        rows = [(1, 2, date(2024, 9, 6), 1, True), (4, 2, date(2024, 9, 13), 3, False)]
+        columns = ScoreColumns.concatenate([ScoreColumns.from_rows(rows), ScoreColumns.from_rows([])])
+        self.assertEqual(len(columns), 2)
+        self.assertEqual(columns.rows(), rows)
+
+
+@unittest.skipUnless(os.getenv("TEST_DATABASE_URL"), "TEST_DATABASE_URL is not set")
+class TestScoreArchiveFiles(unittest.TestCase):
+    """
+    Export a school year of the seeded database to a temporary archive directory and read it back.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ["DATABASE_URL"] = os.environ["TEST_DATABASE_URL"]
+        from app import app
+        from models import db
+        import score_archive
+        cls.app = app
+        cls.db = db
+        cls.score_archive = score_archive
+
+    def setUp(self):
+        self.context = self.app.test_request_context()
+        self.context.push()
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive_dir = self.score_archive.ARCHIVE_DIR
+        self.score_archive.ARCHIVE_DIR = self.directory.name
+
+    def tearDown(self):
+        self.score_archive.ARCHIVE_DIR = self.archive_dir
+        self.directory.cleanup()
+        self.context.pop()
+
+    def test_export_round_trip(self):
+        from school_calendar import school_year_bounds, school_year_of
+        from score_storage import score_rows
+        scores = score_rows()
+        first = self.db.session.query(self.db.func.min(scores.c.lesson_date)).scalar()
+        if first is None:
+            self.skipTest("no scores")
+        school_year = school_year_of(first)
+        first_day, last_day = school_year_bounds(school_year)
+        expected = sorted(
+            (student_id, lesson_date.toordinal(), criteria_id, value, notes or "")
+            for student_id, lesson_date, criteria_id, value, notes in self.db.session.query(
+                scores.c.student_id, scores.c.lesson_date, scores.c.criteria_id, scores.c.value, scores.c.notes
+            ).filter(scores.c.lesson_date >= first_day, scores.c.lesson_date <= last_day)
+        )
+
+        file_name, score_count, _, sha256, _ = self.score_archive.export_school_year(self.db.session, school_year)
+        year = self.score_archive.read_archive(self.score_archive.archive_path(file_name), school_year, sha256)
+
+        notes = [""] * len(year.student_id)
+        for position, note in zip(year.note_index.tolist(), year.note_text.tolist()):
+            notes[position] = note
+        archived = list(zip(year.student_id.tolist(), year.lesson_day.tolist(), year.criteria_id.tolist(), year.value.tolist(), notes))
+        self.assertEqual(score_count, len(expected))
+        self.assertEqual(archived, expected)
+
+    def test_in_place_update_changes_the_content_digest(self):
+        from models import LessonInfo
+        from school_calendar import school_year_of
+        lesson = self.db.session.query(LessonInfo).order_by(LessonInfo.lesson_date).first()
+        if lesson is None:
+            self.skipTest("no lessons")
+        school_year = school_year_of(lesson.lesson_date)
+        before = self.score_archive.content_digest(self.score_archive.read_school_year(self.db.session, school_year))
+        lesson.lesson_subject = (lesson.lesson_subject or "") + " (edited)"
+        self.db.session.flush()
+        after = self.score_archive.content_digest(self.score_archive.read_school_year(self.db.session, school_year))
+        self.db.session.rollback()
+        self.assertNotEqual(before, after)
+
+    def test_checksum_mismatch_is_refused(self):
+        from school_calendar import school_year_of
+        file_name, _, _, _, _ = self.score_archive.export_school_year(self.db.session, school_year_of(date.today()) - 1)
+        with self.assertRaises(ValueError):
+            self.score_archive.read_archive(self.score_archive.archive_path(file_name), 0, "0" * 64)
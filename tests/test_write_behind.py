@@ -0,0 +1,102 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from write_behind import WriteBehindQueue, MEMORY, DISK  # noqa: E402
+
+
+class FailingWriter:
+    """Writes batches unless they contain a lesson of a class in `bad_classes`."""
+
+    def __init__(self, bad_classes):
+        self.bad_classes = set(bad_classes)
+        self.written = []
+
+    def __call__(self, batch):
+        if any(class_id in self.bad_classes for (class_id, _), _ in batch):
+            raise ValueError("Database error: no partition for the lesson date")
+        self.written.extend(key for key, _ in batch)
+
+
+class TestWriteBehindRetries(unittest.TestCase):
+    def make_queue(self, writer, **kwargs):
+        queue = WriteBehindQueue(mode=MEMORY, delay=0, max_delay=0, **kwargs)
+        queue._flush_batch = writer  # init_app would also flush at exit
+        queue._pid = os.getpid()
+        return queue
+
+    @staticmethod
+    def queue_edit(queue, class_id):
+        # what submit does, without starting the flush thread
+        with queue._condition:
+            queue._queue((class_id, "2025-10-03"), {(class_id * 10, 1): (True, None)}, None, None)
+
+    def test_bad_lesson_does_not_block_its_batch(self):
+        writer = FailingWriter(bad_classes=[2])
+        queue = self.make_queue(writer)
+        self.queue_edit(queue, 1)
+        self.queue_edit(queue, 2)
+        queue.flush_due()
+        self.assertEqual(writer.written, [(1, "2025-10-03")])
+        self.assertEqual(list(queue._pending), [(2, "2025-10-03")])
+
+    def test_failed_lesson_backs_off(self):
+        queue = self.make_queue(FailingWriter(bad_classes=[2]), retry_delay=5)
+        self.queue_edit(queue, 2)
+        queue.flush_due()
+        self.assertEqual(queue._pending[(2, "2025-10-03")].attempts, 1)
+        self.assertGreater(queue._next_wakeup(time.monotonic()), 4)
+        queue.flush_due()  # not due yet
+        self.assertEqual(queue._pending[(2, "2025-10-03")].attempts, 1)
+
+    def test_lesson_is_dead_lettered_after_max_attempts(self):
+        queue = self.make_queue(FailingWriter(bad_classes=[2]), retry_delay=0, max_attempts=3)
+        self.queue_edit(queue, 2)
+        for _ in range(3):
+            queue.flush_due()
+        self.assertEqual(queue._pending, {})
+        stats = queue.stats()
+        self.assertEqual(stats["dead_lettered_lessons"], 1)
+        self.assertEqual(stats["dead_letters"][0]["attempts"], 3)
+        self.assertIn("no partition", stats["dead_letters"][0]["error"])
+
+    def test_dead_lettered_journal_is_kept_aside(self):
+        with tempfile.TemporaryDirectory() as journal_dir:
+            queue = WriteBehindQueue(mode=DISK, delay=0, max_delay=0, journal_dir=journal_dir, fsync=False, retry_delay=0, max_attempts=1)
+            queue._flush_batch = FailingWriter(bad_classes=[2])
+            queue._pid = os.getpid()
+            self.queue_edit(queue, 2)
+            queue.flush_due()
+            self.assertEqual(queue._journal_files(), [])
+            self.assertTrue(queue.dead_letters[0]["journal"].endswith(".dead"))
+            self.assertTrue(os.path.exists(queue.dead_letters[0]["journal"]))
+
+
+class TestWriteBehindSetup(unittest.TestCase):
+    def test_concurrent_first_submits_keep_every_edit(self):
+        queue = WriteBehindQueue(mode=MEMORY, delay=60, max_delay=60)
+        queue._flush_batch = lambda batch: None
+        start = threading.Barrier(16)
+
+        def submit(student_id):
+            start.wait()
+            queue.submit(1, "2025-10-03", {(student_id, 1): (True, None)})
+
+        threads = [threading.Thread(target=submit, args=(student_id,)) for student_id in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(queue._pending[(1, "2025-10-03")].cells), 16)
+        queue._stopping = True
+        with queue._condition:
+            queue._condition.notify()
+
+
+if __name__ == '__main__':
+    unittest.main()